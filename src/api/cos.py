@@ -1,14 +1,20 @@
 # -*- coding=utf-8
+import math
 import os
-from typing import Generator
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Generator
 from qcloud_cos import CosConfig
 from qcloud_cos import CosS3Client
+from qcloud_cos.cos_exception import CosServiceError
 import sys
 import logging
 
 if __name__ == "__main__":
     sys.path.append(os.getcwd() + "/src")
-from api.models import CosFileItem
+from api.models import CosFileItem, CosObject, FileStream
+from cache import DiskCache, TTLCache
 from config import get_settings
 
 settings = get_settings()
@@ -24,45 +30,196 @@ config = CosConfig(
 client = CosS3Client(config)
 
 
-def upload_file(file_path: str, cos_path: str):
-    """上传文件
+# 本地磁盘缓存，对象按内容命名、不会被修改，所以不需要失效
+disk_cache = (
+    DiskCache(
+        settings.cos_cache_dir or os.path.join(settings.temp_dir, "cos_cache"),
+        settings.cos_cache_bytes,
+    )
+    if settings.cos_cache_bytes > 0
+    else None
+)
+
+# 下载地址的预签名结果，在地址过期前提前失效，保证返回给客户端的地址至少还能用 margin 秒
+presign_cache = TTLCache(
+    maxsize=4096,
+    ttl=max(settings.cos_presign_expires - settings.cos_presign_margin, 0),
+)
+
+MB = 1024 * 1024
+# COS 单次分片上传最多 10000 片
+MAX_PARTS = 10000
+
+
+def part_size_for(size: int) -> int:
+    """根据文件大小计算分片大小（整 MB），保证分片数不超过上限"""
+    part_size = max(settings.cos_part_size, math.ceil(size / MAX_PARTS))
+    return math.ceil(part_size / MB) * MB
+
+
+def upload_fileobj(
+    fp: BinaryIO, cos_path: str, size: int, content_type: str | None = None
+):
+    """从文件对象直接上传，不写临时文件
+
+    小文件一次 PUT；大文件分片上传，最多同时有 cos_upload_threads 个分片在内存中
 
     Args:
-        file_path (str): 本地文件地址
+        fp (BinaryIO): 可读的文件对象，从当前位置读到结尾
         cos_path (str): 对象存储文件地址
+        size (int): 文件大小，用于选择上传方式和分片大小
+        content_type (str | None, optional): Content-Type
+    """
+    kwargs = {"ContentType": content_type} if content_type else {}
+    if size <= settings.cos_multipart_threshold:
+        return client.put_object(
+            Bucket=settings.cos_bucket, Body=fp.read(), Key=cos_path, **kwargs
+        )
+
+    part_size = part_size_for(size)
+    upload_id = client.create_multipart_upload(
+        Bucket=settings.cos_bucket, Key=cos_path, **kwargs
+    )["UploadId"]
+
+    def upload_part(number: int, data: bytes):
+        res = client.upload_part(
+            Bucket=settings.cos_bucket,
+            Key=cos_path,
+            Body=data,
+            PartNumber=number,
+            UploadId=upload_id,
+        )
+        return {"PartNumber": number, "ETag": res["ETag"]}
+
+    threads = max(1, settings.cos_upload_threads)
+    parts = []
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            pending = []
+            number = 1
+            while data := fp.read(part_size):
+                pending.append(pool.submit(upload_part, number, data))
+                number += 1
+                # 控制在途分片数，避免整个文件被读入内存
+                if len(pending) >= threads:
+                    parts.append(pending.pop(0).result())
+            parts.extend(f.result() for f in pending)
+        return client.complete_multipart_upload(
+            Bucket=settings.cos_bucket,
+            Key=cos_path,
+            UploadId=upload_id,
+            MultipartUpload={"Part": parts},
+        )
+    except Exception:
+        client.abort_multipart_upload(
+            Bucket=settings.cos_bucket, Key=cos_path, UploadId=upload_id
+        )
+        raise
+
+
+def _iter_body(body, chunk_size: int) -> Generator[bytes, None, None]:
+    try:
+        yield from body.get_stream(chunk_size)
+    finally:
+        # 客户端提前断开时也要关闭到 COS 的连接
+        body.get_raw_stream().close()
+
+
+def get_file_stream(
+    cos_path: str, byte_range: str | None = None, chunk_size: int | None = None
+) -> FileStream:
+    """流式下载文件，内存占用只与块大小有关，与文件大小无关
+
+    Args:
+        cos_path (str): 对象存储地址
+        byte_range (str | None, optional): Range 请求头，例如 "bytes=0-1023"，原样转发给 COS
+        chunk_size (int | None, optional): 每次读取的字节数，默认使用 settings.cos_chunk_size
+
+    Raises:
+        CosServiceError: 文件不存在（404）或范围无法满足（416）等
 
     Returns:
-        dict: cos返回的原始结果
+        FileStream: 文件流和响应头信息
     """
-    res = client.upload_file(
-        Bucket=settings.cos_bucket,
-        LocalFilePath=file_path,
-        Key=cos_path,
-        PartSize=1,
-        MAXThread=10,
-        EnableMD5=False,
+    kwargs = {"Range": byte_range} if byte_range else {}
+    response = client.get_object(Bucket=settings.cos_bucket, Key=cos_path, **kwargs)
+    body = response["Body"]
+    return FileStream(
+        body=_iter_body(body, chunk_size or settings.cos_chunk_size),
+        content_length=len(body) if "Content-Length" in response else None,
+        content_type=response.get("Content-Type"),
+        etag=response.get("ETag"),
+        last_modified=response.get("Last-Modified"),
+        content_range=response.get("Content-Range"),
     )
-    return res
 
 
-def get_file(cos_path: str, file_path: str | None = None):
-    """下载文件
+def get_cached_file(cos_path: str) -> str | None:
+    """获取文件的本地缓存路径，未缓存时先下载到缓存目录
 
-    Args:
-        cos_path (str): 对象存储地址
-        file_path (str | None, optional): 文件保存地址，不设置返回文件流，否则返回True. Defaults to None.
+    只能用于内容不可变的对象
 
     Returns:
-        bool | bytes: 返回状态或文件流
+        str | None: 本地文件路径，未开启磁盘缓存时返回 None
+    """
+    if disk_cache is None:
+        return None
+
+    def fill(fp):
+        response = client.get_object(Bucket=settings.cos_bucket, Key=cos_path)
+        for chunk in _iter_body(response["Body"], settings.cos_chunk_size):
+            fp.write(chunk)
+
+    return disk_cache.get_or_fill(cos_path, fill)
+
+
+def get_download_url(cos_path: str) -> str:
+    """预签名下载地址（带缓存），有效期为 settings.cos_presign_expires"""
+    url = presign_cache.get(cos_path)
+    if url is None:
+        url = client.get_presigned_download_url(
+            Bucket=settings.cos_bucket,
+            Key=cos_path,
+            Expired=settings.cos_presign_expires,
+        )
+        presign_cache.set(cos_path, url)
+    return url
+
+
+def get_upload_url(cos_path: str, content_type: str | None = None) -> str:
+    """预签名上传地址，客户端用 PUT 直接上传到 COS
+
+    Args:
+        cos_path (str): 对象存储文件地址
+        content_type (str | None, optional): 签名包含的 Content-Type，上传时必须一致
     """
-    response = client.get_object(Bucket=settings.cos_bucket, Key=cos_path)
-    if file_path:
-        response["Body"].get_stream_to_file(file_path)
-        return True
-    else:
-        fp = response['Body'].get_raw_stream()
-        fpb: bytes = fp.read()
-        return fpb
+    return client.get_presigned_url(
+        Bucket=settings.cos_bucket,
+        Key=cos_path,
+        Method="PUT",
+        Expired=settings.cos_presign_expires,
+        Headers={"Content-Type": content_type} if content_type else {},
+    )
+
+
+def head_file(cos_path: str) -> dict | None:
+    """查询文件元信息，文件不存在时返回 None"""
+    try:
+        return client.head_object(Bucket=settings.cos_bucket, Key=cos_path)
+    except CosServiceError as e:
+        if e.get_status_code() == 404:
+            return None
+        raise
+
+
+def delete_file(cos_path: str):
+    client.delete_object(Bucket=settings.cos_bucket, Key=cos_path)
+
+
+def get_file_size(cos_path: str) -> int:
+    """查询文件大小（HEAD 请求，不下载内容）"""
+    response = client.head_object(Bucket=settings.cos_bucket, Key=cos_path)
+    return int(response["Content-Length"])
 
 
 def get_file_list(cos_path: str) -> list[CosFileItem]:
@@ -83,23 +240,105 @@ def get_file_list(cos_path: str) -> list[CosFileItem]:
     return lst
 
 
-def get_file_list_v2(cos_path: str) -> Generator[CosFileItem, None, None]:
-    """获取文件列表(迭代器版本，可以获取完整列表)
+def _list_page(prefix: str, marker: str, delimiter: str = "") -> dict:
+    return client.list_objects(
+        Bucket=settings.cos_bucket,
+        Prefix=prefix,
+        Marker=marker,
+        Delimiter=delimiter,
+        MaxKeys=1000,
+    )
+
+
+def iter_pages(prefix: str, delimiter: str = "") -> Generator[dict, None, None]:
+    """逐页列出对象，调用方处理当前页时后台预取下一页"""
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        future = prefetch.submit(_list_page, prefix, "", delimiter)
+        while True:
+            res = future.result()
+            truncated = res.get("IsTruncated") == "true"
+            if truncated:
+                future = prefetch.submit(_list_page, prefix, res["NextMarker"], delimiter)
+            yield res
+            if not truncated:
+                break
+
+
+def _iter_objects(prefix: str) -> Generator[CosObject, None, None]:
+    for res in iter_pages(prefix):
+        for item in res.get("Contents", []):
+            yield CosObject.from_cos(item)
+
+
+_DONE = object()
+
+
+def get_file_list_v2(
+    cos_path: str, concurrency: int | None = None
+) -> Generator[CosObject, None, None]:
+    """获取完整文件列表
+
+    先按 "/" 列出一级子目录，再用有界线程池并发遍历各子目录，每个子目录内预取下一页。
+    结果按子目录完成的先后产出，不保证全局按 key 排序。
 
     Args:
         cos_path (str): 对象存储地址
+        concurrency (int | None, optional): 并发遍历的子目录数，默认 settings.cos_list_threads
 
     Yields:
-        CosFileItem: 文件信息
+        CosObject: 文件信息
     """
-    marker = ""
-    while True:
-        res = client.list_objects(
-            Bucket=settings.cos_bucket, Prefix=cos_path, Marker=marker
-        )
+    threads = concurrency or settings.cos_list_threads
+    sub_prefixes = []
+    for res in iter_pages(cos_path, delimiter="/"):
         for item in res.get("Contents", []):
-            yield CosFileItem(**item, isFile=not item.get("Key").endswith("/"))
-        if res["IsTruncated"] == "false":
-            break
-        marker = res["NextMarker"]
+            yield CosObject.from_cos(item)
+        sub_prefixes.extend(p["Prefix"] for p in res.get("CommonPrefixes", []))
+    if not sub_prefixes:
+        return
+    if threads <= 1:
+        for prefix in sub_prefixes:
+            yield from _iter_objects(prefix)
+        return
+
+    # 有界队列：调用方消费慢时工作线程会阻塞，内存占用不随目录大小增长
+    results: queue.Queue = queue.Queue(maxsize=threads * 2)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def walk(prefix: str):
+        try:
+            for res in iter_pages(prefix):
+                if stop.is_set() or not put(res.get("Contents", [])):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(_DONE)
 
+    pool = ThreadPoolExecutor(max_workers=threads)
+    try:
+        for prefix in sub_prefixes:
+            pool.submit(walk, prefix)
+        remaining = len(sub_prefixes)
+        while remaining:
+            item = results.get()
+            if item is _DONE:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                for obj in item:
+                    yield CosObject.from_cos(obj)
+    finally:
+        # 调用方提前结束或出错时通知工作线程退出
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
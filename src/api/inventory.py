@@ -0,0 +1,140 @@
+"""
+对象清单快照
+
+把一次完整遍历的结果保存到本地 SQLite 文件，之后的列表和目录大小统计直接查询快照，
+不再请求存储后端。快照按 key 建主键，前缀查询是索引上的范围扫描。
+"""
+
+import os
+import sqlite3
+import time
+from typing import Generator
+
+from api.storage import get_storage
+from api.models import CosObject
+from config import get_settings
+
+settings = get_settings()
+
+
+def _prefix_upper(prefix: str) -> str | None:
+    """前缀范围的上界（不含），key >= prefix AND key < upper 等价于 key LIKE 'prefix%'"""
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class Inventory:
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): 快照文件路径
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+
+    @classmethod
+    def build(cls, prefix: str, path: str, batch: int = 5000) -> "Inventory":
+        """遍历 prefix 下的全部对象生成快照，写完后原子替换旧文件
+
+        Args:
+            prefix (str): 对象存储目录
+            path (str): 快照文件路径
+            batch (int, optional): 每批写入的行数
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        conn = sqlite3.connect(tmp)
+        try:
+            conn.execute(
+                "CREATE TABLE objects (key TEXT PRIMARY KEY, size INTEGER, "
+                "etag TEXT, last_modified TEXT, storage_class TEXT) WITHOUT ROWID"
+            )
+            conn.execute("CREATE TABLE meta (prefix TEXT, created REAL)")
+            conn.execute("INSERT INTO meta VALUES (?, ?)", (prefix, time.time()))
+            rows = []
+            for obj in get_storage().list(prefix):
+                rows.append(
+                    (obj.key, obj.size, obj.etag, obj.last_modified, obj.storage_class)
+                )
+                if len(rows) >= batch:
+                    conn.executemany("INSERT OR REPLACE INTO objects VALUES (?,?,?,?,?)", rows)
+                    rows.clear()
+            conn.executemany("INSERT OR REPLACE INTO objects VALUES (?,?,?,?,?)", rows)
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp, path)
+        return cls(path)
+
+    @property
+    def created(self) -> float:
+        return self.conn.execute("SELECT created FROM meta").fetchone()[0]
+
+    def _range(self, prefix: str) -> tuple[str, tuple]:
+        upper = _prefix_upper(prefix)
+        if upper is None:
+            return "key >= ?", (prefix,)
+        return "key >= ? AND key < ?", (prefix, upper)
+
+    def list(self, prefix: str = "") -> Generator[CosObject, None, None]:
+        """按 key 顺序列出前缀下的对象"""
+        where, params = self._range(prefix)
+        cur = self.conn.execute(
+            f"SELECT key, size, etag, last_modified, storage_class FROM objects "
+            f"WHERE {where} ORDER BY key",
+            params,
+        )
+        for row in cur:
+            yield CosObject(*row)
+
+    def total(self, prefix: str = "") -> tuple[int, int]:
+        """前缀下的对象数和总字节数"""
+        where, params = self._range(prefix)
+        count, size = self.conn.execute(
+            f"SELECT count(*), coalesce(sum(size), 0) FROM objects WHERE {where}",
+            params,
+        ).fetchone()
+        return count, size
+
+    def sizes(self, prefix: str = "") -> dict[str, tuple[int, int]]:
+        """按下一级目录汇总对象数和字节数，直接位于 prefix 下的文件单独列出
+
+        Returns:
+            dict[str, tuple[int, int]]: 子目录（以 "/" 结尾）或文件 -> (对象数, 字节数)
+        """
+        where, params = self._range(prefix)
+        n = len(prefix)
+        rows = self.conn.execute(
+            f"""
+            SELECT CASE WHEN instr(substr(key, {n} + 1), '/') > 0
+                        THEN substr(key, 1, {n} + instr(substr(key, {n} + 1), '/'))
+                        ELSE key END AS child,
+                   count(*), sum(size)
+            FROM objects WHERE {where} GROUP BY child ORDER BY child
+            """,
+            params,
+        )
+        return {child: (count, size) for child, count, size in rows}
+
+    def close(self):
+        self.conn.close()
+
+
+def inventory_path(prefix: str) -> str:
+    root = settings.cos_inventory_dir or os.path.join(settings.temp_dir, "inventory")
+    name = prefix.strip("/").replace("/", "_") or "_root"
+    return os.path.join(root, name + ".sqlite")
+
+
+def get_inventory(prefix: str, max_age: float = 3600) -> Inventory:
+    """读取 prefix 的快照，不存在或超过 max_age 秒时重新生成"""
+    path = inventory_path(prefix)
+    if os.path.exists(path):
+        inv = Inventory(path)
+        if time.time() - inv.created <= max_age:
+            return inv
+        inv.close()
+    return Inventory.build(prefix, path)
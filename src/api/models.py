@@ -1,4 +1,6 @@
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Iterator, NamedTuple
 from pydantic import BaseModel
 
 
@@ -15,3 +17,53 @@ class CosFileItem(BaseModel):
     Owner: CosOwner
     StorageClass: str
     isFile: bool=False
+
+
+@dataclass(slots=True, frozen=True)
+class CosObject:
+    """对象列表的精简记录，批量遍历时比 CosFileItem 省内存和构造开销
+
+    last_modified 保留 COS 返回的 ISO 8601 字符串，需要时再解析
+    """
+
+    key: str
+    size: int
+    etag: str
+    last_modified: str
+    storage_class: str
+
+    @property
+    def is_file(self) -> bool:
+        return not self.key.endswith("/")
+
+    @classmethod
+    def from_cos(cls, item: dict) -> "CosObject":
+        return cls(
+            item["Key"],
+            int(item["Size"]),
+            item["ETag"],
+            item["LastModified"],
+            item.get("StorageClass", ""),
+        )
+
+
+class FileStream(NamedTuple):
+    """流式下载的结果，body 按块产出内容，消费完或中途关闭时释放连接"""
+
+    body: Iterator[bytes]
+    # 分块传输时 COS 不返回长度
+    content_length: int | None
+    content_type: str | None
+    etag: str | None
+    last_modified: str | None
+    # 范围请求时为 "bytes start-end/size"，否则为 None
+    content_range: str | None
+
+
+class ObjectInfo(NamedTuple):
+    """对象的元信息（HEAD 的结果）"""
+
+    size: int
+    etag: str | None
+    content_type: str | None
+    last_modified: str | None
@@ -0,0 +1,279 @@
+"""
+文件存储后端
+
+接口只依赖 StorageBackend，具体实现由 settings.storage_backend 选择：
+
+- cos: 腾讯云对象存储（api/cos.py），支持预签名地址和本地磁盘缓存
+- local: 本地目录，读取直接 sendfile，写入先写临时文件再原子替换
+
+对象不存在时统一抛出 FileNotFoundError。
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import BinaryIO, Generator
+
+from api.models import CosObject, FileStream, ObjectInfo
+from config import get_settings
+from utils import resolve_range
+
+settings = get_settings()
+
+
+class RangeNotSatisfiable(Exception):
+    """请求的范围超出文件大小（应响应 416）"""
+
+    def __init__(self, size: int):
+        super().__init__(size)
+        self.size = size
+
+
+def stage_upload(fp: BinaryIO, directory: str, chunk_size: int = 1024 * 1024):
+    """把上传的文件写到本地暂存目录，同时计算 md5（只读一遍）
+
+    Returns:
+        tuple[str, str, int]: 暂存文件路径、md5 和文件大小
+    """
+    os.makedirs(directory, exist_ok=True)
+    md5 = hashlib.md5()
+    size = 0
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".upload")
+    with os.fdopen(fd, "wb") as out:
+        fp.seek(0)
+        while chunk := fp.read(chunk_size):
+            md5.update(chunk)
+            size += len(chunk)
+            out.write(chunk)
+    return path, md5.hexdigest(), size
+
+
+class StorageBackend:
+    def put(self, key: str, fp: BinaryIO, size: int, content_type: str | None = None):
+        """从文件对象的当前位置读到结尾写入 key"""
+        raise NotImplementedError
+
+    def get_stream(self, key: str, byte_range: str | None = None) -> FileStream:
+        """流式读取
+
+        Args:
+            key (str): 对象地址
+            byte_range (str | None, optional): parse_range 的结果
+
+        Raises:
+            FileNotFoundError: 对象不存在
+            RangeNotSatisfiable: 范围无法满足
+        """
+        raise NotImplementedError
+
+    def head(self, key: str) -> ObjectInfo | None:
+        """对象元信息，不存在时返回 None"""
+        raise NotImplementedError
+
+    def list(self, prefix: str) -> Generator[CosObject, None, None]:
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> str | None:
+        """可以直接 sendfile 的本地文件路径，没有本地副本时返回 None
+
+        Raises:
+            FileNotFoundError: 对象不存在
+        """
+        return None
+
+    def presign_get(self, key: str) -> str | None:
+        """客户端直接下载的地址，不支持时返回 None"""
+        return None
+
+    def presign_put(self, key: str, content_type: str | None = None) -> str | None:
+        """客户端直接上传（PUT）的地址，不支持时返回 None"""
+        return None
+
+    def read_bytes(self, key: str) -> bytes:
+        path = self.local_path(key)
+        if path is not None:
+            with open(path, "rb") as fp:
+                return fp.read()
+        return b"".join(self.get_stream(key).body)
+
+
+class COSStorage(StorageBackend):
+    def __init__(self):
+        from api import cos
+
+        self.cos = cos
+
+    def put(self, key, fp, size, content_type=None):
+        self.cos.upload_fileobj(fp, key, size, content_type)
+
+    def get_stream(self, key, byte_range=None):
+        try:
+            return self.cos.get_file_stream(key, byte_range)
+        except self.cos.CosServiceError as e:
+            if e.get_status_code() == 404:
+                raise FileNotFoundError(key) from e
+            if e.get_status_code() == 416:
+                raise RangeNotSatisfiable(self.cos.get_file_size(key)) from e
+            raise
+
+    def head(self, key):
+        res = self.cos.head_file(key)
+        if res is None:
+            return None
+        return ObjectInfo(
+            size=int(res["Content-Length"]),
+            etag=res.get("ETag"),
+            content_type=res.get("Content-Type"),
+            last_modified=res.get("Last-Modified"),
+        )
+
+    def list(self, prefix):
+        return self.cos.get_file_list_v2(prefix)
+
+    def delete(self, key):
+        self.cos.delete_file(key)
+
+    def local_path(self, key):
+        try:
+            return self.cos.get_cached_file(key)
+        except self.cos.CosServiceError as e:
+            if e.get_status_code() == 404:
+                raise FileNotFoundError(key) from e
+            raise
+
+    def presign_get(self, key):
+        return self.cos.get_download_url(key)
+
+    def presign_put(self, key, content_type=None):
+        return self.cos.get_upload_url(key, content_type)
+
+
+class LocalStorage(StorageBackend):
+    """本地目录存储，key 即相对路径"""
+
+    TMP_SUFFIX = ".tmp"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key.lstrip("/")))
+        # 防止 ../ 访问存储目录之外的文件
+        if os.path.commonpath([path, self.root]) != self.root:
+            raise ValueError(f"invalid key: {key}")
+        return path
+
+    def put(self, key, fp, size, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}{self.TMP_SUFFIX}"
+        try:
+            with open(tmp, "wb") as out:
+                while chunk := fp.read(settings.cos_chunk_size):
+                    out.write(chunk)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _iter_file(self, path: str, start: int, length: int):
+        with open(path, "rb") as fp:
+            fp.seek(start)
+            while length > 0:
+                chunk = fp.read(min(settings.cos_chunk_size, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk
+
+    def get_stream(self, key, byte_range=None):
+        info = self.head(key)
+        if info is None:
+            raise FileNotFoundError(key)
+        path = self._path(key)
+        start, end, content_range = 0, info.size - 1, None
+        if byte_range is not None:
+            resolved = resolve_range(byte_range, info.size)
+            if resolved is None:
+                raise RangeNotSatisfiable(info.size)
+            start, end = resolved
+            content_range = f"bytes {start}-{end}/{info.size}"
+        length = end - start + 1
+        return FileStream(
+            body=self._iter_file(path, start, length),
+            content_length=length,
+            content_type=None,
+            etag=info.etag,
+            last_modified=info.last_modified,
+            content_range=content_range,
+        )
+
+    def head(self, key):
+        try:
+            st = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        modified = datetime.fromtimestamp(st.st_mtime, timezone.utc)
+        return ObjectInfo(
+            size=st.st_size,
+            etag=f'"{st.st_mtime_ns:x}-{st.st_size:x}"',
+            content_type=None,
+            last_modified=format_datetime(modified, usegmt=True),
+        )
+
+    def list(self, prefix):
+        # prefix 可以是目录也可以是文件名前缀，从所在目录开始遍历
+        base = self._path(os.path.dirname(prefix))
+        for dirpath, dirnames, names in os.walk(base):
+            dirnames.sort()
+            for name in sorted(names):
+                if name.endswith(self.TMP_SUFFIX):
+                    continue
+                path = os.path.join(dirpath, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if not key.startswith(prefix):
+                    continue
+                st = os.stat(path)
+                yield CosObject(
+                    key,
+                    st.st_size,
+                    f'"{st.st_mtime_ns:x}-{st.st_size:x}"',
+                    datetime.fromtimestamp(st.st_mtime, timezone.utc).isoformat(),
+                    "LOCAL",
+                )
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key):
+        path = self._path(key)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(key)
+        return path
+
+
+_storage: StorageBackend | None = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    """按配置创建存储后端（单例）"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if settings.storage_backend == "local":
+                _storage = LocalStorage(settings.storage_dir)
+            else:
+                _storage = COSStorage()
+        return _storage
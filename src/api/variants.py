@@ -0,0 +1,125 @@
+"""
+封面缩略图
+
+缩略图保存在原图旁边，例如 cover/<md5>.png -> cover/<md5>_w320.webp。
+原图按内容命名、不会被修改，所以缩略图生成一次后可以一直使用。
+图片编解码占用 CPU，在进程池中执行，不阻塞接口线程也不受 GIL 限制。
+
+需要安装 Pillow：`pdm install -G image`
+"""
+
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from api.storage import get_storage
+from cache import TTLCache
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# 格式 -> (Pillow 格式名, Content-Type)
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+# 已确认存在的缩略图，避免每次请求都 HEAD
+_existing = TTLCache(maxsize=4096, ttl=3600)
+# 同一个缩略图同时只生成一次
+_generating: dict[str, threading.Lock] = {}
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.image_workers)
+        return _pool
+
+
+def normalize_width(width: int) -> int:
+    """向上取整到配置的宽度档位，超过最大档位时使用最大档位"""
+    widths = sorted(settings.cover_variant_widths)
+    for w in widths:
+        if w >= width:
+            return w
+    return widths[-1]
+
+
+def variant_key(cos_path: str, width: int, fmt: str) -> str:
+    stem, _ = os.path.splitext(cos_path)
+    return f"{stem}_w{width}.{fmt}"
+
+
+def render(data: bytes, width: int, fmt: str) -> bytes:
+    """缩放图片（只缩小不放大，保持宽高比），在子进程中执行"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        img.thumbnail((width, img.height))
+        if FORMATS[fmt][0] == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, FORMATS[fmt][0])
+    return out.getvalue()
+
+
+def _upload(key: str, data: bytes, fmt: str):
+    get_storage().put(key, io.BytesIO(data), len(data), FORMATS[fmt][1])
+    _existing.set(key, True)
+
+
+def generate_variants(cos_path: str):
+    """按配置生成全部缩略图并上传，在上传封面后作为后台任务调用"""
+    try:
+        data = get_storage().read_bytes(cos_path)
+        pool = get_pool()
+        jobs = {
+            variant_key(cos_path, w, fmt): (fmt, pool.submit(render, data, w, fmt))
+            for w in settings.cover_variant_widths
+            for fmt in settings.cover_variant_formats
+        }
+        for key, (fmt, future) in jobs.items():
+            _upload(key, future.result(), fmt)
+    except Exception:
+        # 缩略图可以在请求时补生成，这里失败不影响上传结果
+        logger.exception("generate variants for %s failed", cos_path)
+
+
+def ensure_variant(cos_path: str, width: int, fmt: str) -> str:
+    """返回缩略图的地址，不存在时立即生成
+
+    Args:
+        cos_path (str): 原图地址
+        width (int): normalize_width 之后的宽度
+        fmt (str): FORMATS 中的格式
+
+    Returns:
+        str: 缩略图的对象存储地址
+    """
+    key = variant_key(cos_path, width, fmt)
+    if _existing.get(key):
+        return key
+    with _pool_lock:
+        lock = _generating.setdefault(key, threading.Lock())
+    with lock:
+        try:
+            if not _existing.get(key):
+                if get_storage().head(key) is None:
+                    data = get_pool().submit(
+                        render, get_storage().read_bytes(cos_path), width, fmt
+                    ).result()
+                    _upload(key, data, fmt)
+                else:
+                    _existing.set(key, True)
+        finally:
+            with _pool_lock:
+                _generating.pop(key, None)
+    return key
@@ -1,23 +1,263 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+import hashlib
+import hmac
 import logging
-from typing import Optional
+import threading
+import time
+import uuid
+from typing import NamedTuple, Optional
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from jose import jwt
-from sqlmodel import Session, select
+from sqlmodel import delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from database import get_db, models as db_model
+from cache import TTLCache
+from database import async_engine, get_async_db, models as db_model
 from models import CurrentUser, TokenData
 from config import get_settings
+from utils import encrypt_md5
 
 logging.getLogger("passlib").setLevel(logging.ERROR)
+logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
 ALGORITHM = "HS256"
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+ACCESS_TOKEN_EXPIRE = timedelta(days=15)
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.password_bcrypt_rounds
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/user/token")
+# 未携带令牌时返回 None 而不是直接 401，供允许匿名访问的接口使用
+oauth2_scheme_optional = OAuth2PasswordBearer(
+    tokenUrl="/api/user/token", auto_error=False
+)
+
+
+class _Identity(NamedTuple):
+    """缓存中的用户快照，不持有任何数据库会话"""
+
+    user: dict
+    role: dict | None
+    token_data: TokenData
+
+    @classmethod
+    def from_user(
+        cls,
+        user: db_model.Users,
+        role: db_model.Roles | None,
+        token_data: TokenData,
+    ):
+        return cls(
+            user=user.model_dump(),
+            role=role.model_dump() if role else None,
+            token_data=token_data,
+        )
+
+    def to_current_user(self, token: str):
+        # 每次都生成新的游离对象，请求之间互不影响
+        user = db_model.Users(**self.user)
+        if self.role is not None:
+            user.role = db_model.Roles(**self.role)
+        return CurrentUser(user=user, token=token, token_data=self.token_data)
+
+
+# token -> _Identity
+token_cache = TTLCache(settings.token_cache_size, settings.token_cache_ttl)
+
+
+def hash_token(token: str) -> str:
+    """令牌摘要，数据库中只保存这个值"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def invalidate_token(token: str):
+    """令牌失效（登出）时清除缓存"""
+    token_cache.pop(token)
+
+
+def invalidate_user(uid: int):
+    """用户信息变更或删除时清除该用户的所有缓存令牌"""
+    token_cache.discard_if(lambda _, ident: ident.token_data.uid == uid)
+
+
+def _timestamp(dt: datetime) -> float:
+    # 数据库中保存的是不带时区的 UTC 时间
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class RevocationSet:
+    """无状态模式使用的内存吊销集合，从 revocations 表按吊销时间增量同步
+
+    每次同步重新读取最近 revocation_sync_margin 秒内的记录：并发的事务不一定按
+    id 或吊销时间的顺序提交，只从上次同步到的位置往后读会永远漏掉晚提交的记录；
+    add 是幂等的，重复读取没有影响
+    """
+
+    def __init__(self):
+        # 令牌摘要(bytes) -> 过期时间戳
+        self._tokens: dict[bytes, float] = {}
+        # uid -> 吊销时间戳，之前签发的令牌全部失效
+        self._users: dict[int, tuple[float, float]] = {}
+        # 已同步记录中最晚的吊销时间（数据库中的原始值）
+        self._since: datetime | None = None
+        self._lock = threading.Lock()
+
+    def add(self, token_hash: str | None, uid: int, created: float, expires: float):
+        with self._lock:
+            if token_hash is not None:
+                self._tokens[bytes.fromhex(token_hash)] = expires
+            else:
+                old = self._users.get(uid)
+                if old is None or old[0] < created:
+                    self._users[uid] = (created, expires)
+
+    def is_revoked(self, token_hash: str, uid: int, iat: float) -> bool:
+        if bytes.fromhex(token_hash) in self._tokens:
+            return True
+        user = self._users.get(uid)
+        return user is not None and iat <= user[0]
+
+    def prune(self):
+        """删除已经过期的记录，过期令牌本身就无法通过校验"""
+        now = time.time()
+        with self._lock:
+            self._tokens = {k: v for k, v in self._tokens.items() if v > now}
+            self._users = {k: v for k, v in self._users.items() if v[1] > now}
+
+    async def refresh(self) -> int:
+        """拉取上次同步之后的吊销记录，包括重叠窗口中已经同步过的记录
+
+        Returns:
+            int: 读取的记录数
+        """
+        sql = select(db_model.Revocations)
+        if self._since is not None:
+            margin = timedelta(seconds=settings.revocation_sync_margin)
+            sql = sql.where(db_model.Revocations.created >= self._since - margin)
+        async with AsyncSession(async_engine) as db:
+            rows = (await db.exec(sql)).all()
+        for row in rows:
+            self.add(row.token_hash, row.uid, _timestamp(row.created), _timestamp(row.expires))
+            if self._since is None or row.created > self._since:
+                self._since = row.created
+        self.prune()
+        return len(rows)
+
+    def __len__(self):
+        return len(self._tokens) + len(self._users)
+
+
+revocations = RevocationSet()
+
+
+async def revocation_refresher():
+    """后台任务：定时同步吊销集合"""
+    while True:
+        try:
+            await revocations.refresh()
+        except Exception:
+            logger.exception("refresh revocations failed")
+        await asyncio.sleep(settings.revocation_refresh_interval)
+
+
+async def revoke_token(db: AsyncSession, token: str, token_data: TokenData):
+    """吊销单个令牌（登出），由调用方提交事务"""
+    token_hash = hash_token(token)
+    now = datetime.now(timezone.utc)
+    expires = (
+        datetime.fromtimestamp(token_data.exp, timezone.utc)
+        if token_data.exp
+        else now + ACCESS_TOKEN_EXPIRE
+    )
+    await db.exec(
+        delete(db_model.Tokens).where(db_model.Tokens.token_hash == token_hash)  # type: ignore
+    )
+    db.add(
+        db_model.Revocations(
+            token_hash=token_hash, uid=token_data.uid, expires=expires, created=now
+        )
+    )
+    invalidate_token(token)
+    revocations.add(token_hash, token_data.uid, now.timestamp(), expires.timestamp())
+
+
+async def _evict_oldest_tokens(db: AsyncSession, uid: int, keep: int):
+    """用户有效令牌超过 keep 个时，吊销最早签发的令牌"""
+    old_tokens = (
+        await db.exec(
+            select(db_model.Tokens)
+            .where(db_model.Tokens.uid == uid)
+            .order_by(db_model.Tokens.id.desc())  # type: ignore
+            .offset(keep)
+        )
+    ).all()
+    if not old_tokens:
+        return
+    now = datetime.now(timezone.utc)
+    for t in old_tokens:
+        db.add(
+            db_model.Revocations(
+                token_hash=t.token_hash, uid=uid, expires=t.expires, created=now
+            )
+        )
+        await db.delete(t)
+        revocations.add(t.token_hash, uid, now.timestamp(), _timestamp(t.expires))
+    # 缓存按令牌原文索引，这里只知道摘要，直接清掉该用户的全部缓存
+    invalidate_user(uid)
+
+
+async def purge_expired_tokens(batch: int) -> int:
+    """分批删除已过期的令牌和吊销记录，避免长事务锁表
+
+    Returns:
+        int: 删除的行数
+    """
+    total = 0
+    now = datetime.now(timezone.utc)
+    for model in (db_model.Tokens, db_model.Revocations):
+        while True:
+            async with AsyncSession(async_engine) as db:
+                ids = (
+                    await db.exec(
+                        select(model.id).where(model.expires < now).limit(batch)
+                    )
+                ).all()
+                if ids:
+                    await db.exec(delete(model).where(model.id.in_(ids)))  # type: ignore
+                    await db.commit()
+            total += len(ids)
+            if len(ids) < batch:
+                break
+    return total
+
+
+async def token_purger():
+    """后台任务：定时清理过期令牌"""
+    while True:
+        try:
+            count = await purge_expired_tokens(settings.token_purge_batch)
+            if count:
+                logger.info("purged %d expired tokens", count)
+        except Exception:
+            logger.exception("purge expired tokens failed")
+        await asyncio.sleep(settings.token_purge_interval)
+
+
+async def revoke_user(db: AsyncSession, uid: int):
+    """吊销用户当前所有令牌（修改权限、删除用户），由调用方提交事务"""
+    now = datetime.now(timezone.utc)
+    expires = now + ACCESS_TOKEN_EXPIRE
+    await db.exec(delete(db_model.Tokens).where(db_model.Tokens.uid == uid))  # type: ignore
+    db.add(db_model.Revocations(uid=uid, expires=expires, created=now))
+    invalidate_user(uid)
+    revocations.add(None, uid, now.timestamp(), expires.timestamp())
 
 
 def verify_password(plain_password, hashed_password):
@@ -28,19 +268,81 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
-def create_access_token(
-    data: TokenData, expires_delta: timedelta | None = None, db: Session | None = None
+def is_legacy_hash(hashed_password: str) -> bool:
+    """旧版本保存的是加盐 md5（32 位十六进制），登录成功后会重新哈希为 bcrypt"""
+    return not hashed_password.startswith("$")
+
+
+class PasswordHasher:
+    """在独立线程池中计算 bcrypt（bcrypt 计算时释放 GIL），不阻塞事件循环
+
+    同时计算的数量不超过 workers，排队超过 queue_timeout 秒直接返回 503，
+    避免登录高峰时请求无限堆积。
+    """
+
+    def __init__(self, workers: int, queue_timeout: float):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = asyncio.Semaphore(workers)
+        self.waiting = 0
+        self.rejected = 0
+
+    async def _run(self, func, *args):
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except TimeoutError:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="服务繁忙，请稍后再试")
+        finally:
+            self.waiting -= 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+        finally:
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str | None) -> tuple[bool, bool]:
+        """校验密码
+
+        Returns:
+            tuple[bool, bool]: 是否正确，以及是否需要重新哈希（旧的 md5 或参数已变化）
+        """
+        if not hashed_password:
+            # 没有密码的用户也计算一次，响应时间不暴露用户是否存在
+            await self._run(pwd_context.dummy_verify)
+            return False, False
+        if is_legacy_hash(hashed_password):
+            ok = hmac.compare_digest(encrypt_md5(password), hashed_password)
+            return ok, ok
+        ok = await self._run(pwd_context.verify, password, hashed_password)
+        return ok, ok and pwd_context.needs_update(hashed_password)
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "waiting": self.waiting, "rejected": self.rejected}
+
+
+password_hasher = PasswordHasher(settings.password_hash_workers, settings.password_queue_timeout)
+
+
+async def create_access_token(
+    data: TokenData,
+    expires_delta: timedelta | None = None,
+    db: AsyncSession | None = None,
 ):
     to_encode = data.model_dump()
-    if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(timezone.utc) + timedelta(days=15)
-    to_encode.update({"exp": expire})
+    # jti 保证同一秒内签发的令牌也互不相同
+    to_encode["jti"] = to_encode.get("jti") or uuid.uuid4().hex
+    now = datetime.now(timezone.utc)
+    expire = now + (expires_delta or ACCESS_TOKEN_EXPIRE)
+    to_encode.update({"exp": expire, "iat": now.timestamp()})
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=ALGORITHM)
     if db is not None:
         db_token = db_model.Tokens(
-            token=encoded_jwt,
+            token_hash=hash_token(encoded_jwt),
             uid=to_encode.get("uid", 0),
             expires=expire,
             ip=data.ip,
@@ -48,11 +350,32 @@ def create_access_token(
             desc=data.desc,
         )
         db.add(db_token)
-        db.commit()
+        if settings.token_max_per_user > 0:
+            await db.flush()
+            await _evict_oldest_tokens(db, data.uid, settings.token_max_per_user)
+        await db.commit()
     return encoded_jwt
 
 
-async def get_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+def _get_user_stateless(token: str, token_data: TokenData):
+    """只根据令牌内容确定用户身份，不访问数据库"""
+    if revocations.is_revoked(hash_token(token), token_data.uid, token_data.iat or 0):
+        raise HTTPException(
+            status_code=401, detail="Invalid authentication credentials"
+        )
+    user = db_model.Users(id=token_data.uid, role_id=token_data.role_id)
+    return CurrentUser(user=user, token=token, token_data=token_data, stateless=True)
+
+
+async def get_user(
+    db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)
+):
+    stateless = settings.auth_mode == "stateless"
+    if not stateless:
+        cached: _Identity | None = token_cache.get(token)
+        if cached is not None:
+            return cached.to_current_user(token)
+
     resp = HTTPException(status_code=401, detail="Invalid authentication credentials")
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[ALGORITHM])
@@ -62,18 +385,33 @@ async def get_user(db: Session = Depends(get_db), token: str = Depends(oauth2_sc
         token_data = TokenData(**payload)
     except:
         raise resp
-    db_token = db.exec(
-        select(db_model.Tokens).where(db_model.Tokens.token == token)
+    # 旧令牌没有 role_id/iat，仍然走数据库校验
+    if stateless and token_data.role_id is not None and token_data.iat is not None:
+        return _get_user_stateless(token, token_data)
+    # 令牌、用户、角色一次查询取回
+    row = (
+        await db.exec(
+            select(db_model.Users, db_model.Roles)
+            .join(db_model.Tokens, db_model.Tokens.uid == db_model.Users.id)  # type: ignore
+            .outerjoin(db_model.Roles, db_model.Roles.id == db_model.Users.role_id)  # type: ignore
+            .where(
+                db_model.Tokens.token_hash == hash_token(token),
+                db_model.Users.id == token_data.uid,
+            )
+        )
     ).one_or_none()
-    if db_token is None or token_data.uid != db_token.uid:
+    if row is None:
         raise resp
-    return CurrentUser(user=db_token.user, token=token, token_data=token_data)
+    user, role = row
+    ident = _Identity.from_user(user, role, token_data)
+    token_cache.set(token, ident, ttl=payload["exp"] - time.time())
+    return ident.to_current_user(token)
 
 
 async def get_user_optional(
-    db: Session = Depends(get_db), token:Optional[str]=Depends(oauth2_scheme)
+    db: AsyncSession = Depends(get_async_db),
+    token: Optional[str] = Depends(oauth2_scheme_optional),
 ):
-    print("get_user_optional", token)
     if token is None:
         return None
     try:
@@ -83,7 +421,9 @@ async def get_user_optional(
         return None
 
 
-async def get_user_admin(db: Session = Depends(get_db), token=Depends(oauth2_scheme)):
+async def get_user_admin(
+    db: AsyncSession = Depends(get_async_db), token=Depends(oauth2_scheme)
+):
     usr = await get_user(db, token)
     if usr.user.role_id < 3:
         # 3: 普通用户，数字越大权限越大
@@ -0,0 +1,389 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, BinaryIO, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """带过期时间的 LRU 缓存（线程安全）
+
+    同步接口在 FastAPI 的线程池里和事件循环里都可能被调用，所以用锁保护。
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        """
+        Args:
+            maxsize (int): 最大条目数，超出后淘汰最久未使用的条目
+            ttl (float): 默认过期时间（秒）
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires, value = item
+            if expires <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """写入缓存
+
+        Args:
+            key (Hashable): 键
+            value (Any): 值
+            ttl (float | None, optional): 本条目的过期时间，默认使用 self.ttl
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def discard_if(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """删除所有满足条件的条目
+
+        Returns:
+            int: 删除的条目数
+        """
+        with self._lock:
+            keys = [k for k, (_, v) in self._data.items() if predicate(k, v)]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """命中统计，用于调整缓存大小"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResponseCache:
+    """响应缓存接口，值为序列化后的响应体
+
+    写操作通过 bump 递增命名空间的版本号使旧缓存失效，读取时用当前版本号拼接键。
+    版本号保存在缓存后端里：redis 在所有 worker 之间共享，写入之后不会再读到旧数据；
+    memory 只在本进程内递增，其他 worker 在条目过期（最多 ttl 秒）之前仍会返回旧数据。
+    """
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    async def generation(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    async def bump(self, namespace: str):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryResponseCache(ResponseCache):
+    """进程内缓存，按总字节数做 LRU 淘汰
+
+    版本号也只在本进程内有效，多 worker 部署时其他进程的写入不会使这里的条目失效，
+    旧数据最多保留到条目过期，需要写后立即一致时使用 RedisResponseCache。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._size = 0
+        self._generations: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None or item[0] <= time.monotonic():
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        if len(value) > self.max_bytes:
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._size -= len(old[1])
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._size += len(value)
+        while self._size > self.max_bytes:
+            _, (_, v) = self._data.popitem(last=False)
+            self._size -= len(v)
+
+    async def generation(self, namespace: str) -> int:
+        return self._generations.get(namespace, 0)
+
+    async def bump(self, namespace: str):
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "entries": len(self._data),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class RedisResponseCache(ResponseCache):
+    """多个 worker 共享的 Redis 缓存，容量由 Redis 的 maxmemory 策略控制"""
+
+    def __init__(self, url: str, prefix: str = "gs-api:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("redis backend requires `pip install redis`") from e
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.client.set(self.prefix + key, value, px=int(ttl * 1000))
+
+    async def generation(self, namespace: str) -> int:
+        value = await self.client.get(f"{self.prefix}gen:{namespace}")
+        return int(value or 0)
+
+    async def bump(self, namespace: str):
+        await self.client.incr(f"{self.prefix}gen:{namespace}")
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+def create_response_cache(
+    backend: str, max_bytes: int, redis_url: str | None = None
+):
+    """根据配置创建响应缓存
+
+    Args:
+        backend (str): memory 或 redis
+        max_bytes (int): 进程内缓存的字节上限
+        redis_url (str | None, optional): redis 地址
+    """
+    if backend == "redis":
+        if not redis_url:
+            raise ValueError("redis_url is required for redis cache backend")
+        return RedisResponseCache(redis_url)
+    return MemoryResponseCache(max_bytes)
+
+
+class DiskCache:
+    """本地磁盘 LRU 缓存，适合内容不可变的对象（例如按 md5 命名的 COS 文件）
+
+    - 按总字节数淘汰最久未使用的文件，访问时更新 mtime，重启后按 mtime 恢复顺序
+    - 先写临时文件再 os.replace，读到的文件一定是完整的
+    - 同一个键并发未命中时只有一个线程下载，其他线程等待结果
+    - 多个进程可以共用一个目录：索引只是目录的快照，写入时每隔 rescan_interval 秒
+      重新扫描目录再按 mtime 淘汰，其他进程写入或删除的文件会在下次扫描时计入
+    """
+
+    TMP_SUFFIX = ".tmp"
+    # 超过这个时间（秒）的临时文件视为异常退出的残留，较新的可能是其他进程正在写入
+    STALE_TMP_AGE = 3600
+
+    def __init__(self, root: str, max_bytes: int, rescan_interval: float = 60):
+        """
+        Args:
+            root (str): 缓存目录
+            max_bytes (int): 缓存文件总大小上限
+            rescan_interval (float, optional): 写入时重新扫描目录的最短间隔（秒）
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        self._index: OrderedDict[str, int] = OrderedDict()  # 路径 -> 大小
+        self._size = 0
+        self._scanned = 0.0
+        self._filling: dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(root, exist_ok=True)
+        with self._lock:
+            self._rescan()
+            self._evict()
+
+    def _rescan(self):
+        """按目录中的实际文件重建索引和总大小，清理过期的临时文件"""
+        files = []
+        expired = time.time() - self.STALE_TMP_AGE
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                    if name.endswith(self.TMP_SUFFIX):
+                        if st.st_mtime < expired:
+                            os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    # 扫描期间被其他进程淘汰或改名
+                    continue
+                files.append((st.st_mtime, path, st.st_size))
+        self._index.clear()
+        self._size = 0
+        for _, path, size in sorted(files):
+            self._index[path] = size
+            self._size += size
+        self._scanned = time.monotonic()
+
+    def path_for(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    def get(self, key: str) -> Optional[str]:
+        """命中时返回本地文件路径"""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+            size = None if path in self._index else os.path.getsize(path)
+        except FileNotFoundError:
+            # 文件不存在或被其他进程淘汰
+            with self._lock:
+                self._discard(path)
+                self.misses += 1
+            return None
+        with self._lock:
+            if size is not None:
+                # 其他进程写入的文件，计入本进程的索引
+                self._discard(path)
+                self._index[path] = size
+                self._size += size
+            self._index.move_to_end(path)
+            self.hits += 1
+        return path
+
+    def get_or_fill(self, key: str, fill: Callable[[BinaryIO], None]) -> str:
+        """读取缓存，未命中时调用 fill 写入文件
+
+        Args:
+            key (str): 缓存键
+            fill (Callable[[BinaryIO], None]): 把内容写入给定文件对象的函数
+
+        Returns:
+            str: 本地文件路径
+        """
+        path = self.get(key)
+        if path is not None:
+            return path
+        path = self.path_for(key)
+        with self._lock:
+            fill_lock = self._filling.setdefault(path, threading.Lock())
+        with fill_lock:
+            # 等待期间其他线程可能已经写入
+            with self._lock:
+                if path in self._index:
+                    self._index.move_to_end(path)
+                    return path
+            try:
+                self._write(path, fill)
+            finally:
+                with self._lock:
+                    self._filling.pop(path, None)
+        return path
+
+    def _write(self, path: str, fill: Callable[[BinaryIO], None]):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}{self.TMP_SUFFIX}"
+        try:
+            with open(tmp, "wb") as fp:
+                fill(fp)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        size = os.path.getsize(path)
+        with self._lock:
+            self._discard(path)
+            self._index[path] = size
+            self._size += size
+            self._evict()
+
+    def _discard(self, path: str):
+        size = self._index.pop(path, None)
+        if size is not None:
+            self._size -= size
+
+    def _evict(self):
+        if time.monotonic() - self._scanned >= self.rescan_interval:
+            # 其他进程也在写入和淘汰，按目录的实际状态决定淘汰哪些文件
+            self._rescan()
+        # 刚写入的文件即使超过上限也保留，保证本次请求可以读取
+        while self._size > self.max_bytes and len(self._index) > 1:
+            path, size = self._index.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # 已被其他进程淘汰，大小已经扣除，不计入本进程的淘汰数
+                continue
+            self.evictions += 1
+            logger.debug("disk cache evict %s", path)
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._index),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -1,14 +1,104 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+import socket
+from typing import Literal
 
 class Settings(BaseSettings):
     temp_dir: str = "./tmp/"
     database_url: str
+    # 不设置时由 database_url 推导（pymysql -> aiomysql，sqlite -> aiosqlite）
+    async_database_url: str | None = None
+    # 连接池，sqlite 内存数据库不使用这些参数
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # 启动时预先建立的连接数，-1 表示 db_pool_size
+    db_pool_warmup: int = -1
+    # 定时输出连接池状态到日志的间隔（秒，0 表示不输出）
+    db_pool_log_interval: int = 300
     secret_key: str
-    cos_secret_id: str
-    cos_secret_key: str
-    cos_bucket: str
-    cos_region: str
+    # 文件存储：cos 为腾讯云对象存储，local 为本地目录（适合私有化部署和离线运行）
+    storage_backend: Literal["cos", "local"] = "cos"
+    storage_dir: str = "./storage/"
+    # 使用 cos 存储时必须设置
+    cos_secret_id: str = ""
+    cos_secret_key: str = ""
+    cos_bucket: str = ""
+    cos_region: str = ""
+    # 流式下载时每次读取的字节数，决定单个下载请求占用的内存
+    cos_chunk_size: int = 64 * 1024
+    # 上传：超过阈值的文件使用分片上传，分片大小会随文件大小增大以满足 10000 片的上限
+    cos_multipart_threshold: int = 8 * 1024 * 1024
+    cos_part_size: int = 8 * 1024 * 1024
+    # 同时上传的分片数，内存占用约为 cos_upload_threads * 分片大小
+    cos_upload_threads: int = 4
+    # COS 对象的本地磁盘缓存，默认放在 temp_dir/cos_cache，cos_cache_bytes 为 0 时关闭
+    cos_cache_dir: str | None = None
+    cos_cache_bytes: int = 512 * 1024 * 1024
+    # 文件读取方式：proxy 由接口转发内容，redirect 返回预签名地址让客户端直连存储（仅 cos 支持）
+    cos_delivery: Literal["proxy", "redirect"] = "proxy"
+    # 预签名地址有效期（秒），缓存的地址在过期前 cos_presign_margin 秒失效
+    cos_presign_expires: int = 600
+    cos_presign_margin: int = 60
+    # 遍历大目录时并发列出的子目录数
+    cos_list_threads: int = 8
+    # 对象清单快照的保存目录，默认 temp_dir/inventory
+    cos_inventory_dir: str | None = None
+    # 封面缩略图：上传时按这些宽度和格式预先生成，请求的宽度会向上取整到最近的一档
+    cover_variant_widths: list[int] = [160, 320, 640]
+    cover_variant_formats: list[str] = ["webp"]
+    # 生成缩略图的进程数
+    image_workers: int = 2
+    # 后台任务：worker 数（0 表示本进程不执行任务）、最大执行次数
+    job_workers: int = 4
+    job_max_attempts: int = 3
+    # 扫描 jobs 表恢复任务的间隔，运行超过 job_stale_after 秒的任务视为中断
+    job_poll_interval: float = 30
+    job_stale_after: int = 600
+    job_recover_batch: int = 1000
+    # 本机标识：依赖本机暂存文件的任务只由这台机器执行和恢复，多台机器需要互不相同
+    job_host: str = socket.gethostname()
+    # 登录令牌缓存：多进程部署时其他 worker 的登出/改资料最多延迟 ttl 秒生效
+    token_cache_size: int = 4096
+    token_cache_ttl: int = 60
+    # db: 每次请求查询 tokens 表（默认）；stateless: 信任 JWT 中的 uid/role，只检查内存中的吊销集合
+    auth_mode: Literal["db", "stateless"] = "db"
+    revocation_refresh_interval: float = 5
+    # 同步吊销记录时重新读取的时间窗口（秒），需要大于写入吊销记录的事务耗时
+    revocation_sync_margin: float = 60
+    # 过期令牌清理间隔（秒，0 表示不清理）和单批删除条数
+    token_purge_interval: int = 3600
+    token_purge_batch: int = 1000
+    # 每个用户最多保留的有效令牌数，超出后淘汰最早签发的（0 表示不限制）
+    token_max_per_user: int = 0
+    # 密码哈希（bcrypt）：同时计算的数量上限和排队等待的最长时间（秒），超时返回 503
+    password_bcrypt_rounds: int = 12
+    password_hash_workers: int = 4
+    password_queue_timeout: float = 5
+    # 登录限流：按 IP 和用户名的令牌桶（每秒补充数、最大突发数），memory 或 redis
+    throttle_backend: Literal["memory", "redis"] = "memory"
+    login_ip_rate: float = 1
+    login_ip_burst: float = 20
+    login_user_rate: float = 0.2
+    login_user_burst: float = 5
+    # 连续失败超过 login_free_failures 次后封禁，时长从 base 秒开始翻倍，最长 max 秒
+    login_free_failures: int = 3
+    login_backoff_base: float = 1
+    login_backoff_max: float = 900
+    # 同一个 IP 可能有很多用户（NAT），允许更多次失败
+    login_ip_free_failures: int = 20
+    # 响应缓存：memory 为进程内缓存，帖子列表的版本号不在 worker 之间同步，多 worker 部署时
+    # 其他 worker 的写入最多延迟 posts_cache_ttl 秒可见；redis 在多个 worker 之间共享，写入后立即失效
+    cache_backend: Literal["memory", "redis"] = "memory"
+    redis_url: str | None = None
+    # 匿名访问帖子列表的缓存时间（秒，0 表示不缓存）和进程内缓存的字节上限
+    posts_cache_ttl: int = 30
+    posts_cache_bytes: int = 32 * 1024 * 1024
+    # 菜谱详情的缓存时间（秒，0 表示不缓存），按版本号失效，ttl 只限制旧版本占用的空间
+    recipe_cache_ttl: int = 300
+    recipe_cache_bytes: int = 32 * 1024 * 1024
 
     class Config:
         env_file = ".env"
@@ -1,9 +1,50 @@
+from sqlalchemy import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from config import get_settings
+from .pool import pool_options, pool_status
+from .search import get_post_search
 
 settings = get_settings()
 
-engine = create_engine(settings.database_url)
+engine = create_engine(
+    settings.database_url, **pool_options(settings.database_url, settings)
+)
+
+# 同步驱动 -> 异步驱动
+ASYNC_DRIVERS = {
+    "mysql": "aiomysql",
+    "sqlite": "aiosqlite",
+}
+
+
+def get_async_url(url: str) -> str:
+    """根据同步数据库地址推导异步驱动地址，例如 mysql+pymysql:// -> mysql+aiomysql://"""
+    u = make_url(url)
+    driver = ASYNC_DRIVERS.get(u.get_backend_name())
+    if driver is None:
+        raise ValueError(f"不支持的异步数据库: {u.drivername}")
+    return u.set(drivername=f"{u.get_backend_name()}+{driver}").render_as_string(
+        hide_password=False
+    )
+
+
+async_url = settings.async_database_url or get_async_url(settings.database_url)
+async_engine = create_async_engine(
+    async_url, **pool_options(async_url, settings, is_async=True)
+)
+
+# 帖子全文检索，实现取决于数据库类型
+post_search = get_post_search(async_engine.dialect.name)
+
+
+def get_pool_status():
+    """同步和异步连接池的状态"""
+    return {
+        "async": pool_status(async_engine.pool),
+        "sync": pool_status(engine.pool),
+    }
 
 
 def get_db():
@@ -15,4 +56,20 @@ def get_db():
         db.rollback()
         raise e
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    """异步版本的 get_db，供 async def 接口使用
+
+    关闭 expire_on_commit，提交后仍可直接读取对象属性而不触发隐式 IO
+    """
+    db = AsyncSession(async_engine, expire_on_commit=False)
+    try:
+        yield db
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise e
+    finally:
+        await db.close()
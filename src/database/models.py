@@ -1,6 +1,9 @@
 from datetime import datetime
 from typing import Optional
 
+import orjson
+from sqlalchemy import DateTime, Index, Text
+from sqlalchemy.dialects import mysql
 from sqlmodel import Field, SQLModel, Relationship
 
 from utils import RSAEncrypt
@@ -19,7 +22,7 @@ class Users(SQLModel, table=True):
     tokens: list["Tokens"] = Relationship(back_populates="user")
 
     # region 菜谱相关
-    # recipes: list["Recipes"] = Relationship(back_populates="user")
+    recipes: list["Recipes"] = Relationship(back_populates="user")
     # 菜谱评论
     # recipe_comments: list["RecipeComments"] = Relationship(back_populates="user")
     # 菜谱被提及评论
@@ -70,9 +73,12 @@ class Roles(SQLModel, table=True):
 
 class Tokens(SQLModel, table=True):
     id: int = Field(default=None, primary_key=True, index=True, description="令牌ID")
-    token: str = Field(description="令牌值")
-    uid: int = Field(foreign_key="users.id", description="用户ID")
-    expires: datetime = Field(description="过期时间")
+    # 只保存令牌的 sha256 摘要，定长且带唯一索引
+    token_hash: str = Field(
+        max_length=64, unique=True, index=True, description="令牌摘要"
+    )
+    uid: int = Field(foreign_key="users.id", index=True, description="用户ID")
+    expires: datetime = Field(index=True, description="过期时间")
     created: datetime = Field(default_factory=datetime.now, description="创建时间")
     ip: Optional[str] = Field(default=None, description="IP地址")
     user_agent: Optional[str] = Field(default=None, description="用户代理")
@@ -81,127 +87,280 @@ class Tokens(SQLModel, table=True):
     user: Users = Relationship(back_populates="tokens")
 
 
+class Revocations(SQLModel, table=True):
+    """
+    令牌吊销记录，无状态鉴权模式下按吊销时间增量同步到各进程的内存中。
+
+    token_hash 为空表示吊销该用户在 created 之前签发的全部令牌（改权限、删除用户）。
+    created 与令牌的 iat（浮点秒）比较，MySQL 上需要保留微秒（DATETIME(6)）。
+    """
+
+    id: int = Field(default=None, primary_key=True, description="ID")
+    token_hash: Optional[str] = Field(default=None, max_length=64, description="令牌摘要")
+    uid: int = Field(description="用户ID")
+    expires: datetime = Field(index=True, description="过期时间，过期后记录可以清理")
+    created: datetime = Field(
+        sa_type=DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql"),  # type: ignore
+        index=True,
+        description="吊销时间",
+    )
+
+
+JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_FAILED = range(4)
+JOB_STATUS = ["等待", "运行中", "完成", "失败"]
+
+
+class Jobs(SQLModel, table=True):
+    """
+    后台任务，进程重启后从表中恢复未完成的任务。
+
+    status 见 JOB_STATUS；payload 和 result 为 JSON 文本。
+    host 不为空时只能由该机器执行（参数指向本机的暂存文件），为空时任意机器都可以执行。
+    """
+
+    __table_args__ = (Index("ix_jobs_status_id", "status", "id"),)
+
+    id: int = Field(default=None, primary_key=True, description="任务ID")
+    kind: str = Field(max_length=64, description="任务类型")
+    payload: str = Field(default="{}", sa_type=Text, description="任务参数")
+    status: int = Field(default=JOB_PENDING, description="状态")
+    attempts: int = Field(default=0, description="已执行次数")
+    result: Optional[str] = Field(default=None, sa_type=Text, description="执行结果")
+    error: Optional[str] = Field(default=None, sa_type=Text, description="错误信息")
+    uid: Optional[int] = Field(default=None, index=True, description="提交任务的用户ID")
+    host: Optional[str] = Field(default=None, max_length=255, description="执行任务的机器")
+    created: datetime = Field(default_factory=datetime.now, description="创建时间")
+    started: Optional[datetime] = Field(default=None, description="开始时间")
+    finished: Optional[datetime] = Field(default=None, description="结束时间")
+
+    def to_resp(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "status_label": JOB_STATUS[self.status],
+            "attempts": self.attempts,
+            "result": orjson.loads(self.result) if self.result else None,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
 RECIPE_GROUP_STATUS = ["草稿", "发布", "删除"]
 
 
-# class RecipeGroups(SQLModel, table=True):
-#     __tablename__ = "recipe_groups"  # type: ignore
-
-#     id: int = Field(
-#         default=None, primary_key=True, index=True, description="菜谱分类ID"
-#     )
-#     name: str = Field(description="菜谱分类名称")
-#     desc: Optional[str] = Field(default=None, description="菜谱分类描述")
-#     created: datetime = Field(default_factory=datetime.now, description="创建时间")
-#     updated: datetime = Field(default_factory=datetime.now, description="更新时间")
-#     uid: int = Field(foreign_key="users.id", description="用户ID")  # 创建者ID.
-#     status: int = Field(default=0, description="状态")  # 0:草稿, 1:发布, 2:删除.
-#     private: bool = Field(default=False, description="是否私有")  # 私有分类.
-
-#     recipes: list["Recipes"] = Relationship(back_populates="group")  # 关联菜谱.
-
-
-# RECIPE_STATUS = ["草稿", "发布", "删除", "审核中", "审核不通过"]
-
-
-# class Recipes(SQLModel, table=True):
-#     id: int = Field(default=None, primary_key=True, index=True, description="菜谱ID")
-#     name: str = Field(description="菜谱名称")
-#     desc: Optional[str] = Field(default=None, description="菜谱描述")
-#     created: datetime = Field(default_factory=datetime.now, description="创建时间")
-#     updated: datetime = Field(default_factory=datetime.now, description="更新时间")
-#     uid: int = Field(foreign_key="users.id", description="用户ID")
-#     status: int = Field(
-#         default=0, description="状态"
-#     )  # 0:草稿, 1:发布, 2:删除, 3:审核中, 4:审核不通过.
-#     group_id: int = Field(
-#         foreign_key="recipe_groups.id", description="菜谱分类ID"
-#     )  # 关联菜谱分类.
-#     content: str = Field(description="菜谱内容")  # Markdown 格式.
-#     cover: Optional[str] = Field(default=None, description="封面图片")  # 图片URL.
-#     materials: Optional[str] = Field(default=None, description="材料")  # JSON 格式.
-#     private: bool = Field(default=False, description="是否私有")
-
-#     user: Users = Relationship(back_populates="recipes")
-#     group: RecipeGroups = Relationship(back_populates="recipes")  # 关联菜谱分类.
-#     # setps: list["RecipeSteps"] = Relationship(back_populates="recipe")
-#     # comments: list["RecipeComments"] = Relationship(
-#     #     back_populates="recipe"
-#     # )  # 关联评论.
-
-#     def to_resp(self):
-#         return {
-#             "id": self.id,
-#             "name": self.name,
-#             "desc": self.desc,
-#             "created": self.created.strftime("%Y-%m-%d %H:%M:%S"),  # 格式化时间.
-#             "updated": self.updated.strftime("%Y-%m-%d %H:%M:%S"),  # 格式化时间.
-#             "username": self.user.name,
-#             "status": RECIPE_STATUS[self.status],
-#             "group": self.group.name if self.group else None,
-#             "cover": self.cover,
-#         }
-
-# class RecipeIngredient(SQLModel, table=True):
-#     __tablename__ = "recipe_ingredient"  # type: ignore
-#     id: int = Field(default=None, primary_key=True, index=True, description="ID")
-#     recipe_id: int = Field(foreign_key="recipes.id", description="菜谱ID")
-#     name: str = Field(description="材料名称")  # 材料名称.
-#     # 数量
-#     quantity: Optional[str] = Field(default=None, description="数量")  # 数量.
-#     unit: Optional[str] = Field(default=None, description="单位")  # 单位.
-#     desc: Optional[str] = Field(default=None, description="材料描述")
-
-
-# class RecipeSteps(SQLModel, table=True):  # 菜谱步骤.
-#     __tablename__ = "recipe_steps"  # type: ignore
-
-#     id: int = Field(
-#         default=None, primary_key=True, index=True, description="步骤ID"
-#     )  # 步骤ID.
-#     recipe_id: int = Field(foreign_key="recipes.id", description="菜谱ID")
-#     desc: str = Field(description="步骤描述")
-#     order: int = Field(description="步骤顺序")
-#     img: Optional[str] = Field(default=None, description="步骤图片")
-
-
-# class RecipeComments(SQLModel, table=True):  # 菜谱评论.
-#     __tablename__ = "recipe_comments"  # type: ignore
-
-#     id: int = Field(default=None, primary_key=True, index=True, description="评论ID")
-#     recipe_id: int = Field(foreign_key="recipes.id", description="菜谱ID")
-#     content: str = Field(description="评论内容")
-#     created: datetime = Field(default_factory=datetime.now, description="创建时间")
-#     updated: datetime = Field(default_factory=datetime.now, description="更新时间")
-#     uid: int = Field(foreign_key="users.id", description="用户ID")
-#     status: int = Field(default=0, description="状态")
-#     private: bool = Field(default=False, description="是否私有")
-#     reply_to: Optional[int] = Field(
-#         foreign_key="recipe_comments.id", description="回复评论ID"
-#     )
-#     reply_to_uid: Optional[int] = Field(
-#         foreign_key="users.id", description="回复用户ID"
-#     )
-#     # 创建人
-#     # user: Users = Relationship(back_populates="recipe_comments")
-#     # 菜谱
-#     # recipe: Recipes = Relationship(back_populates="comments")
-#     # 回复评论
-#     # reply_to_comment: Optional["RecipeComments"] = Relationship(
-#     #     back_populates="replys"
-#     # )
-#     # 被回复的评论
-#     # replys: list["RecipeComments"] = Relationship(
-#     #     back_populates="reply_to_comment",
-#     # )
-#     # 回复用户
-#     # reply_to_user: Optional[Users] = Relationship(
-#     #     back_populates="recipe_replied_comments"
-#     # )
+class RecipeGroups(SQLModel, table=True):
+    __tablename__ = "recipe_groups"  # type: ignore
+
+    id: int = Field(
+        default=None, primary_key=True, index=True, description="菜谱分类ID"
+    )
+    name: str = Field(description="菜谱分类名称")
+    desc: Optional[str] = Field(default=None, description="菜谱分类描述")
+    created: datetime = Field(default_factory=datetime.now, description="创建时间")
+    updated: datetime = Field(default_factory=datetime.now, description="更新时间")
+    uid: int = Field(foreign_key="users.id", index=True, description="用户ID")  # 创建者ID.
+    status: int = Field(default=0, description="状态")  # 0:草稿, 1:发布, 2:删除.
+    private: bool = Field(default=False, description="是否私有")  # 私有分类.
+    parent_id: Optional[int] = Field(
+        default=None, foreign_key="recipe_groups.id", index=True, description="父分类ID"
+    )
+    # 物化路径：从根到自身的 id，例如 "/1/5/9/"，子树查询为 path LIKE '/1/5/%'
+    path: str = Field(default="/", max_length=255, index=True, description="分类路径")
+
+    recipes: list["Recipes"] = Relationship(back_populates="group")  # 关联菜谱.
+    parent: Optional["RecipeGroups"] = Relationship(
+        back_populates="children",
+        sa_relationship_kwargs={"remote_side": "RecipeGroups.id"},
+    )
+    children: list["RecipeGroups"] = Relationship(back_populates="parent")
+
+    def to_resp(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "desc": self.desc,
+            "created": self.created,
+            "updated": self.updated,
+            "status": self.status,
+            "private": self.private,
+            "parent_id": self.parent_id,
+        }
+
+
+RECIPE_STATUS = ["草稿", "发布", "删除", "审核中", "审核不通过"]
+
+
+class Recipes(SQLModel, table=True):
+    # 列表按 id 倒序做游标分页，各筛选条件都有 (条件, id) 索引
+    __table_args__ = (
+        Index("ix_recipes_private_id", "private", "id"),
+        Index("ix_recipes_uid_id", "uid", "id"),
+        Index("ix_recipes_group_id_id", "group_id", "id"),
+        Index("ix_recipes_status_id", "status", "id"),
+    )
+
+    id: int = Field(default=None, primary_key=True, index=True, description="菜谱ID")
+    name: str = Field(description="菜谱名称")
+    desc: Optional[str] = Field(default=None, description="菜谱描述")
+    created: datetime = Field(default_factory=datetime.now, description="创建时间")
+    updated: datetime = Field(default_factory=datetime.now, description="更新时间")
+    uid: int = Field(foreign_key="users.id", description="用户ID")
+    status: int = Field(
+        default=0, description="状态"
+    )  # 0:草稿, 1:发布, 2:删除, 3:审核中, 4:审核不通过.
+    group_id: Optional[int] = Field(
+        default=None, foreign_key="recipe_groups.id", description="菜谱分类ID"
+    )  # 关联菜谱分类.
+    content: str = Field(default="", sa_type=Text, description="菜谱内容")  # Markdown 格式.
+    cover: Optional[str] = Field(default=None, description="封面图片")  # 图片URL.
+    materials: Optional[str] = Field(default=None, description="材料")  # JSON 格式.
+    private: bool = Field(default=False, description="是否私有")
+    # 菜谱及其原材料、步骤每次修改都会加一，用作详情缓存的键
+    version: int = Field(default=0, description="版本号")
+
+    user: Users = Relationship(back_populates="recipes")
+    group: Optional[RecipeGroups] = Relationship(back_populates="recipes")  # 关联菜谱分类.
+    ingredients: list["RecipeIngredient"] = Relationship(
+        back_populates="recipe", sa_relationship_kwargs={"cascade": "all, delete-orphan"}
+    )
+    steps: list["RecipeSteps"] = Relationship(
+        back_populates="recipe",
+        sa_relationship_kwargs={
+            "cascade": "all, delete-orphan",
+            "order_by": "(RecipeSteps.order, RecipeSteps.id)",
+        },
+    )
+    comments: list["RecipeComments"] = Relationship(
+        back_populates="recipe", sa_relationship_kwargs={"cascade": "all, delete-orphan"}
+    )  # 关联评论.
+
+    def to_resp(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "desc": self.desc,
+            "created": self.created.strftime("%Y-%m-%d %H:%M:%S"),  # 格式化时间.
+            "updated": self.updated.strftime("%Y-%m-%d %H:%M:%S"),  # 格式化时间.
+            "username": self.user.name,
+            "status": RECIPE_STATUS[self.status],
+            "group_id": self.group_id,
+            "group": self.group.name if self.group else None,
+            "cover": self.cover,
+            "private": self.private,
+        }
+
+
+class RecipeCounts(SQLModel, table=True):
+    """
+    菜谱数量计数，读取时只查本表，不做 count(*)。
+
+    key 为 "public"（全部公开菜谱）或 "private:{uid}"（该用户的私有菜谱），记录不存在表示数量为 0。
+    创建、删除菜谱或修改公开状态时由 adjust_recipe_count 在同一个事务中增减（记录不存在时插入）；
+    迁移（seed_recipe_counts）和管理接口由 reconcile_recipe_counts 按菜谱表重新统计，修正偏差。
+    """
+
+    __tablename__ = "recipe_counts"  # type: ignore
+    key: str = Field(primary_key=True, max_length=64, description="计数键")
+    count: int = Field(default=0, description="数量")
+
+
+class RecipeIngredient(SQLModel, table=True):
+    __tablename__ = "recipe_ingredient"  # type: ignore
+    id: int = Field(default=None, primary_key=True, index=True, description="ID")
+    recipe_id: int = Field(foreign_key="recipes.id", index=True, description="菜谱ID")
+    name: str = Field(description="材料名称")  # 材料名称.
+    # 数量
+    quantity: Optional[str] = Field(default=None, description="数量")  # 数量.
+    unit: Optional[str] = Field(default=None, description="单位")  # 单位.
+    desc: Optional[str] = Field(default=None, description="材料描述")
+
+    recipe: Recipes = Relationship(back_populates="ingredients")
+
+    def to_resp(self):
+        return {
+            "id": self.id,
+            "recipe_id": self.recipe_id,
+            "name": self.name,
+            "quantity": self.quantity,
+            "unit": self.unit,
+            "desc": self.desc,
+        }
+
+
+class RecipeSteps(SQLModel, table=True):  # 菜谱步骤.
+    __tablename__ = "recipe_steps"  # type: ignore
+
+    id: int = Field(
+        default=None, primary_key=True, index=True, description="步骤ID"
+    )  # 步骤ID.
+    recipe_id: int = Field(foreign_key="recipes.id", index=True, description="菜谱ID")
+    title: Optional[str] = Field(default=None, description="步骤标题")
+    desc: Optional[str] = Field(default=None, description="步骤描述")
+    order: int = Field(description="步骤顺序")
+    img: Optional[str] = Field(default=None, description="步骤图片")
+
+    recipe: Recipes = Relationship(back_populates="steps")
+
+    def to_resp(self):
+        return {
+            "id": self.id,
+            "recipe_id": self.recipe_id,
+            "title": self.title,
+            "desc": self.desc,
+            "order": self.order,
+            "img": self.img,
+        }
+
+
+class RecipeComments(SQLModel, table=True):  # 菜谱评论.
+    __tablename__ = "recipe_comments"  # type: ignore
+
+    id: int = Field(default=None, primary_key=True, index=True, description="评论ID")
+    recipe_id: int = Field(foreign_key="recipes.id", index=True, description="菜谱ID")
+    content: str = Field(description="评论内容")
+    created: datetime = Field(default_factory=datetime.now, description="创建时间")
+    updated: datetime = Field(default_factory=datetime.now, description="更新时间")
+    uid: int = Field(foreign_key="users.id", description="用户ID")
+    status: int = Field(default=0, description="状态")
+    private: bool = Field(default=False, description="是否私有")
+    reply_to: Optional[int] = Field(
+        default=None, foreign_key="recipe_comments.id", description="回复评论ID"
+    )
+    reply_to_uid: Optional[int] = Field(
+        default=None, foreign_key="users.id", description="回复用户ID"
+    )
+    # 菜谱
+    recipe: Recipes = Relationship(back_populates="comments")
+
+    def to_resp(self):
+        return {
+            "id": self.id,
+            "content": self.content,
+            "created": self.created,
+            "updated": self.updated,
+            "uid": self.uid,
+            "status": self.status,
+            "reply_to": self.reply_to,
+            "reply_to_uid": self.reply_to_uid,
+        }
+
+
+# 帖子列表中内容摘要的长度
+POST_EXCERPT_LENGTH = 20
 
 
 class Posts(SQLModel, table=True):  # 帖子.
     __tablename__ = "posts"  # type: ignore
+    # 与列表支持的排序方式对应，id 作为游标分页的第二排序键
+    __table_args__ = (
+        Index("ix_posts_status_created_id", "status", "created", "id"),
+        Index("ix_posts_status_updated_id", "status", "updated", "id"),
+        Index("ix_posts_uid_created_id", "uid", "created", "id"),
+        Index("ix_posts_uid_updated_id", "uid", "updated", "id"),
+    )
 
     id: int = Field(default=None, primary_key=True, index=True, description="帖子ID")
     title: str = Field(description="帖子标题")
@@ -218,7 +377,9 @@ class Posts(SQLModel, table=True):  # 帖子.
         return {
             "id": self.id,
             "title": self.title,
-            "content": self.content if all_contents else self.content[:20],
+            "content": (
+                self.content if all_contents else self.content[:POST_EXCERPT_LENGTH]
+            ),
             "created": self.created,
             "updated": self.updated,
             "status": self.status,
@@ -0,0 +1,123 @@
+"""
+连接池配置与监控
+"""
+
+import asyncio
+import bisect
+import logging
+import threading
+import time
+
+from sqlalchemy import exc, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from config import Settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """记录取连接的耗时（包括排队等待、建连和 pre-ping）"""
+
+    # 耗时直方图的桶上限（毫秒），最后一个桶收集更慢的请求
+    BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.histogram = [0] * (len(self.BUCKETS_MS) + 1)
+
+    def observe(self, seconds: float, timeout=False):
+        ms = seconds * 1000
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timeout
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.histogram[bisect.bisect_left(self.BUCKETS_MS, ms)] += 1
+
+    def to_dict(self) -> dict:
+        labels = [f"<={b}ms" for b in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": self.wait_total / self.checkouts * 1000
+            if self.checkouts
+            else 0.0,
+            "wait_max_ms": self.wait_max * 1000,
+            "histogram": dict(zip(labels, self.histogram)),
+        }
+
+
+class _InstrumentedPool:
+    """给连接池的 connect() 计时"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            conn = super().connect()  # type: ignore
+        except exc.TimeoutError:
+            self.stats.observe(time.perf_counter() - start, timeout=True)
+            logger.warning("database pool timeout: %s", self.status())  # type: ignore
+            raise
+        self.stats.observe(time.perf_counter() - start)
+        return conn
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options(url: str, settings: Settings, is_async=False) -> dict:
+    """create_engine / create_async_engine 的连接池参数"""
+    u = make_url(url)
+    if u.get_backend_name() == "sqlite" and u.database in (None, "", ":memory:"):
+        # 内存数据库只能使用默认的单连接池
+        return {}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def pool_status(pool) -> dict:
+    """连接池当前状态"""
+    if not isinstance(pool, QueuePool):
+        return {"class": type(pool).__name__}
+    data = {
+        "class": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        # 负数表示还没有创建满 pool_size 个连接
+        "overflow": pool.overflow(),
+    }
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        data.update(stats.to_dict())
+    return data
+
+
+async def warm_up(async_engine, count: int):
+    """启动时预先建立连接，避免第一波请求集中建连"""
+    if count <= 0:
+        return
+    conns = await asyncio.gather(*(async_engine.connect() for _ in range(count)))
+    for conn in conns:
+        await conn.close()
+    logger.info("database pool warmed up with %d connections", count)
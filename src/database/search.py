@@ -0,0 +1,134 @@
+"""
+帖子全文检索
+
+按数据库选择实现：MySQL 使用 FULLTEXT（ngram 分词，支持中文），
+SQLite 使用 FTS5（trigram 分词），其他数据库退化为 LIKE。
+"""
+
+import logging
+
+from sqlalchemy import Connection, inspect, literal_column, or_, text
+from sqlalchemy.dialects.mysql import match
+from sqlmodel import col, select
+from sqlmodel.sql.expression import Select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .models import Posts
+
+logger = logging.getLogger(__name__)
+
+
+class PostSearch:
+    """检索接口，默认实现为 LIKE 模糊匹配（全表扫描）"""
+
+    def setup(self, conn: Connection):
+        """创建检索需要的索引或虚拟表，可以重复调用"""
+
+    async def index(self, db: AsyncSession, post: Posts):
+        """新建或修改帖子后更新索引，需要在同一个事务内调用"""
+
+    async def remove(self, db: AsyncSession, pid: int):
+        """删除帖子后移除索引"""
+
+    def filter(self, sql: Select, query: str):
+        """给查询加上检索条件
+
+        Returns:
+            tuple[Select, Any]: 新的查询和按相关度排序的 order_by 子句
+        """
+        pattern = f"%{query}%"
+        sql = sql.where(
+            or_(col(Posts.title).like(pattern), col(Posts.content).like(pattern))
+        )
+        return sql, Posts.id.desc()  # type: ignore
+
+
+class MySQLPostSearch(PostSearch):
+    INDEX_NAME = "ft_posts_title_content"
+
+    def setup(self, conn: Connection):
+        indexes = {idx["name"] for idx in inspect(conn).get_indexes("posts")}
+        if self.INDEX_NAME not in indexes:
+            logger.info("create fulltext index %s", self.INDEX_NAME)
+            conn.execute(
+                text(
+                    f"ALTER TABLE posts ADD FULLTEXT INDEX {self.INDEX_NAME} "
+                    "(title, content) WITH PARSER ngram"
+                )
+            )
+
+    def filter(self, sql: Select, query: str):
+        # InnoDB 自动维护 FULLTEXT 索引，不需要 index/remove
+        score = match(
+            Posts.title, Posts.content, against=query
+        ).in_natural_language_mode()
+        return sql.where(score > 0), score.desc()
+
+
+class SQLitePostSearch(PostSearch):
+    """FTS5 虚拟表 posts_fts，rowid 与 posts.id 一致"""
+
+    def setup(self, conn: Connection):
+        if inspect(conn).has_table("posts_fts"):
+            return
+        conn.execute(
+            text(
+                "CREATE VIRTUAL TABLE posts_fts "
+                "USING fts5(title, content, tokenize='trigram')"
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO posts_fts (rowid, title, content) "
+                "SELECT id, title, content FROM posts"
+            )
+        )
+
+    async def index(self, db: AsyncSession, post: Posts):
+        await db.flush()
+        await self.remove(db, post.id)
+        await db.exec(
+            text(
+                "INSERT INTO posts_fts (rowid, title, content) "
+                "VALUES (:id, :title, :content)"
+            ).bindparams(id=post.id, title=post.title, content=post.content)  # type: ignore
+        )
+
+    async def remove(self, db: AsyncSession, pid: int):
+        await db.exec(
+            text("DELETE FROM posts_fts WHERE rowid = :id").bindparams(id=pid)  # type: ignore
+        )
+
+    def filter(self, sql: Select, query: str):
+        fts = literal_column("posts_fts")
+        rowid = literal_column("posts_fts.rowid")
+        if len(query) >= 3:
+            # 整体作为短语匹配，避免用户输入被当成 FTS5 语法
+            phrase = '"' + query.replace('"', '""') + '"'
+            rank = literal_column("bm25(posts_fts)")
+            where = fts.op("MATCH")(phrase)
+        else:
+            # trigram 无法索引少于 3 个字的查询，只能扫描
+            pattern = f"%{query}%"
+            rank = literal_column("0")
+            where = or_(
+                literal_column("posts_fts.title").like(pattern),
+                literal_column("posts_fts.content").like(pattern),
+            )
+        hits = (
+            select(rowid.label("pid"), rank.label("rank"))
+            .select_from(text("posts_fts"))
+            .where(where)
+        )
+        hits = hits.subquery("hits")
+        sql = sql.join(hits, hits.c.pid == Posts.id)
+        # bm25 越小越相关
+        return sql, hits.c.rank.asc()
+
+
+def get_post_search(dialect: str) -> PostSearch:
+    if dialect == "mysql":
+        return MySQLPostSearch()
+    if dialect == "sqlite":
+        return SQLitePostSearch()
+    return PostSearch()
@@ -1,9 +1,12 @@
 from fastapi import Depends, HTTPException
+from sqlalchemy import case, delete, func, insert, update
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from auth import get_user
 from database import get_db
-from database.models import RecipeIngredient, RecipeSteps, Recipes
+from database.models import RecipeCounts, RecipeIngredient, RecipeSteps, Recipes
 from models import CurrentUser
 
 
@@ -59,3 +62,240 @@ def get_step(
     if not step and not exit_ok:
         raise HTTPException(status_code=404, detail="未找到该元素")
     return step
+
+
+def touch_recipe(db: Session, recipe_id: int):
+    """菜谱的版本号加一，菜谱本身、原材料或步骤修改后调用，使详情缓存失效"""
+    db.exec(
+        update(Recipes)  # type: ignore
+        .where(Recipes.id == recipe_id)
+        .values(version=Recipes.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def touch_group_recipes(db: Session, group_id: int):
+    """分组改名后，分组内菜谱的版本号加一，详情中带有分组名"""
+    db.exec(
+        update(Recipes)  # type: ignore
+        .where(Recipes.group_id == group_id)
+        .values(version=Recipes.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def touch_user_recipes(db: AsyncSession, uid: int):
+    """用户改名后，其菜谱的版本号加一，详情中带有作者名"""
+    await db.exec(
+        update(Recipes)  # type: ignore
+        .where(Recipes.uid == uid)
+        .values(version=Recipes.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _touch_recipes_of(db: Session, model, uid: int, ids: list[int]):
+    """批量修改原材料或步骤之前，把涉及的菜谱版本号加一"""
+    db.exec(
+        update(Recipes)  # type: ignore
+        .where(
+            Recipes.uid == uid,
+            Recipes.id.in_(select(model.recipe_id).where(model.id.in_(ids))),  # type: ignore
+        )
+        .values(version=Recipes.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _owned_recipe_ids(uid: int):
+    """用户自己的菜谱 id 子查询，用于批量操作时校验所有权"""
+    return select(Recipes.id).where(Recipes.uid == uid)
+
+
+def delete_ingredients(db: Session, uid: int, ids: list[int]) -> int:
+    """一条 DELETE 删除属于该用户菜谱的原材料，不属于的 id 会被忽略
+
+    Returns:
+        int: 实际删除的条数
+    """
+    if not ids:
+        return 0
+    _touch_recipes_of(db, RecipeIngredient, uid, ids)
+    res = db.exec(
+        delete(RecipeIngredient)  # type: ignore
+        .where(
+            RecipeIngredient.id.in_(ids),  # type: ignore
+            RecipeIngredient.recipe_id.in_(_owned_recipe_ids(uid)),  # type: ignore
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return res.rowcount
+
+
+def delete_steps(db: Session, uid: int, ids: list[int]) -> int:
+    """一条 DELETE 删除属于该用户菜谱的步骤，不属于的 id 会被忽略
+
+    Returns:
+        int: 实际删除的条数
+    """
+    if not ids:
+        return 0
+    _touch_recipes_of(db, RecipeSteps, uid, ids)
+    res = db.exec(
+        delete(RecipeSteps)  # type: ignore
+        .where(
+            RecipeSteps.id.in_(ids),  # type: ignore
+            RecipeSteps.recipe_id.in_(_owned_recipe_ids(uid)),  # type: ignore
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return res.rowcount
+
+
+def insert_ingredients(db: Session, recipe_id: int, items: list[dict]) -> int:
+    """批量插入原材料（executemany），不返回新行的 id"""
+    if not items:
+        return 0
+    db.exec(
+        insert(RecipeIngredient),  # type: ignore
+        params=[{**item, "recipe_id": recipe_id} for item in items],
+    )
+    touch_recipe(db, recipe_id)
+    return len(items)
+
+
+def next_step_order(db: Session, recipe_id: int) -> int:
+    """排在菜谱最后一个步骤之后的序号"""
+    last = db.exec(
+        select(func.coalesce(func.max(RecipeSteps.order), 0)).where(
+            RecipeSteps.recipe_id == recipe_id
+        )
+    ).one()
+    return last + 1
+
+
+def insert_steps(db: Session, recipe_id: int, items: list[dict]) -> int:
+    """批量插入步骤（executemany），没有指定 order 的步骤依次排在已有步骤之后"""
+    if not items:
+        return 0
+    first = next_step_order(db, recipe_id)
+    rows = []
+    for i, item in enumerate(items):
+        row = {**item, "recipe_id": recipe_id}
+        if row.get("order") is None:
+            row["order"] = first + i
+        rows.append(row)
+    db.exec(insert(RecipeSteps), params=rows)  # type: ignore
+    touch_recipe(db, recipe_id)
+    return len(rows)
+
+
+def reorder_steps(db: Session, recipe_id: int, ids: list[int]) -> int:
+    """按 ids 的顺序把步骤的 order 设为 1..n，一条 UPDATE ... CASE 完成
+
+    Returns:
+        int: 更新的条数，小于 len(ids) 说明有步骤不属于该菜谱
+    """
+    if not ids:
+        return 0
+    res = db.exec(
+        update(RecipeSteps)  # type: ignore
+        .where(
+            RecipeSteps.recipe_id == recipe_id,
+            RecipeSteps.id.in_(ids),  # type: ignore
+        )
+        .values(
+            order=case(
+                {sid: i for i, sid in enumerate(ids, start=1)}, value=RecipeSteps.id
+            )
+        )
+        .execution_options(synchronize_session=False)
+    )
+    touch_recipe(db, recipe_id)
+    return res.rowcount
+
+
+def _count_key(private: bool, uid: int) -> str:
+    return f"private:{uid}" if private else "public"
+
+
+def _increment_count(db: Session, key: str, delta: int) -> int:
+    res = db.exec(
+        update(RecipeCounts)  # type: ignore
+        .where(RecipeCounts.key == key)
+        .values(count=RecipeCounts.count + delta)
+        .execution_options(synchronize_session=False)
+    )
+    return res.rowcount
+
+
+def adjust_recipe_count(db: Session, private: bool, uid: int, delta: int):
+    """创建、删除菜谱或修改公开状态时增减计数，与修改在同一个事务中提交
+
+    计数记录不存在表示数量为 0（迁移时由 reconcile_recipe_counts 写入全部计数），
+    此时插入一条；并发插入同一个键时唯一约束冲突，改为在对方的记录上增减
+    """
+    key = _count_key(private, uid)
+    if _increment_count(db, key, delta):
+        return
+    try:
+        with db.begin_nested():
+            db.exec(insert(RecipeCounts).values(key=key, count=delta))  # type: ignore
+    except IntegrityError:
+        _increment_count(db, key, delta)
+
+
+def reconcile_recipe_counts(db: Session) -> dict[str, int]:
+    """按菜谱表重新统计全部计数，修正计数表的偏差
+
+    先锁住已有的计数行再统计，与同时进行的增减串行；调用方负责提交
+
+    Returns:
+        dict[str, int]: 修正过的计数，键为计数键，值为新的数量
+    """
+    current = dict(
+        db.exec(select(RecipeCounts.key, RecipeCounts.count).with_for_update()).all()
+    )
+    actual = {
+        "public": db.exec(
+            select(func.count()).select_from(Recipes).where(Recipes.private == False)  # noqa: E712
+        ).one()
+    }
+    for uid, count in db.exec(
+        select(Recipes.uid, func.count())
+        .where(Recipes.private == True)  # noqa: E712
+        .group_by(Recipes.uid)
+    ).all():
+        actual[_count_key(True, uid)] = count
+    fixed = {
+        key: actual.get(key, 0)
+        for key in current.keys() | actual.keys()
+        if key not in current or actual.get(key, 0) != current[key]
+    }
+    for key, count in fixed.items():
+        if key in current:
+            db.exec(
+                update(RecipeCounts)  # type: ignore
+                .where(RecipeCounts.key == key)
+                .values(count=count)
+                .execution_options(synchronize_session=False)
+            )
+        else:
+            db.exec(insert(RecipeCounts).values(key=key, count=count))  # type: ignore
+    return fixed
+
+
+async def get_visible_recipe_count(db: AsyncSession, uid: int | None) -> int:
+    """可见的菜谱数：公开菜谱数，登录用户再加上自己的私有菜谱数
+
+    只读取计数表，缺少的计数按 0 处理
+    """
+    keys = ["public"]
+    if uid is not None:
+        keys.append(_count_key(True, uid))
+    counts = (
+        await db.exec(
+            select(RecipeCounts.count).where(RecipeCounts.key.in_(keys))  # type: ignore
+        )
+    ).all()
+    return sum(counts)
@@ -0,0 +1,279 @@
+"""
+进程内后台任务队列
+
+任务先写入 jobs 表再放入内存队列，由固定数量的 worker 执行，接口可以立即返回 202。
+任务处理函数是同步函数，在线程中执行，适合上传文件、生成缩略图等阻塞 IO。
+
+进程崩溃后，未完成的任务由 sweeper 从表中重新入队：
+等待中的任务直接入队，运行超过 job_stale_after 秒的任务视为执行它的进程已退出。
+多个进程同时运行时通过条件更新抢占任务，同一个任务只会被一个 worker 执行。
+参数指向本机文件的任务入队时记录机器（local=True），只有同一台机器的 sweeper 会恢复它。
+"""
+
+import asyncio
+import bisect
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+import orjson
+from sqlmodel import or_, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import get_settings
+from database import async_engine
+from database.models import JOB_DONE, JOB_FAILED, JOB_PENDING, JOB_RUNNING, Jobs
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# 任务类型 -> 处理函数，参数为 payload，返回值会保存为 result
+handlers: dict[str, Callable[[dict], Any]] = {}
+# 任务类型 -> 最终失败（不再重试）时的清理函数，参数为 payload
+failure_handlers: dict[str, Callable[[dict], Any]] = {}
+
+
+def register(kind: str, on_failure: Callable[[dict], Any] | None = None):
+    """注册任务处理函数，处理函数统一放在 tasks.py 中，由 main.py 启动时导入
+
+    ```python
+    @jobs.register("recipe_cover", on_failure=remove_staged_file)
+    def upload_cover(payload: dict): ...
+    ```
+
+    Args:
+        kind (str): 任务类型
+        on_failure (Callable[[dict], Any] | None, optional): 任务最终失败时调用，用于清理暂存文件等
+    """
+
+    def decorator(func):
+        handlers[kind] = func
+        if on_failure is not None:
+            failure_handlers[kind] = on_failure
+        return func
+
+    return decorator
+
+
+def _local_job():
+    """本机可以执行的任务：没有指定机器或指定的是本机"""
+    return or_(Jobs.host == None, Jobs.host == settings.job_host)  # noqa: E711
+
+
+class JobStats:
+    """队列指标：排队等待时间和执行时间的直方图、成功和失败次数"""
+
+    BUCKETS_S = (0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+    def __init__(self):
+        self.enqueued = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.wait = [0] * (len(self.BUCKETS_S) + 1)
+        self.run = [0] * (len(self.BUCKETS_S) + 1)
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    def observe(self, wait: float, run: float):
+        self.wait[bisect.bisect_left(self.BUCKETS_S, wait)] += 1
+        self.run[bisect.bisect_left(self.BUCKETS_S, run)] += 1
+        self.run_total += run
+        self.run_max = max(self.run_max, run)
+
+    def to_dict(self) -> dict:
+        labels = [f"<={b}s" for b in self.BUCKETS_S] + [f">{self.BUCKETS_S[-1]}s"]
+        finished = self.succeeded + self.failed
+        return {
+            "enqueued": self.enqueued,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "run_avg_s": self.run_total / finished if finished else 0.0,
+            "run_max_s": self.run_max,
+            "wait_histogram": dict(zip(labels, self.wait)),
+            "run_histogram": dict(zip(labels, self.run)),
+        }
+
+
+class JobQueue:
+    def __init__(self):
+        self.queue: asyncio.Queue[int] = asyncio.Queue()
+        # 已在本进程队列中或正在执行的任务，避免 sweeper 重复入队
+        self._known: set[int] = set()
+        self._running = 0
+        self._tasks: list[asyncio.Task] = []
+        self.stats = JobStats()
+
+    async def enqueue(
+        self,
+        db: AsyncSession,
+        kind: str,
+        payload: dict,
+        uid: int | None = None,
+        local: bool = False,
+    ) -> Jobs:
+        """保存任务并入队，会提交 db 的事务
+
+        Args:
+            db (AsyncSession): 数据库会话
+            kind (str): 任务类型，需要已经 register
+            payload (dict): 任务参数，必须可以 JSON 序列化
+            uid (int | None, optional): 提交任务的用户
+            local (bool, optional): 参数指向本机文件时为 True，只由本机执行和恢复
+        """
+        job = Jobs(
+            kind=kind,
+            payload=orjson.dumps(payload).decode(),
+            uid=uid,
+            host=settings.job_host if local else None,
+        )
+        db.add(job)
+        await db.commit()
+        self.stats.enqueued += 1
+        self._put(job.id)
+        return job
+
+    def _put(self, jid: int):
+        if jid not in self._known:
+            self._known.add(jid)
+            self.queue.put_nowait(jid)
+
+    async def _claim(self, db: AsyncSession, jid: int) -> Jobs | None:
+        """抢占任务：只有等待中的任务才能被改为运行中"""
+        res = await db.exec(
+            update(Jobs)  # type: ignore
+            .where(Jobs.id == jid, Jobs.status == JOB_PENDING, _local_job())  # type: ignore
+            .values(status=JOB_RUNNING, started=datetime.now(), attempts=Jobs.attempts + 1)
+        )
+        await db.commit()
+        if res.rowcount != 1:
+            return None
+        return await db.get(Jobs, jid)
+
+    async def _run(self, jid: int):
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            job = await self._claim(db, jid)
+            if job is None:
+                return
+            handler = handlers.get(job.kind)
+            start = time.monotonic()
+            wait = (job.started - job.created).total_seconds() if job.started else 0.0
+            try:
+                if handler is None:
+                    raise LookupError(f"unknown job kind: {job.kind}")
+                result = await asyncio.to_thread(handler, orjson.loads(job.payload))
+            except Exception as e:
+                logger.exception("job %s (%s) failed", job.id, job.kind)
+                if job.attempts < settings.job_max_attempts and handler is not None:
+                    # 放回等待状态，由 sweeper 稍后重试
+                    job.status = JOB_PENDING
+                    self.stats.retried += 1
+                else:
+                    job.status = JOB_FAILED
+                    self.stats.failed += 1
+                    await self._cleanup(job)
+                job.error = repr(e)
+            else:
+                job.status = JOB_DONE
+                job.result = orjson.dumps(result).decode()
+                job.error = None
+                self.stats.succeeded += 1
+            job.finished = datetime.now()
+            self.stats.observe(max(wait, 0.0), time.monotonic() - start)
+            db.add(job)
+            await db.commit()
+
+    async def _cleanup(self, job: Jobs):
+        """任务最终失败后调用注册的清理函数，清理失败只记录日志"""
+        on_failure = failure_handlers.get(job.kind)
+        if on_failure is None:
+            return
+        try:
+            await asyncio.to_thread(on_failure, orjson.loads(job.payload))
+        except Exception:
+            logger.exception("cleanup job %s (%s) failed", job.id, job.kind)
+
+    async def _worker(self):
+        while True:
+            jid = await self.queue.get()
+            self._running += 1
+            try:
+                await self._run(jid)
+            except Exception:
+                logger.exception("run job %s failed", jid)
+            finally:
+                self._running -= 1
+                self._known.discard(jid)
+                self.queue.task_done()
+
+    async def recover(self) -> int:
+        """把表中等待中和疑似中断的任务放入队列
+
+        Returns:
+            int: 新入队的任务数
+        """
+        stale = datetime.now() - timedelta(seconds=settings.job_stale_after)
+        async with AsyncSession(async_engine) as db:
+            await db.exec(
+                update(Jobs)  # type: ignore
+                .where(Jobs.status == JOB_RUNNING, Jobs.started < stale)  # type: ignore
+                .values(status=JOB_PENDING)
+            )
+            await db.commit()
+            ids = (
+                await db.exec(
+                    select(Jobs.id)
+                    .where(Jobs.status == JOB_PENDING, _local_job())
+                    .order_by(Jobs.id)  # type: ignore
+                    .limit(settings.job_recover_batch)
+                )
+            ).all()
+        count = 0
+        for jid in ids:
+            if jid not in self._known:
+                self._put(jid)
+                count += 1
+        return count
+
+    async def _sweeper(self):
+        while True:
+            try:
+                count = await self.recover()
+                if count:
+                    logger.info("recovered %d jobs", count)
+            except Exception:
+                logger.exception("recover jobs failed")
+            await asyncio.sleep(settings.job_poll_interval)
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self._worker()) for _ in range(settings.job_workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def metrics(self) -> dict:
+        return {
+            "workers": settings.job_workers,
+            "depth": self.queue.qsize(),
+            "running": self._running,
+            **self.stats.to_dict(),
+        }
+
+
+job_queue = JobQueue()
+
+
+async def get_job(db: AsyncSession, jid: int, uid: int | None = None) -> Jobs | None:
+    """查询任务，指定 uid 时只能查询自己提交的任务"""
+    sql = select(Jobs).where(Jobs.id == jid)
+    if uid is not None:
+        sql = sql.where(Jobs.uid == uid)
+    return (await db.exec(sql)).first()
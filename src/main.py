@@ -1,3 +1,5 @@
+import asyncio
+from contextlib import asynccontextmanager
 import logging
 import time
 from fastapi import FastAPI, Response
@@ -13,7 +15,46 @@ from database import engine
 SQLModel.metadata.create_all(engine)
 # endregion
 
-app = FastAPI()
+
+async def log_pool_status(interval: int):
+    """后台任务：定时输出连接池状态"""
+    from database import get_pool_status
+
+    while True:
+        await asyncio.sleep(interval)
+        logging.getLogger("database.pool").info("pool status: %s", get_pool_status())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    import auth
+    from database import async_engine, pool, post_search, settings
+    from jobs import job_queue
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(post_search.setup)
+    await pool.warm_up(
+        async_engine,
+        settings.db_pool_size if settings.db_pool_warmup < 0 else settings.db_pool_warmup,
+    )
+    tasks: list[asyncio.Task] = []
+    if settings.db_pool_log_interval > 0:
+        tasks.append(asyncio.create_task(log_pool_status(settings.db_pool_log_interval)))
+    if auth.settings.auth_mode == "stateless":
+        # 先完成一次同步，避免启动时放行已吊销的令牌
+        await auth.revocations.refresh()
+        tasks.append(asyncio.create_task(auth.revocation_refresher()))
+    if auth.settings.token_purge_interval > 0:
+        tasks.append(asyncio.create_task(auth.token_purger()))
+    if settings.job_workers > 0:
+        job_queue.start()
+    yield
+    for task in tasks:
+        task.cancel()
+    await job_queue.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.add_middleware(
     CORSMiddleware,
@@ -39,5 +80,6 @@ async def add_process_time_header(request: Request, call_next):
 
 
 from router import router
+import tasks  # noqa: F401 注册后台任务的处理函数
 
 app.include_router(router)
@@ -16,6 +16,10 @@ T = TypeVar('T', bound=BaseModel)
 
 class TokenData(BaseModel):
     uid: int
+    jti: str | None = None
+    role_id: int | None = None
+    iat: float | None = None
+    exp: float | None = None
     ip: str | None = None
     user_agent: str | None = None
     desc: str | None = None
@@ -24,6 +28,8 @@ class CurrentUser(BaseModel):
     user: Users
     token: str
     token_data: TokenData
+    # 无状态模式下 user 只包含令牌中的 id 和 role_id
+    stateless: bool = False
     
     # class Config:
     #     arbitrary_types_allowed = True
\ No newline at end of file
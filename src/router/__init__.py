@@ -1,12 +1,13 @@
 from fastapi import APIRouter
 
 router = APIRouter(prefix="/api")
-from . import user, posts
+from . import user, posts, jobs, recipe
 
 routers = [
     user.router,
-    posts.router
-    # recipe.router
+    posts.router,
+    jobs.router,
+    recipe.router,
 ]
 for r in routers:
     router.include_router(r)
\ No newline at end of file
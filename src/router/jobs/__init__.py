@@ -0,0 +1,5 @@
+from fastapi import APIRouter
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+from . import main
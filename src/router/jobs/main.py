@@ -0,0 +1,25 @@
+from fastapi import Depends
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from auth import get_user
+from database import get_async_db
+from jobs import get_job
+from models import CurrentUser
+from utils import resp_err, resp_succ
+from . import router
+
+
+@router.get("/{jid}")
+async def get_job_status(
+    jid: int,
+    db: AsyncSession = Depends(get_async_db),
+    usr: CurrentUser = Depends(get_user),
+):
+    """
+    查询后台任务状态，管理员可以查询所有任务，其他用户只能查询自己提交的任务
+    """
+    uid = None if usr.user.role_id >= 4 else usr.user.id
+    job = await get_job(db, jid, uid)
+    if job is None:
+        return resp_err(code=404, detail="任务不存在")
+    return resp_succ(job.to_resp())
@@ -1,31 +1,128 @@
 import datetime
+import hashlib
 from typing import Optional
-from fastapi import Depends, Query
-from sqlmodel import Session, or_, select
+from fastapi import Depends, Query, Request, Response
+import orjson
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from sqlmodel import and_, or_, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from auth import get_user, get_user_optional
-from database import get_db
-from database.models import Posts
+from cache import create_response_cache
+from config import get_settings
+from database import get_async_db, post_search
+from database.models import POST_EXCERPT_LENGTH, Posts, Users
 from models import CurrentUser
 from router.posts.models import CreatePost
-from utils import resp_err, resp_succ
+from utils import (
+    cache_headers,
+    decode_cursor,
+    encode_cursor,
+    is_not_modified,
+    make_etag,
+    not_modified,
+    resp_err,
+    resp_succ,
+)
 from . import router
 
+settings = get_settings()
+
+# 匿名访问的帖子列表缓存，帖子有任何变更都会递增版本号使其失效
+posts_cache = create_response_cache(
+    settings.cache_backend, settings.posts_cache_bytes, settings.redis_url
+)
+CACHE_NAMESPACE = "posts"
+
+# 可排序字段，"-" 前缀表示倒序
+SORT_FIELDS = {
+    "id": Posts.id,
+    "created": Posts.created,
+    "updated": Posts.updated,
+    "title": Posts.title,
+}
+
+
+def _list_select():
+    """列表查询：一次联表取作者名，摘要在数据库中截取，不传输完整内容
+
+    列名与 Posts.to_resp() 的字段一致
+    """
+    return select(
+        Posts.id,
+        Posts.title,
+        func.substr(Posts.content, 1, POST_EXCERPT_LENGTH).label("content"),
+        Posts.created,
+        Posts.updated,
+        Posts.status,
+        Posts.private,
+        Users.name.label("user"),  # type: ignore
+    ).join(Users, Users.id == Posts.uid)  # type: ignore
+
+
+def _cursor_value(field: str, value):
+    """游标中的排序键还原为列的类型，类型不符时抛出 ValueError"""
+    if field == "id":
+        if type(value) is not int:
+            raise ValueError("invalid cursor")
+        return value
+    if not isinstance(value, str):
+        raise ValueError("invalid cursor")
+    if field in ("created", "updated"):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
 
 @router.get("/all")
-def all_posts(
+async def all_posts(
     page: int = Query(1),
-    limit: int = Query(10),
+    limit: int = Query(10, ge=1, le=100),
     mine: bool = Query(False),
     search: str = Query(None),
     sort: str = Query("created"),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(
+        None, description="游标分页，首页传空字符串，之后传上一页返回的 cursor"
+    ),
+    db: AsyncSession = Depends(get_async_db),
     console: bool = Query(False),
     usr: Optional[CurrentUser] = Depends(get_user_optional),
 ):
     """Get all posts"""
+    search = search.strip() if search else None
+    if usr is not None or console or settings.posts_cache_ttl <= 0:
+        return await _list_posts(page, limit, search, sort, cursor, console, usr, db)
+
+    # 匿名请求的结果只取决于查询参数，可以直接复用序列化后的响应
+    generation = await posts_cache.generation(CACHE_NAMESPACE)
+    params = orjson.dumps([page, limit, search, sort, cursor])
+    cache_key = f"posts:all:{generation}:{hashlib.sha1(params).hexdigest()}"
+    body = await posts_cache.get(cache_key)
+    if body is not None:
+        return Response(content=body, media_type="application/json")
+    resp = await _list_posts(page, limit, search, sort, cursor, console, usr, db)
+    if resp.status_code == 200:
+        await posts_cache.set(cache_key, bytes(resp.body), settings.posts_cache_ttl)
+    return resp
+
+
+async def _list_posts(
+    page: int,
+    limit: int,
+    search: Optional[str],
+    sort: str,
+    cursor: Optional[str],
+    console: bool,
+    usr: Optional[CurrentUser],
+    db: AsyncSession,
+):
     page = page - 1
+    desc = sort.startswith("-")
+    field = sort.lstrip("-")
+    sort_col = SORT_FIELDS.get(field)
+    if sort_col is None:
+        return resp_err(detail=f"Unsupported sort: {sort}", code=400)
 
-    sql = select(Posts)
+    sql = _list_select()
     if not console:
         sql = sql.where(Posts.status == 1)
         zusr_sql = Posts.private == False
@@ -36,36 +133,67 @@ def all_posts(
         sql = sql.where(Posts.uid == usr.user.id)
 
     if search:
-        sql_where = or_(search in Posts.title, search in Posts.content)
-        sql = sql.where(sql_where)
+        # 按相关度排序，只支持页码分页
+        if cursor is not None:
+            return resp_err(detail="Cursor is not supported with search", code=400)
+        sql, relevance = post_search.filter(sql, search)
+        sql = sql.order_by(relevance, Posts.id.desc())  # type: ignore
+    # id 兜底保证排序稳定
+    elif desc:
+        sql = sql.order_by(sort_col.desc(), Posts.id.desc())  # type: ignore
+    else:
+        sql = sql.order_by(sort_col.asc(), Posts.id.asc())  # type: ignore
 
-    posts = db.exec(
-        sql.order_by(sort).offset(page * limit).limit(limit)
-    ).all()
-    return resp_succ([post.to_resp() for post in posts])
+    if cursor is None:
+        posts = (await db.exec(sql.offset(page * limit).limit(limit))).all()
+        return resp_succ([post._asdict() for post in posts])
+
+    # 游标分页：从上一页最后一行的 (排序键, id) 之后继续取，深翻页与首页开销相同
+    if cursor:
+        try:
+            c_sort, c_value, c_id = decode_cursor(cursor)
+            if c_sort != sort or type(c_id) is not int:
+                raise ValueError("invalid cursor")
+            c_value = _cursor_value(field, c_value)
+        except (TypeError, ValueError):
+            return resp_err(detail="Invalid cursor", code=400)
+        if desc:
+            after = or_(sort_col < c_value, and_(sort_col == c_value, Posts.id < c_id))
+        else:
+            after = or_(sort_col > c_value, and_(sort_col == c_value, Posts.id > c_id))
+        sql = sql.where(after)
+    posts = (await db.exec(sql.limit(limit + 1))).all()
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        last = posts[-1]
+        next_cursor = encode_cursor(sort, getattr(last, field), last.id)
+    return resp_succ([post._asdict() for post in posts], cursor=next_cursor)
 
 @router.put("/create")
-def create_post(
+async def create_post(
     new_post_conf: CreatePost,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     usr: CurrentUser = Depends(get_user),
 ):
     """Create a post"""
     new_post = Posts(**new_post_conf.dict(), uid=usr.user.id)
     db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
+    await post_search.index(db, new_post)
+    await db.commit()
+    await posts_cache.bump(CACHE_NAMESPACE)
+    await db.refresh(new_post, ["user"])
     return resp_succ(new_post.to_resp())
     
 @router.post("/update")
-def update_post(
+async def update_post(
     new_post: CreatePost,
     pid: int = Query(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     usr: CurrentUser = Depends(get_user),
 ):
     """Update a post"""
-    post = db.get(Posts, pid)
+    post = await db.get(Posts, pid, options=[selectinload(Posts.user)])  # type: ignore
     if not post:
         return resp_err(detail="Post not found", code=404)
     post.title = new_post.title
@@ -73,25 +201,55 @@ def update_post(
     post.private = new_post.private
     post.status = new_post.status
     post.updated = datetime.datetime.now()
-    db.commit()
-    db.refresh(post)
+    await post_search.index(db, post)
+    await db.commit()
+    await posts_cache.bump(CACHE_NAMESPACE)
     return resp_succ(post.to_resp())
     
     
 @router.delete("/{pid}")
-def delete_post(
+async def delete_post(
     pid: int,
+    db: AsyncSession = Depends(get_async_db),
+    usr: CurrentUser = Depends(get_user),
 ):
     """Delete a post"""
-    pass
+    post = await db.get(Posts, pid)
+    if not post or post.uid != usr.user.id:
+        return resp_err(detail="Post not found", code=404)
+    await post_search.remove(db, pid)
+    await db.delete(post)
+    await db.commit()
+    await posts_cache.bump(CACHE_NAMESPACE)
+    return resp_succ(detail="删除成功")
+
 @router.get("/{pid}")
-def get_post(
+async def get_post(
     pid: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     usr: Optional[CurrentUser] = Depends(get_user_optional),
 ):
-    """Get a post"""
-    post = db.get(Posts, pid)
+    """Get a post
+
+    支持 If-None-Match / If-Modified-Since，先只查询修改时间和作者名判断是否 304，
+    客户端缓存有效时不加载帖子内容
+    """
+    row = (
+        await db.exec(
+            select(Posts.updated, Users.name)
+            .join(Users, Users.id == Posts.uid)  # type: ignore
+            .where(Posts.id == pid)
+        )
+    ).first()
+    if row is None:
+        return resp_err(detail="Post not found", code=404)
+    headers = cache_headers(make_etag(pid, row.updated, row.name), row.updated)
+    if is_not_modified(request.headers, headers["ETag"], row.updated):
+        return not_modified(headers)
+    post = await db.get(Posts, pid, options=[selectinload(Posts.user)])  # type: ignore
     if not post:
         return resp_err(detail="Post not found", code=404)
-    return resp_succ(post.to_resp(True))
\ No newline at end of file
+    resp = resp_succ(post.to_resp(True))
+    resp.headers.update(headers)
+    return resp
\ No newline at end of file
@@ -1,10 +1,12 @@
 from typing import Union
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func, literal, update
 from sqlmodel import Session, and_, or_, select
 
 from auth import get_user, get_user_optional
 from database import get_db
 from database.models import RecipeGroups
+from database.utils import touch_group_recipes
 from models import CurrentUser
 from router.recipe.models import CreateRecipeGroup
 from utils import resp_err, resp_succ
@@ -13,6 +15,43 @@ from . import router as recipe_router
 
 router = APIRouter(tags=["Recipe", "RecipeGroup"])
 
+# 物化路径的最大长度，与 RecipeGroups.path 的列宽一致
+PATH_MAX_LENGTH = 255
+
+
+def group_path(parent_path: str | None, group_id: int) -> str:
+    """分组的物化路径，根分组为 "/id/"，子分组在父分组的路径后追加 "id/" """
+    return f"{parent_path or '/'}{group_id}/"
+
+
+def path_ids(path: str) -> list[int]:
+    """从物化路径解析出从根到自身的分组 id"""
+    return [int(i) for i in path.strip("/").split("/") if i]
+
+
+def build_tree(groups: list[RecipeGroups]) -> list[dict]:
+    """把按 path 排序的分组组装成嵌套结构，父分组不在列表中的作为根节点"""
+    nodes: dict[int, dict] = {}
+    roots = []
+    for g in groups:
+        node = {**g.to_resp(), "children": []}
+        nodes[g.id] = node
+        parent = nodes.get(g.parent_id) if g.parent_id else None
+        if parent is None:
+            roots.append(node)
+        else:
+            parent["children"].append(node)
+    return roots
+
+
+def _max_path_length(db: Session, path: str) -> int:
+    """子树中最长的路径长度"""
+    return db.exec(
+        select(func.max(func.length(RecipeGroups.path))).where(
+            RecipeGroups.path.startswith(path)  # type: ignore
+        )
+    ).one() or len(path)
+
 
 def get_recipe_group(
     group_id: int, db: Session = Depends(get_db), usr: CurrentUser = Depends(get_user)
@@ -80,20 +119,64 @@ async def get_group_children(
     return resp_succ(group_list)
 
 
+@router.get("/tree")
+async def get_group_tree(
+    group: Union[RecipeGroups, None] = Depends(get_recipe_group_optional),
+    usr: CurrentUser = Depends(get_user),
+    db: Session = Depends(get_db),
+):
+    """
+    以嵌套结构返回分组树，指定 group_id 时只返回该分组及其子树，一次查询完成
+    """
+    sql = select(RecipeGroups).where(RecipeGroups.uid == usr.user.id)
+    if group:
+        sql = sql.where(RecipeGroups.path.startswith(group.path))  # type: ignore
+    groups = db.exec(sql.order_by(RecipeGroups.path)).fetchall()  # type: ignore
+    return resp_succ(build_tree(list(groups)), total=len(groups))
+
+
+@router.get("/ancestors")
+async def get_group_ancestors(
+    group: RecipeGroups = Depends(get_recipe_group),
+    db: Session = Depends(get_db),
+):
+    """
+    从根分组到当前分组的路径（面包屑），一次查询完成
+    """
+    ids = path_ids(group.path)
+    groups = db.exec(
+        select(RecipeGroups)
+        .where(RecipeGroups.id.in_(ids))  # type: ignore
+        .order_by(func.length(RecipeGroups.path))
+    ).fetchall()
+    return resp_succ([g.to_resp() for g in groups])
+
+
 @router.post("/create")
 async def create_group(
     group: CreateRecipeGroup,
-    usr: CurrentUser = Depends(get_user_optional),
+    usr: CurrentUser = Depends(get_user),
     db: Session = Depends(get_db),
 ):
+    parent_path = None
     if group.parent_id:
         parent_group = db.exec(
-            select(RecipeGroups).where(RecipeGroups.id == group.parent_id)
+            select(RecipeGroups).where(
+                RecipeGroups.id == group.parent_id, RecipeGroups.uid == usr.user.id
+            )
         ).one_or_none()
         if not parent_group:
             return resp_err(detail="父文件夹不存在")
+        parent_path = parent_group.path
     new_group = RecipeGroups(uid=usr.user.id, **group.model_dump())
     db.add(new_group)
+    # 路径包含自身的 id，需要先插入拿到 id
+    db.flush()
+    new_group.path = group_path(parent_path, new_group.id)
+    if len(new_group.path) > PATH_MAX_LENGTH:
+        db.rollback()
+        return resp_err(detail="文件夹层级过深")
+    db.add(new_group)
     db.commit()
     db.refresh(new_group)
     return resp_succ(new_group.to_resp())
@@ -105,19 +188,41 @@ async def update_group(
     group: RecipeGroups = Depends(get_recipe_group),
     db: Session = Depends(get_db),
 ):
-    if opts.parent_id:
+    if opts.parent_id and opts.parent_id != group.parent_id:
         if opts.parent_id == group.id:
             return resp_err(detail="不能将文件夹移动到自身")
 
         # 检查父文件夹是否存在
         parent_group = db.exec(
-            select(RecipeGroups).where(RecipeGroups.id == opts.parent_id)
+            select(RecipeGroups).where(
+                RecipeGroups.id == opts.parent_id, RecipeGroups.uid == group.uid
+            )
         ).one_or_none()
         if not parent_group:
             return resp_err(detail="父文件夹不存在")
+        # 新的父文件夹在自己的子树中会形成环
+        if parent_group.path.startswith(group.path):
+            return resp_err(detail="不能将文件夹移动到自己的子文件夹中")
+        old_path = group.path
+        new_path = group_path(parent_group.path, group.id)
+        depth = _max_path_length(db, old_path) - len(old_path)
+        if len(new_path) + depth > PATH_MAX_LENGTH:
+            return resp_err(detail="文件夹层级过深")
+        # 一条 UPDATE 替换整个子树（包括自身）的路径前缀
+        db.exec(
+            update(RecipeGroups)  # type: ignore
+            .where(RecipeGroups.path.startswith(old_path))  # type: ignore
+            .values(
+                path=literal(new_path)
+                + func.substr(RecipeGroups.path, len(old_path) + 1)
+            )
+            .execution_options(synchronize_session=False)
+        )
         group.parent_id = opts.parent_id
-    if opts.name:
+        group.path = new_path
+    if opts.name and opts.name != group.name:
         group.name = opts.name
+        touch_group_recipes(db, group.id)
     if opts.desc:
         group.desc = opts.desc
     if opts.status:
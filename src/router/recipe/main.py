@@ -1,34 +1,84 @@
+import asyncio
 import datetime
-import hashlib
 import os
 from typing import Optional
-from fastapi import Depends, Query, Response, UploadFile
-from sqlalchemy import func
+from fastapi import (
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
+from fastapi.responses import RedirectResponse, StreamingResponse
+from sqlalchemy.orm import joinedload, selectinload
 from sqlmodel import Session, and_, or_, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from auth import get_user, get_user_optional
-from config import Settings, get_settings
-from database import get_db
+from cache import create_response_cache
+from config import get_settings
+from database import get_async_db, get_db
 from database.models import RecipeGroups, RecipeIngredient, RecipeSteps, Recipes
-from database.utils import get_ingredient, get_recipe, get_step
+from database.utils import (
+    adjust_recipe_count,
+    delete_ingredients,
+    delete_steps,
+    get_ingredient,
+    get_recipe,
+    get_step,
+    get_visible_recipe_count,
+    insert_ingredients,
+    insert_steps,
+    next_step_order,
+    reorder_steps,
+    touch_recipe,
+)
 from models import CurrentUser
-from .models import CreateRecipe, CreateIngredient, CreateStep
-from utils import resp_err, resp_succ
+from .models import (
+    CreateRecipe,
+    CreateIngredient,
+    CreateStep,
+    PresignCover,
+    ReorderSteps,
+)
+from utils import (
+    decode_cursor,
+    encode_cursor,
+    local_file_response,
+    parse_range,
+    resp_err,
+    resp_succ,
+)
 from . import router
-from api import cos
+from api import variants
+from api.storage import RangeNotSatisfiable, get_storage, stage_upload
+from jobs import job_queue
+
+settings = get_settings()
+
+# 菜谱详情缓存，键中带有菜谱的版本号，任何修改都会使其失效
+recipe_cache = create_response_cache(
+    settings.cache_backend, settings.recipe_cache_bytes, settings.redis_url
+)
 
 
 @router.get("/list")
 async def list_recipes(
-    db: Session = Depends(get_db),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="上一页返回的 cursor，首页不传"),
+    gid: Optional[int] = Query(None, description="分组ID"),
+    status: Optional[int] = Query(None, ge=0, le=4),
+    uid: Optional[int] = Query(None, description="作者ID"),
+    db: AsyncSession = Depends(get_async_db),
     usr: Optional[CurrentUser] = Depends(get_user_optional),
 ):
     """
-    获取全部菜谱
-    """
-    sql = select(Recipes)
-    count_sql = select(func.count()).select_from(Recipes)
+    获取菜谱列表，按 id 倒序游标分页
 
+    没有筛选条件时 total 为可见菜谱总数（读取计数表，不做 count(*)），有筛选条件时不返回
+    """
     if usr is not None:
         # 已登录用户
         sql_where = or_(
@@ -41,12 +91,47 @@ async def list_recipes(
             Recipes.private == False,
         )  # 公开菜谱
 
-    sql = sql.where(sql_where)
-    count_sql = count_sql.where(sql_where)
-
-    all_counts = db.exec(count_sql).one()
-    data = db.exec(sql).all()
-    return resp_succ([item.to_resp() for item in data], total=all_counts)
+    sql = (
+        select(Recipes)
+        .options(joinedload(Recipes.user), joinedload(Recipes.group))  # type: ignore
+        .where(sql_where)
+    )
+    filtered = False
+    for col, value in (
+        (Recipes.group_id, gid),
+        (Recipes.status, status),
+        (Recipes.uid, uid),
+    ):
+        if value is not None:
+            sql = sql.where(col == value)
+            filtered = True
+    if cursor:
+        try:
+            (last_id,) = decode_cursor(cursor)
+            # bool 是 int 的子类，不能用 isinstance
+            if type(last_id) is not int:
+                raise ValueError("invalid cursor")
+        except (TypeError, ValueError):
+            return resp_err(detail="Invalid cursor", code=400)
+        sql = sql.where(Recipes.id < last_id)
+    data = (await db.exec(sql.order_by(Recipes.id.desc()).limit(limit + 1))).all()  # type: ignore
+    next_cursor = None
+    if len(data) > limit:
+        data = data[:limit]
+        next_cursor = encode_cursor(data[-1].id)
+    total = None
+    if not filtered:
+        total = await get_visible_recipe_count(db, usr.user.id if usr else None)
+    return resp_succ([item.to_resp() for item in data], total=total, cursor=next_cursor)
+
+
+def _own_group(db: Session, gid: int, uid: int) -> bool:
+    return (
+        db.exec(
+            select(RecipeGroups.id).where(RecipeGroups.id == gid, RecipeGroups.uid == uid)
+        ).first()
+        is not None
+    )
 
 
 @router.put("/create")
@@ -58,11 +143,20 @@ def create_recipe(
     """
     创建菜谱
     """
-    new_recipe = Recipes(uid=usr.user.id, **recipe.model_dump())
+    if not recipe.name:
+        return resp_err(code=400, detail="名称不能为空")
+    if recipe.gid is not None and not _own_group(db, recipe.gid, usr.user.id):
+        return resp_err("分组不存在或您没有权限访问", code=404)
+    new_recipe = Recipes(
+        uid=usr.user.id,
+        group_id=recipe.gid,
+        **recipe.model_dump(exclude={"gid"}, exclude_none=True),
+    )
     db.add(new_recipe)
+    adjust_recipe_count(db, bool(new_recipe.private), usr.user.id, 1)
     db.commit()
     db.refresh(new_recipe)
-    return resp_succ(new_recipe)
+    return resp_succ(new_recipe.to_resp())
 
 
 @router.post("/update")
@@ -75,88 +169,256 @@ def update_recipe(
     更新菜谱
     """
     if opts.gid is not None:
-        recipe_group = db.exec(
-            select(RecipeGroups)
-            .where(RecipeGroups.id == opts.gid)
-            .where(RecipeGroups.uid == recipe.uid)
-        ).one_or_none()
-        if not recipe_group:
+        if not _own_group(db, opts.gid, recipe.uid):
             return resp_err(
                 "分组不存在或您没有权限访问",
                 code=404,
             )
-        recipe.gid = opts.gid
+        recipe.group_id = opts.gid
     if opts.name is not None:
         recipe.name = opts.name
     if opts.desc is not None:
         recipe.desc = opts.desc
     if opts.status is not None:
         recipe.status = opts.status
-    if opts.private is not None:
+    if opts.private is not None and opts.private != recipe.private:
+        adjust_recipe_count(db, recipe.private, recipe.uid, -1)
+        adjust_recipe_count(db, opts.private, recipe.uid, 1)
         recipe.private = opts.private
     recipe.updated = datetime.datetime.now()
     db.add(recipe)
+    touch_recipe(db, recipe.id)
     return resp_succ(recipe.to_resp())
 
 
-@router.get("/item")
-def get_recipe_detail(recipe: Recipes = Depends(get_recipe)):
+async def _load_recipe_detail(db: AsyncSession, recipe_id: int) -> dict | None:
+    """加载菜谱详情：作者和分组联表查询，原材料和评论 selectin 加载，
+    步骤在数据库中排序，共 4 条查询，与原材料和步骤的数量无关
+    """
+    recipe = (
+        await db.exec(
+            select(Recipes)
+            .options(
+                joinedload(Recipes.user),  # type: ignore
+                joinedload(Recipes.group),  # type: ignore
+                selectinload(Recipes.ingredients),  # type: ignore
+                selectinload(Recipes.comments),  # type: ignore
+            )
+            .where(Recipes.id == recipe_id)
+        )
+    ).first()
+    if recipe is None:
+        return None
+    steps = (
+        await db.exec(
+            select(RecipeSteps)
+            .where(RecipeSteps.recipe_id == recipe_id)
+            .order_by(RecipeSteps.order, RecipeSteps.id)  # type: ignore
+        )
+    ).all()
     data = recipe.to_resp()
     data.update(
         {
             "ingredients": [ingredient.to_resp() for ingredient in recipe.ingredients],
-            "steps": [step.to_resp() for step in recipe.all_steps()],
+            "steps": [step.to_resp() for step in steps],
             "comments": [comment.to_resp() for comment in recipe.comments],
         }
     )
-    return resp_succ(data)
+    return data
+
+
+@router.get("/item")
+async def get_recipe_detail(
+    recipe_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    usr: CurrentUser = Depends(get_user),
+):
+    """
+    菜谱详情，包括原材料、步骤和评论
+
+    先只查询版本号校验权限，缓存命中时直接返回序列化好的响应
+    """
+    version = (
+        await db.exec(
+            select(Recipes.version).where(
+                Recipes.id == recipe_id, Recipes.uid == usr.user.id
+            )
+        )
+    ).first()
+    if version is None:
+        return resp_err(code=404, detail="菜谱不存在或没有权限访问")
+    cache_key = f"recipe:detail:{recipe_id}:{version}"
+    if settings.recipe_cache_ttl > 0:
+        body = await recipe_cache.get(cache_key)
+        if body is not None:
+            return Response(content=body, media_type="application/json")
+    data = await _load_recipe_detail(db, recipe_id)
+    if data is None:
+        return resp_err(code=404, detail="菜谱不存在或没有权限访问")
+    resp = resp_succ(data)
+    if settings.recipe_cache_ttl > 0:
+        await recipe_cache.set(cache_key, bytes(resp.body), settings.recipe_cache_ttl)
+    return resp
 
 
 @router.delete("/delete")
 def delete_recipe(recipe: Recipes = Depends(get_recipe), db: Session = Depends(get_db)):
     db.delete(recipe)
+    adjust_recipe_count(db, recipe.private, recipe.uid, -1)
     return resp_succ(detail="删除成功")
 
 
+def _cover_prefix(recipe: Recipes) -> str:
+    return os.path.join("recipe", f"user_{recipe.uid}", f"recipe_{recipe.id}", "cover")
+
+
 @router.post("/cover")
-def update_recipe_cover(
+async def update_recipe_cover(
     file: UploadFile,
-    settings: Settings = Depends(get_settings),
+    usr: CurrentUser = Depends(get_user),
+    recipe: Recipes = Depends(get_recipe),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    上传封面，文件暂存到本地后由后台任务上传，立即返回 202 和任务信息
+
+    文件名为内容的 md5，相同封面不会重复上传；通过 /api/jobs/{id} 查询进度
+    """
+    path, md5, size = await asyncio.to_thread(
+        stage_upload, file.file, os.path.join(settings.temp_dir, "uploads")
+    )
+    job = await job_queue.enqueue(
+        db,
+        "recipe_cover",
+        {
+            "path": path,
+            "md5": md5,
+            "size": size,
+            "prefix": _cover_prefix(recipe),
+            "recipe_id": recipe.id,
+        },
+        uid=usr.user.id,
+        local=True,
+    )
+    return resp_succ(job.to_resp(), detail="已提交", code=202)
+
+
+@router.post("/cover/presign")
+def presign_recipe_cover(
+    opts: PresignCover,
     usr: CurrentUser = Depends(get_user),
     recipe: Recipes = Depends(get_recipe),
 ):
-    # 生成文件名
-    file_name = hashlib.md5(file.file.read()).hexdigest() + ".png"
-    cos_path = os.path.join(
-        "recipe",
-        f"user_{usr.user.id}",
-        f"recipe_{recipe.id}",
-        "cover",
-        file_name,
+    """
+    获取封面的预签名上传地址，客户端 PUT 上传后调用 /cover/confirm
+
+    相同内容的封面已存在时不返回上传地址，直接调用 /cover/confirm 即可
+    """
+    storage = get_storage()
+    cos_path = os.path.join(_cover_prefix(recipe), opts.md5 + ".png")
+    if storage.head(cos_path) is not None:
+        return resp_succ({"exists": True})
+    url = storage.presign_put(cos_path, "image/png")
+    if url is None:
+        return resp_err(code=400, detail="当前存储不支持直传，请使用 /cover 上传")
+    return resp_succ(
+        {
+            "exists": False,
+            "url": url,
+            "method": "PUT",
+            "headers": {"Content-Type": "image/png"},
+            "expires": settings.cos_presign_expires,
+        }
     )
-    # 重置
-    file.file.seek(0)
-    local_path = settings.temp_dir + file_name
-    # 临时保存
-    os.makedirs(os.path.dirname(local_path), exist_ok=True)
-    with open(local_path, "wb") as f:
-        f.write(file.file.read())
-    # 上传
-    cos.upload_file(local_path, cos_path)
-    # region 删除缓存文件
-    if os.path.exists(local_path):
-        os.remove(local_path)
-    # endregion
+
+
+@router.post("/cover/confirm")
+def confirm_recipe_cover(
+    opts: PresignCover,
+    background_tasks: BackgroundTasks,
+    usr: CurrentUser = Depends(get_user),
+    recipe: Recipes = Depends(get_recipe),
+    db: Session = Depends(get_db),
+):
+    """
+    确认预签名上传完成，校验内容的 md5 后设置为封面
+    """
+    storage = get_storage()
+    cos_path = os.path.join(_cover_prefix(recipe), opts.md5 + ".png")
+    head = storage.head(cos_path)
+    if head is None:
+        return resp_err(code=404, detail="文件未上传")
+    # 普通上传的 ETag 就是内容的 md5，不一致说明上传的内容与声明的不符
+    if (head.etag or "").strip('"') != opts.md5:
+        storage.delete(cos_path)
+        return resp_err(code=400, detail="文件校验失败")
+    if recipe.cover != cos_path:
+        background_tasks.add_task(variants.generate_variants, cos_path)
+        touch_recipe(db, recipe.id)
     recipe.cover = cos_path
     return resp_succ(detail="上传成功")
 
 
 @router.get("/cover")
-def get_recipe_cover(recipe: Recipes = Depends(get_recipe)):
+def get_recipe_cover(
+    request: Request,
+    redirect: bool = Query(True, description="redirect 模式下是否 302 跳转，否则返回地址"),
+    width: Optional[int] = Query(None, ge=1, description="缩略图宽度"),
+    format: Optional[str] = Query(
+        None, pattern="^(webp|jpeg|png)$", description="缩略图格式"
+    ),
+    recipe: Recipes = Depends(get_recipe),
+):
+    """
+    获取菜谱封面，支持 Range 请求（206）
+
+    指定 width 或 format 时返回缩略图，宽度向上取整到配置的档位，缺失时立即生成。
+    cos_delivery 为 redirect 且存储支持预签名时返回预签名地址，内容不经过接口；
+    否则有本地文件（本地存储或磁盘缓存）时直接 sendfile，没有时流式转发
+    """
     if not recipe.cover:
         return resp_err(code=404, detail="封面不存在")
-    cover = cos.get_file(recipe.cover)
-    return Response(content=cover, media_type="image/png")
+    storage = get_storage()
+    byte_range = parse_range(request.headers.get("range"))
+    try:
+        cover, media_type = recipe.cover, "image/png"
+        if width is not None or format is not None:
+            fmt = format or settings.cover_variant_formats[0]
+            cover = variants.ensure_variant(
+                recipe.cover,
+                variants.normalize_width(width or max(settings.cover_variant_widths)),
+                fmt,
+            )
+            media_type = variants.FORMATS[fmt][1]
+        if settings.cos_delivery == "redirect":
+            url = storage.presign_get(cover)
+            if url is not None:
+                if redirect:
+                    return RedirectResponse(url, status_code=302)
+                return resp_succ({"url": url})
+        path = storage.local_path(cover)
+        if path is not None:
+            return local_file_response(path, byte_range, media_type=media_type)
+        stream = storage.get_stream(cover, byte_range)
+    except FileNotFoundError:
+        return resp_err(code=404, detail="封面不存在")
+    except RangeNotSatisfiable as e:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{e.size}"})
+    headers = {"Accept-Ranges": "bytes"}
+    if stream.content_length is not None:
+        headers["Content-Length"] = str(stream.content_length)
+    if stream.content_range:
+        headers["Content-Range"] = stream.content_range
+    if stream.etag:
+        headers["ETag"] = stream.etag
+    if stream.last_modified:
+        headers["Last-Modified"] = stream.last_modified
+    return StreamingResponse(
+        stream.body,
+        status_code=206 if stream.content_range else 200,
+        media_type=stream.content_type or media_type,
+        headers=headers,
+    )
 
 
 # region 原材料
@@ -187,6 +449,7 @@ def create_recipe_ingredient(
         **ingredient.model_dump(),
     )
     db.add(new_ing)
+    touch_recipe(db, recipe.id)
     db.commit()
     db.refresh(new_ing)
     return resp_succ(new_ing.to_resp())
@@ -199,22 +462,39 @@ def delete_recipe_ingredient(
     db: Session = Depends(get_db),
 ):
     db.delete(ingredient)
+    touch_recipe(db, ingredient.recipe_id)
     return resp_succ(detail="删除成功")
 
 
+@router.put("/ingredients", description="批量添加")
+def create_recipe_ingredients(
+    ingredients: list[CreateIngredient],
+    recipe: Recipes = Depends(get_recipe),
+    db: Session = Depends(get_db),
+    usr: CurrentUser = Depends(get_user),
+):
+    """
+    批量添加原材料，一次 executemany 插入
+    """
+    if any(not ing.name for ing in ingredients):
+        return resp_err(code=400, detail="名称不能为空")
+    count = insert_ingredients(
+        db, recipe.id, [ing.model_dump() for ing in ingredients]
+    )
+    return resp_succ(detail="添加成功", total=count)
+
+
 @router.delete("/ingredients", description="批量删除")
 def delete_recipe_ingredients(
     ing_ids: list[int] = Query(default=[], alias="ingredient_id"),
     usr: CurrentUser = Depends(get_user),
     db: Session = Depends(get_db),
 ):
-    ings = []
-    for ing_id in ing_ids:
-        ing = get_ingredient(ing_id, db, usr=usr, exit_ok=True)
-        if ing:
-            ings.append(ing)
-    [db.delete(ing) for ing in ings]
-    return resp_succ(detail="删除成功", total=len(ings))
+    """
+    批量删除原材料，不属于当前用户的 id 会被忽略，total 为实际删除的条数
+    """
+    count = delete_ingredients(db, usr.user.id, ing_ids)
+    return resp_succ(detail="删除成功", total=count)
 
 
 @router.post("/ingredient")
@@ -233,6 +513,7 @@ def update_recipe_ingredient(
     if ing.desc is not None:
         ingredient.desc = ing.desc
     db.add(ingredient)
+    touch_recipe(db, ingredient.recipe_id)
     db.commit()
     db.refresh(ingredient)
     return resp_succ(detail="修改成功", data=ingredient.to_resp())
@@ -256,7 +537,10 @@ def create_recipe_step(
     db: Session = Depends(get_db),
 ):
     new_step = RecipeSteps(recipe_id=recipe.id, **step.model_dump())
+    if new_step.order is None:
+        new_step.order = next_step_order(db, recipe.id)
     db.add(new_step)
+    touch_recipe(db, recipe.id)
     db.commit()
     db.refresh(new_step)
     return resp_succ(new_step.to_resp())
@@ -268,23 +552,52 @@ def delete_recipe_step(
     db: Session = Depends(get_db),
 ):
     db.delete(step)
+    touch_recipe(db, step.recipe_id)
     return resp_succ(detail="删除成功")
 
 
+@router.put("/steps", description="批量添加")
+def create_recipe_steps(
+    steps: list[CreateStep],
+    recipe: Recipes = Depends(get_recipe),
+    db: Session = Depends(get_db),
+):
+    """
+    批量添加步骤，一次 executemany 插入；没有指定 order 的步骤依次排在最后
+    """
+    count = insert_steps(db, recipe.id, [step.model_dump() for step in steps])
+    return resp_succ(detail="添加成功", total=count)
+
+
 @router.delete("/steps")
 def delete_recipe_steps(
     step_ids: list[int] = Query(default=[], alias="step_id"),
     usr: CurrentUser = Depends(get_user),
     db: Session = Depends(get_db),
 ):
-    steps = []
-    for step_id in step_ids:
-        step = get_step(step_id, db, usr=usr, exit_ok=True)
-        if step:
-            steps.append(step)
+    """
+    批量删除步骤，不属于当前用户的 id 会被忽略，total 为实际删除的条数
+    """
+    count = delete_steps(db, usr.user.id, step_ids)
+    return resp_succ(detail="删除成功", total=count)
+
 
-    [db.delete(step) for step in steps]
-    return resp_succ(detail="删除成功", total=len(steps))
+@router.post("/steps/order")
+def reorder_recipe_steps(
+    opts: ReorderSteps,
+    recipe: Recipes = Depends(get_recipe),
+    db: Session = Depends(get_db),
+):
+    """
+    调整步骤顺序，step_ids 按新的顺序排列，一条 UPDATE 完成
+    """
+    if len(set(opts.step_ids)) != len(opts.step_ids):
+        return resp_err(code=400, detail="步骤重复")
+    count = reorder_steps(db, recipe.id, opts.step_ids)
+    if count != len(opts.step_ids):
+        # 抛出异常让 get_db 回滚，不能只更新一部分
+        raise HTTPException(status_code=404, detail="步骤不存在或不属于该菜谱")
+    return resp_succ(detail="修改成功", total=count)
 
 
 @router.post("/step")
@@ -300,6 +613,7 @@ def update_recipe_step(
     if new_step.order is not None:
         step.order = new_step.order
     db.add(step)
+    touch_recipe(db, step.recipe_id)
     db.commit()
     db.refresh(step)
     return resp_succ(detail="修改成功", data=step.to_resp())
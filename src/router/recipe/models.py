@@ -1,5 +1,5 @@
 from typing import Any, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class CreateRecipe(BaseModel):
@@ -18,13 +18,24 @@ class CreateRecipeGroup(BaseModel):
     parent_id: Optional[int] = None
 
 
+class PresignCover(BaseModel):
+    md5: str = Field(pattern=r"^[0-9a-f]{32}$", description="封面文件的 md5")
+
+
 class CreateIngredient(BaseModel):
+    # 数量可以是数字也可以是“适量”之类的文字
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
     name: str | None = None
-    quantity: int | None = None
+    quantity: str | None = None
     unit: str | None = None
     desc: str | None = None
 
 class CreateStep(BaseModel):
     title: str | None = None
     desc: str | None = None
-    order: int | None = None
\ No newline at end of file
+    order: int | None = None
+
+
+class ReorderSteps(BaseModel):
+    step_ids: list[int] = Field(min_length=1, description="按新顺序排列的步骤 id")
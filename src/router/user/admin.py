@@ -2,15 +2,26 @@
 需要管理员权限的接口
 """
 
-from sqlmodel import Session, select
-from fastapi import APIRouter, Depends, Query
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import func
-from auth import get_user_admin
-from database import get_db
+from sqlalchemy.orm import selectinload
+from auth import (
+    get_user_admin,
+    invalidate_user,
+    password_hasher,
+    revoke_user,
+    token_cache,
+)
+from database import get_async_db, get_pool_status
 from database.models import Users
+from database.utils import reconcile_recipe_counts, touch_user_recipes
+from jobs import job_queue
 from models import CurrentUser
+from router.user.main import login_throttle
 from router.user.models import AdminChangeInfo
-from utils import encrypt_md5, resp_err, resp_succ
+from utils import resp_err, resp_succ
 
 
 from . import router as f_router
@@ -19,11 +30,18 @@ from . import router as f_router
 router = APIRouter(prefix="/admin", tags=["Admin", "User"])
 
 
+async def get_user_manager(usr: CurrentUser = Depends(get_user_admin)):
+    """运维统计接口只允许管理员访问，get_user_admin 会放行普通用户（role_id 3）"""
+    if usr.user.role_id <= 3:
+        raise HTTPException(status_code=403, detail="权限不足")
+    return usr
+
+
 @router.get("/all-users")
-def get_all_users(
+async def get_all_users(
     size: int = Query(default=20),
     page: int = Query(default=1),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     usr: CurrentUser = Depends(get_user_admin),
 ):
     """
@@ -32,67 +50,121 @@ def get_all_users(
     user = usr.user
     if user.role_id <= 3:
         return resp_err(detail="权限不足", code=403)
-    all_count = db.exec(
-        select(func.count()).select_from(Users).where(Users.role_id < user.role_id)
+    all_count = (
+        await db.exec(
+            select(func.count()).select_from(Users).where(Users.role_id < user.role_id)
+        )
     ).one()
 
-    all_users = db.exec(
-        select(Users)
-        .where(Users.role_id < user.role_id)
-        .offset(size * (page - 1))
-        .limit(size)
+    all_users = (
+        await db.exec(
+            select(Users)
+            .options(selectinload(Users.role))  # type: ignore
+            .where(Users.role_id < user.role_id)
+            .offset(size * (page - 1))
+            .limit(size)
+        )
     ).all()
     return resp_succ([u.to_resp() for u in all_users], total=all_count)
 
 
 @router.post("/update/{user_id}")
-def update_user(
+async def update_user(
     user_id: int,
     opts: AdminChangeInfo,
     usr: CurrentUser = Depends(get_user_admin),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """更新用户信息"""
     if opts.role_id is not None and opts.role_id >= usr.user.role_id:
         # 不能修改权限大于等于自己的用户权限
         return resp_err(detail="权限不足", code=403)
-    user = db.exec(
-        select(Users).where(Users.id == user_id, Users.role_id < usr.user.role_id)
+    user = (
+        await db.exec(
+            select(Users).where(Users.id == user_id, Users.role_id < usr.user.role_id)
+        )
     ).one_or_none()
     if user is None:
         return resp_err(detail="用户不存在", code=404)
-    if opts.role_id is not None:
+    if opts.role_id is not None and opts.role_id != user.role_id:
         user.role_id = opts.role_id
+        # 令牌中带有角色，修改权限后需要重新登录
+        await revoke_user(db, user_id)
     if opts.uname is not None and opts.uname != user.name:
         user.name = opts.uname
+        await touch_user_recipes(db, user_id)
     if opts.email is not None and opts.email != user.email:
         user.email = opts.email
     if opts.phone is not None and opts.phone != user.phone:
         user.phone = opts.phone
     if opts.passwd is not None:
-        new_passwd = encrypt_md5(opts.passwd)
-        user.hashed_password = new_passwd
+        user.hashed_password = await password_hasher.hash(opts.passwd)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user, ["role"])
+    invalidate_user(user_id)
     return resp_succ(user.to_resp(), detail="更新成功")
 
 
 @router.delete("/delete/{user_id}")
-def delete_user(
+async def delete_user(
     user_id: int,
     usr: CurrentUser = Depends(get_user_admin),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """删除用户"""
-    user = db.exec(
-        select(Users).where(Users.id == user_id, Users.role_id < usr.user.role_id)
+    user = (
+        await db.exec(
+            select(Users).where(Users.id == user_id, Users.role_id < usr.user.role_id)
+        )
     ).one_or_none()
     if user is None:
         return resp_err(detail="用户不存在", code=404)
-    db.delete(user)
-    db.commit()
+    await revoke_user(db, user_id)
+    await db.delete(user)
+    await db.commit()
     return resp_succ(detail="删除成功")
 
 
+@router.get("/token-cache")
+async def get_token_cache_stats(usr: CurrentUser = Depends(get_user_manager)):
+    """登录令牌缓存命中统计"""
+    return resp_succ(token_cache.stats())
+
+
+@router.get("/password-hasher")
+async def get_password_hasher_stats(usr: CurrentUser = Depends(get_user_manager)):
+    """密码哈希线程池状态：排队数和因排队超时被拒绝的次数"""
+    return resp_succ(password_hasher.stats())
+
+
+@router.get("/login-throttle")
+async def get_login_throttle_stats(usr: CurrentUser = Depends(get_user_manager)):
+    """登录限流状态"""
+    return resp_succ(login_throttle.stats())
+
+
+@router.get("/db-pool")
+async def get_db_pool_stats(usr: CurrentUser = Depends(get_user_manager)):
+    """数据库连接池状态"""
+    return resp_succ(get_pool_status())
+
+
+@router.get("/jobs")
+async def get_job_stats(usr: CurrentUser = Depends(get_user_manager)):
+    """后台任务队列指标：队列长度、执行耗时、失败次数"""
+    return resp_succ(job_queue.metrics())
+
+
+
+@router.post("/recipe-counts/reconcile")
+async def reconcile_counts(
+    usr: CurrentUser = Depends(get_user_manager),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """按菜谱表重新统计菜谱计数，返回修正过的计数"""
+    fixed = await db.run_sync(reconcile_recipe_counts)
+    return resp_succ(fixed, total=len(fixed))
+
+
 f_router.include_router(router)
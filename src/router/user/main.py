@@ -1,14 +1,107 @@
+import math
 from fastapi import Depends, Header, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from database import get_db
-from database.models import Tokens, Users
-from sqlmodel import Session, select
+from database import get_async_db
+from database.models import Users
+from database.utils import touch_user_recipes
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from models import TokenData, CurrentUser
-from utils import encrypt_md5, resp_err, resp_succ
+from utils import (
+    cache_headers,
+    is_not_modified,
+    make_etag,
+    not_modified,
+    resp_err,
+    resp_succ,
+)
 from .models import ChangeInfo, CreateUser, LoginRequest
 from . import router
-from auth import create_access_token, get_user
+from auth import (
+    create_access_token,
+    get_user,
+    invalidate_user,
+    password_hasher,
+    revoke_token,
+)
+from config import get_settings
+from throttle import Backoff, Limit, create_throttle
+
+settings = get_settings()
+
+# 登录限流，在查询数据库之前拒绝过于频繁的尝试
+login_throttle = create_throttle(
+    settings.throttle_backend,
+    Backoff(
+        settings.login_free_failures,
+        settings.login_backoff_base,
+        settings.login_backoff_max,
+    ),
+    settings.redis_url,
+)
+# 同一个 IP 后面可能有很多用户，按 IP 计数的失败允许更多次
+ip_backoff = Backoff(
+    settings.login_ip_free_failures,
+    settings.login_backoff_base,
+    settings.login_backoff_max,
+)
+
+
+def _login_buckets(req: Request, name: str) -> dict[str, Limit]:
+    """IP 的桶在前，用户名的桶在后"""
+    ip = req.client.host if req.client else "unknown"
+    return {
+        f"ip:{ip}": Limit(settings.login_ip_rate, settings.login_ip_burst),
+        f"user:{name}": Limit(settings.login_user_rate, settings.login_user_burst),
+    }
+
+
+async def _check_login_throttle(buckets: dict[str, Limit]):
+    """超出限制时返回 429 响应，否则返回 None"""
+    wait = await login_throttle.check(buckets)
+    if wait <= 0:
+        return None
+    resp = resp_err(detail="尝试次数过多，请稍后再试", code=429)
+    resp.headers["Retry-After"] = str(math.ceil(wait))
+    return resp
+
+
+async def _authenticate(
+    db: AsyncSession, buckets: dict[str, Limit], name: str, passwd: str
+) -> Users | None:
+    """按用户名查询后在线程池中校验密码，旧的 md5 密码校验通过后重新哈希为 bcrypt
+
+    用户名不唯一，同名用户逐个校验，返回第一个密码正确的用户；
+    失败会计入限流的失败次数；重新哈希的结果和令牌由调用方在同一个事务中提交
+    """
+    candidates = (
+        await db.exec(
+            select(Users)
+            .options(selectinload(Users.role))  # type: ignore
+            .where(Users.name == name)
+            .order_by(Users.id)  # type: ignore
+        )
+    ).all()
+    user, ok, needs_rehash = None, False, False
+    for candidate in candidates or [None]:
+        ok, needs_rehash = await password_hasher.verify(
+            passwd, candidate.hashed_password if candidate else None
+        )
+        if ok:
+            user = candidate
+            break
+    if user is None or not ok:
+        ip_key, user_key = buckets
+        await login_throttle.failure(user_key)
+        await login_throttle.failure(ip_key, backoff=ip_backoff)
+        return None
+    await login_throttle.success(f"user:{name}")
+    if needs_rehash:
+        user.hashed_password = await password_hasher.hash(passwd)
+        db.add(user)
+    return user
 
 
 @router.post("/login")
@@ -16,15 +109,15 @@ async def login(
     req: Request,
     usr: LoginRequest,
     user_agent=Header(default=...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     登录接口
     """
-    new_passwd = encrypt_md5(usr.passwd)
-    user = db.exec(
-        select(Users).where(Users.name == usr.name, Users.hashed_password == new_passwd)
-    ).first()
+    buckets = _login_buckets(req, usr.name)
+    if (limited := await _check_login_throttle(buckets)) is not None:
+        return limited
+    user = await _authenticate(db, buckets, usr.name, usr.passwd)
     if user is None:
         return resp_err(detail="用户名或密码错误", code=401)
     token_data = TokenData(
@@ -32,8 +125,9 @@ async def login(
         ip=req.client and req.client.host,
         user_agent=user_agent,
         desc=usr.desc or "登录",
+        role_id=user.role_id,
     )
-    token = create_access_token(token_data, db=db)
+    token = await create_access_token(token_data, db=db)
     resp = user.to_resp()
     resp.update({"token": token})
     return resp_succ(data=resp, detail="登录成功")
@@ -44,17 +138,15 @@ async def token(
     req: Request,
     user_agent=Header(default=...),
     usr: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     获取token接口，用于docs页面登录
     """
-    new_passwd = encrypt_md5(usr.password)
-    user = db.exec(
-        select(Users).where(
-            Users.name == usr.username, Users.hashed_password == new_passwd
-        )
-    ).one_or_none()
+    buckets = _login_buckets(req, usr.username)
+    if (limited := await _check_login_throttle(buckets)) is not None:
+        return limited
+    user = await _authenticate(db, buckets, usr.username, usr.password)
     if user is None:
         return resp_err(detail="用户名或密码错误", code=401)
     token_data = TokenData(
@@ -62,59 +154,83 @@ async def token(
         ip=req.client and req.client.host,
         user_agent=user_agent,
         desc="docs 登录",
+        role_id=user.role_id,
     )
-    token = create_access_token(token_data, db=db)
+    token = await create_access_token(token_data, db=db)
     return {"access_token": token, "token_type": "bearer"}
 
 
 @router.post("/create")
-async def create_user(usr: CreateUser, db: Session = Depends(get_db)):
+async def create_user(usr: CreateUser, db: AsyncSession = Depends(get_async_db)):
     """
     创建用户接口
     """
-    new_passwd = encrypt_md5(usr.passwd)
     new_user = Users(
-        name=usr.name, email=usr.email, phone=usr.phone, hashed_password=new_passwd
+        name=usr.name,
+        email=usr.email,
+        phone=usr.phone,
+        hashed_password=await password_hasher.hash(usr.passwd),
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user, ["role"])
     return resp_succ(data=new_user.to_resp(), detail="创建成功")
 
 
+async def _full_user(usr: CurrentUser, db: AsyncSession):
+    """无状态模式下令牌里只有 id 和 role_id，需要时再查询完整的用户信息"""
+    if not usr.stateless:
+        return usr.user
+    return await db.get(Users, usr.user.id, options=[selectinload(Users.role)])  # type: ignore
+
+
 @router.get("/info")
-async def get_user_info(usr: CurrentUser = Depends(get_user)):
+async def get_user_info(
+    request: Request,
+    usr: CurrentUser = Depends(get_user),
+    db: AsyncSession = Depends(get_async_db),
+):
     """
     获取用户信息接口，需要登录才能访问
+
+    用户表没有修改时间，ETag 取响应体的摘要，内容未变化时返回 304 不传输响应体
     """
-    return resp_succ(data=usr.user.to_resp(), detail="获取信息成功")
+    user = await _full_user(usr, db)
+    if user is None:
+        return resp_err(detail="用户不存在", code=404)
+    resp = resp_succ(data=user.to_resp(), detail="获取信息成功")
+    headers = cache_headers(make_etag(resp.body), cache_control="private, no-cache")
+    if is_not_modified(request.headers, headers["ETag"]):
+        return not_modified(headers)
+    resp.headers.update(headers)
+    return resp
 
 
 @router.post("/check-password")
 async def check_password(
     info: LoginRequest,
     usr: CurrentUser = Depends(get_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     验证密码接口，需要登录才能访问
     """
-    print(info.passwd)
-    new_passwd = encrypt_md5(info.passwd)
-    print(new_passwd)
-    if new_passwd == usr.user.hashed_password:
+    user = await _full_user(usr, db)
+    ok, _ = await password_hasher.verify(info.passwd, user.hashed_password if user else None)
+    if ok:
         return resp_succ(detail="密码正确")
     return resp_err(detail="密码错误", code=401)
 
 
 @router.get("/logout")
-async def logout(usr: CurrentUser = Depends(get_user), db: Session = Depends(get_db)):
+async def logout(
+    usr: CurrentUser = Depends(get_user), db: AsyncSession = Depends(get_async_db)
+):
     """
     登出接口，需要登录才能访问，删除用户的token信息，实现登出功能。
     """
-    token = db.exec(select(Tokens).where(Tokens.token == usr.token)).one_or_none()
-    if token is not None:
-        db.delete(token)
-        db.commit()
+    await revoke_token(db, usr.token, usr.token_data)
+    await db.commit()
     return resp_succ(detail="登出成功")
 
 
@@ -122,23 +238,27 @@ async def logout(usr: CurrentUser = Depends(get_user), db: Session = Depends(get
 async def update_user(
     opts: ChangeInfo,
     usr: CurrentUser = Depends(get_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     更新用户信息接口，需要登录才能访问。
     """
-    user = usr.user
+    # usr.user 是缓存快照，修改前先取出数据库中的对象
+    user = await db.get(Users, usr.user.id, options=[selectinload(Users.role)])  # type: ignore
+    if user is None:
+        return resp_err(detail="用户不存在", code=404)
 
     if opts.uname is not None and opts.uname != user.name:
         user.name = opts.uname
+        await touch_user_recipes(db, user.id)
     if opts.email is not None and opts.email != user.email:
         user.email = opts.email
     if opts.phone is not None and opts.phone != user.phone:
         user.phone = opts.phone
     if opts.passwd is not None:
-        new_passwd = encrypt_md5(opts.passwd)
-        user.hashed_password = new_passwd
+        user.hashed_password = await password_hasher.hash(opts.passwd)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user, ["role"])
+    invalidate_user(user.id)
     return resp_succ(data=user.to_resp(), detail="更新成功")
@@ -0,0 +1,49 @@
+"""
+后台任务的处理函数
+
+main.py 启动时导入本模块完成注册，worker 只能执行已经注册的任务类型。
+"""
+
+import os
+
+from sqlmodel import Session
+
+import jobs
+from api import variants
+from api.storage import get_storage
+from database import engine
+from database.models import Recipes
+from database.utils import touch_recipe
+
+
+def remove_staged_file(payload: dict):
+    """删除本机的暂存文件，任务成功后和最终失败时调用"""
+    if os.path.exists(payload["path"]):
+        os.remove(payload["path"])
+
+
+@jobs.register("recipe_cover", on_failure=remove_staged_file)
+def upload_recipe_cover(payload: dict):
+    """把暂存的封面上传到存储，设置为菜谱封面并生成缩略图
+
+    暂存文件在本机，入队时需要 local=True；
+    重复执行是安全的：对象已存在时跳过上传，暂存文件在成功后才删除
+    """
+    storage = get_storage()
+    cos_path = os.path.join(payload["prefix"], payload["md5"] + ".png")
+    uploaded = False
+    if storage.head(cos_path) is None:
+        with open(payload["path"], "rb") as fp:
+            storage.put(cos_path, fp, payload["size"], "image/png")
+        uploaded = True
+    with Session(engine) as db:
+        recipe = db.get(Recipes, payload["recipe_id"])
+        if recipe is not None:
+            recipe.cover = cos_path
+            db.add(recipe)
+            touch_recipe(db, recipe.id)
+            db.commit()
+    remove_staged_file(payload)
+    if uploaded:
+        variants.generate_variants(cos_path)
+    return {"cover": cos_path, "uploaded": uploaded}
@@ -0,0 +1,211 @@
+"""
+登录限流
+
+令牌桶限制请求速率，连续失败后按指数退避封禁一段时间。
+检查只访问内存或 Redis，在查询数据库之前就可以拒绝请求。
+"""
+
+import math
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+
+class Limit(NamedTuple):
+    """令牌桶参数：每秒补充 rate 个令牌，最多积累 burst 个"""
+
+    rate: float
+    burst: float
+
+
+class Backoff(NamedTuple):
+    """前 free 次失败不封禁，之后封禁 base * 2^(n - free - 1) 秒，最长 max 秒"""
+
+    free: int
+    base: float
+    max: float
+
+    def delay(self, failures: int) -> float:
+        if failures <= self.free:
+            return 0.0
+        return min(self.base * 2 ** (failures - self.free - 1), self.max)
+
+
+class Throttle:
+    """限流接口，key 由调用方拼接，例如 "ip:1.2.3.4"、"user:bob" """
+
+    def __init__(self, backoff: Backoff):
+        self.backoff = backoff
+        self.rejected = 0
+
+    async def check(self, buckets: dict[str, Limit]) -> float:
+        """每个桶各消耗一个令牌
+
+        Returns:
+            float: 需要等待的秒数，0 表示放行
+        """
+        raise NotImplementedError
+
+    async def failure(self, *keys: str, backoff: Backoff | None = None):
+        """记录一次失败，失败次数超过阈值后封禁
+
+        Args:
+            backoff (Backoff | None, optional): 本次使用的退避参数，默认使用 self.backoff
+        """
+        raise NotImplementedError
+
+    async def success(self, *keys: str):
+        """清除失败记录"""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"rejected": self.rejected}
+
+
+class MemoryThrottle(Throttle):
+    """单进程内的限流，键的数量有上限，超出时淘汰最久未使用的"""
+
+    def __init__(self, backoff: Backoff, max_keys: int = 100_000):
+        super().__init__(backoff)
+        self.max_keys = max_keys
+        # key -> (令牌数, 更新时间)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        # key -> (失败次数, 封禁截止时间, 最后一次失败的时间)
+        self._failures: OrderedDict[str, tuple[int, float, float]] = OrderedDict()
+
+    def _touch(self, data: OrderedDict, key: str, value):
+        data[key] = value
+        data.move_to_end(key)
+        while len(data) > self.max_keys:
+            data.popitem(last=False)
+
+    async def check(self, buckets: dict[str, Limit]) -> float:
+        now = time.monotonic()
+        wait = 0.0
+        for key in buckets:
+            failures = self._failures.get(key)
+            if failures is not None and failures[1] > now:
+                wait = max(wait, failures[1] - now)
+        if wait > 0:
+            self.rejected += 1
+            return wait
+        for key, limit in buckets.items():
+            tokens, updated = self._buckets.get(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / limit.rate)
+            else:
+                tokens -= 1
+            self._touch(self._buckets, key, (tokens, now))
+        if wait > 0:
+            self.rejected += 1
+        return wait
+
+    async def failure(self, *keys: str, backoff: Backoff | None = None):
+        backoff = backoff or self.backoff
+        now = time.monotonic()
+        for key in keys:
+            count, _, last = self._failures.get(key, (0, 0.0, now))
+            # 与 redis 实现一致：超过 2 * max 秒没有失败时重新计数
+            if now - last > backoff.max * 2:
+                count = 0
+            count += 1
+            self._touch(self._failures, key, (count, now + backoff.delay(count), now))
+
+    async def success(self, *keys: str):
+        for key in keys:
+            self._failures.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "rejected": self.rejected,
+            "buckets": len(self._buckets),
+            "failures": len(self._failures),
+        }
+
+
+class RedisThrottle(Throttle):
+    """多个 worker 共享的限流，令牌桶用 Lua 脚本保证原子性"""
+
+    BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local b = redis.call('HMGET', KEYS[1], 't', 'ts')
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+else
+    tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(wait)
+"""
+
+    def __init__(self, backoff: Backoff, url: str, prefix: str = "gs-api:throttle:"):
+        super().__init__(backoff)
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("redis backend requires `pip install redis`") from e
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self._bucket = self.client.register_script(self.BUCKET_SCRIPT)
+
+    async def check(self, buckets: dict[str, Limit]) -> float:
+        # 值为封禁截止的时间戳
+        until = await self.client.mget(*(f"{self.prefix}block:{k}" for k in buckets))
+        blocked = [float(t) for t in until if t is not None]
+        if blocked:
+            wait = max(blocked) - time.time()
+            if wait > 0:
+                self.rejected += 1
+                return wait
+        wait = 0.0
+        now = time.time()
+        for key, limit in buckets.items():
+            res = await self._bucket(
+                keys=[f"{self.prefix}bucket:{key}"], args=[limit.rate, limit.burst, now]
+            )
+            wait = max(wait, float(res))
+        if wait > 0:
+            self.rejected += 1
+        return wait
+
+    async def failure(self, *keys: str, backoff: Backoff | None = None):
+        backoff = backoff or self.backoff
+        for key in keys:
+            count_key = f"{self.prefix}fail:{key}"
+            count = await self.client.incr(count_key)
+            await self.client.expire(count_key, math.ceil(backoff.max * 2))
+            delay = backoff.delay(count)
+            if delay > 0:
+                await self.client.set(
+                    f"{self.prefix}block:{key}", time.time() + delay, px=math.ceil(delay * 1000)
+                )
+
+    async def success(self, *keys: str):
+        await self.client.delete(*(f"{self.prefix}fail:{k}" for k in keys))
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "rejected": self.rejected}
+
+
+def create_throttle(backend: str, backoff: Backoff, redis_url: str | None = None):
+    """根据配置创建限流器
+
+    Args:
+        backend (str): memory 或 redis
+        backoff (Backoff): 失败后的退避参数
+        redis_url (str | None, optional): redis 地址
+    """
+    if backend == "redis":
+        if not redis_url:
+            raise ValueError("redis_url is required for redis throttle backend")
+        return RedisThrottle(backoff, redis_url)
+    return MemoryThrottle(backoff)
@@ -0,0 +1,198 @@
+"""
+数据库结构迁移
+
+`SQLModel.metadata.create_all` 只会创建缺失的表，已有表的列和索引变更需要运行本脚本：
+
+```shell
+python src/tools/migrate.py
+```
+
+每个步骤都可以重复执行。
+"""
+
+import os
+import sys
+import logging
+
+if __name__ == "__main__":
+    sys.path.append(os.getcwd() + "/src")
+
+from sqlalchemy import Connection, inspect, text
+from sqlmodel import SQLModel
+
+from database import engine
+from database.search import get_post_search
+from database import models  # noqa: F401 导入以注册全部表
+
+logger = logging.getLogger(__name__)
+
+
+def create_missing_indexes(conn: Connection, table):
+    """创建模型中声明但数据库中不存在的索引"""
+    existing = {idx["name"] for idx in inspect(conn).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            logger.info("create index %s", index.name)
+            index.create(conn)
+
+
+def add_column(conn: Connection, table: str, column: str, ddl: str) -> bool:
+    """表已存在但缺少该列时添加，返回是否添加"""
+    inspector = inspect(conn)
+    if table not in inspector.get_table_names():
+        return False
+    if column in {c["name"] for c in inspector.get_columns(table)}:
+        return False
+    logger.info("add column %s.%s", table, column)
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return True
+
+
+def migrate_token_hash(conn: Connection):
+    """tokens.token（完整 JWT）-> tokens.token_hash（sha256 摘要，唯一索引）"""
+    from auth import hash_token
+
+    inspector = inspect(conn)
+    if "tokens" not in inspector.get_table_names():
+        return
+    columns = {c["name"] for c in inspector.get_columns("tokens")}
+    add_column(conn, "tokens", "token_hash", "VARCHAR(64)")
+    if "token" in columns:
+        rows = conn.execute(
+            text("SELECT id, token FROM tokens WHERE token_hash IS NULL")
+        ).all()
+        if rows:
+            conn.execute(
+                text("UPDATE tokens SET token_hash = :token_hash WHERE id = :id"),
+                [{"id": r.id, "token_hash": hash_token(r.token)} for r in rows],
+            )
+        conn.execute(text("ALTER TABLE tokens DROP COLUMN token"))
+
+
+def create_all_missing_indexes(conn: Connection):
+    """补齐所有已存在表上新声明的索引"""
+    tables = set(inspect(conn).get_table_names())
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name in tables:
+            create_missing_indexes(conn, table)
+
+
+def migrate_revocation_precision(conn: Connection):
+    """MySQL 的 revocations.created 改为 DATETIME(6)，与令牌 iat 的比较精确到微秒"""
+    if conn.dialect.name != "mysql":
+        return
+    inspector = inspect(conn)
+    if "revocations" not in inspector.get_table_names():
+        return
+    columns = {c["name"]: c for c in inspector.get_columns("revocations")}
+    created = columns["created"]
+    if getattr(created["type"], "fsp", None) == 6:
+        return
+    logger.info("alter column revocations.created to DATETIME(6)")
+    conn.execute(text("ALTER TABLE revocations MODIFY created DATETIME(6) NOT NULL"))
+
+
+def migrate_job_host(conn: Connection):
+    """jobs 增加 host 列，依赖本机暂存文件的任务只由该机器恢复"""
+    add_column(conn, "jobs", "host", "VARCHAR(255)")
+
+
+def migrate_recipe_steps(conn: Connection):
+    """recipe_steps 增加标题列"""
+    add_column(conn, "recipe_steps", "title", "VARCHAR(255)")
+
+
+def migrate_recipe_version(conn: Connection):
+    """recipes 增加版本号列，用作详情缓存的键，已有菜谱从 0 开始"""
+    add_column(conn, "recipes", "version", "INTEGER NOT NULL DEFAULT 0")
+
+
+def migrate_recipe_group_path(conn: Connection):
+    """recipe_groups 增加 parent_id / path 列，并由 parent_id 回填物化路径
+
+    每次都按 parent_id 重新计算全部分组的路径，只更新不一致的行；
+    parent_id 指向不存在的分组时按根分组处理，形成环时断开为根分组
+    """
+    from router.recipe.group import group_path
+
+    add_column(conn, "recipe_groups", "parent_id", "INTEGER")
+    add_column(conn, "recipe_groups", "path", "VARCHAR(255) NOT NULL DEFAULT '/'")
+    rows = conn.execute(text("SELECT id, parent_id, path FROM recipe_groups")).all()
+    parents = {r.id: r.parent_id for r in rows}
+    paths: dict[int, str] = {}
+    detached: list[int] = []
+
+    def resolve(gid: int):
+        # 沿 parent_id 向上找到已知路径的祖先，再向下依次拼接
+        chain, seen = [], set()
+        cur = gid
+        while cur is not None and cur not in paths and cur in parents:
+            if cur in seen:
+                logger.warning("recipe_groups %s: parent_id 形成环，改为根分组", chain[-1])
+                detached.append(chain[-1])
+                parents[chain[-1]] = cur = None
+                break
+            seen.add(cur)
+            chain.append(cur)
+            cur = parents[cur]
+        parent_path = paths.get(cur) if cur is not None else None
+        for node in reversed(chain):
+            paths[node] = parent_path = group_path(parent_path, node)
+
+    for gid in parents:
+        resolve(gid)
+    if detached:
+        conn.execute(
+            text("UPDATE recipe_groups SET parent_id = NULL WHERE id = :id"),
+            [{"id": gid} for gid in detached],
+        )
+    changed = [
+        {"id": r.id, "path": paths[r.id]} for r in rows if paths[r.id] != r.path
+    ]
+    if changed:
+        logger.info("backfill recipe_groups.path: %d rows", len(changed))
+        conn.execute(
+            text("UPDATE recipe_groups SET path = :path WHERE id = :id"), changed
+        )
+
+
+def seed_recipe_counts(conn: Connection):
+    """按菜谱表重新统计 recipe_counts，计数表中缺少的记录视为 0"""
+    from sqlmodel import Session
+    from database.utils import reconcile_recipe_counts
+
+    with Session(bind=conn) as db:
+        fixed = reconcile_recipe_counts(db)
+        db.flush()
+    if fixed:
+        logger.info("recipe_counts: %d keys fixed", len(fixed))
+
+
+def setup_post_search(conn: Connection):
+    """帖子全文检索索引（MySQL FULLTEXT / SQLite FTS5）"""
+    get_post_search(conn.dialect.name).setup(conn)
+
+
+STEPS = [
+    migrate_token_hash,
+    migrate_revocation_precision,
+    migrate_job_host,
+    migrate_recipe_steps,
+    migrate_recipe_version,
+    migrate_recipe_group_path,
+    create_all_missing_indexes,
+    seed_recipe_counts,
+    setup_post_search,
+]
+
+
+def migrate():
+    for step in STEPS:
+        with engine.begin() as conn:
+            logger.info("migrate: %s", step.__name__)
+            step(conn)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate()
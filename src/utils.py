@@ -1,9 +1,12 @@
 from base64 import b64decode, b64encode
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 import hashlib
 import logging
+import os
 from typing import Any, Literal, Optional, Union
 from fastapi import Response
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 import orjson
 from pydantic import BaseModel
 
@@ -12,15 +15,20 @@ class Res(BaseModel):
     detail: Optional[str] = None
     data: Optional[Any] = None
     total: Optional[int] = None
+    cursor: Optional[str] = None
     code: int = 200
 
 
-def return_resp(data, total, detail, code):
-    c = Res(detail=detail, data=data, total=total, code=code).model_dump()
+def return_resp(data, total, detail, code, cursor=None):
+    c = Res(
+        detail=detail, data=data, total=total, code=code, cursor=cursor
+    ).model_dump()
     if total is None:
         del c["total"]
     if c["data"] is None:
         del c["data"]
+    if cursor is None:
+        del c["cursor"]
 
     res = Response(
         content=orjson.dumps(c),
@@ -31,9 +39,18 @@ def return_resp(data, total, detail, code):
 
 
 def resp_succ(
-    data: Any = None, total: int | None = None, detail: str = "SUCCESS", code=200
+    data: Any = None,
+    total: int | None = None,
+    detail: str = "SUCCESS",
+    code=200,
+    cursor: str | None = None,
 ):
-    return return_resp(data=data, total=total, detail=detail, code=code)
+    """成功响应
+
+    Args:
+        cursor (str | None, optional): 游标分页时下一页的游标，没有下一页时为 None
+    """
+    return return_resp(data=data, total=total, detail=detail, code=code, cursor=cursor)
 
 
 def resp_err(
@@ -42,6 +59,179 @@ def resp_err(
     return return_resp(data=data, total=total, detail=detail, code=code)
 
 
+def encode_cursor(*values: Any) -> str:
+    """把排序键编码为不透明的分页游标"""
+    return b64encode(orjson.dumps(values), altchars=b"-_").rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    """解析 encode_cursor 生成的游标
+
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    try:
+        raw = b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True)
+        values = orjson.loads(raw)
+    except Exception as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(values, list):
+        raise ValueError("invalid cursor")
+    return values
+
+
+def make_etag(*parts: Any) -> str:
+    """由若干可序列化的值（或已序列化的 bytes）生成强 ETag"""
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else orjson.dumps(part))
+    return f'"{h.hexdigest()}"'
+
+
+def http_date(dt: datetime) -> str:
+    """datetime -> HTTP 日期，不带时区的时间按本地时间处理（与 datetime.now 一致）"""
+    return format_datetime(dt.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def is_not_modified(
+    headers, etag: str, last_modified: datetime | None = None
+) -> bool:
+    """根据 If-None-Match / If-Modified-Since 判断客户端缓存是否仍然有效
+
+    两个请求头同时存在时只看 If-None-Match（RFC 9110）
+
+    Args:
+        headers: 请求头
+        etag (str): 当前资源的 ETag
+        last_modified (datetime | None, optional): 当前资源的修改时间
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # GET 使用弱比较，W/ 前缀可以忽略
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return etag in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            # "-0000" 时区解析为不带时区的时间，按 UTC 处理
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP 日期精确到秒
+        modified = last_modified.astimezone(timezone.utc).replace(microsecond=0)
+        return modified <= since
+    return False
+
+
+def cache_headers(
+    etag: str, last_modified: datetime | None = None, cache_control="no-cache"
+) -> dict:
+    """条件请求相关的响应头，默认 no-cache 表示客户端可以缓存但每次都要验证"""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(headers: dict) -> Response:
+    """304 响应，不带响应体"""
+    return Response(status_code=304, headers=headers)
+
+
+def parse_range(header: str | None) -> str | None:
+    """校验 Range 请求头，只支持单个字节范围
+
+    Returns:
+        str | None: 规范化后的 Range，例如 "bytes=0-1023"；
+            没有 Range、格式错误或多个范围时返回 None，按完整内容响应
+    """
+    if not header:
+        return None
+    unit, _, spec = header.strip().partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start, sep, end = spec.strip().partition("-")
+    start, end = start.strip(), end.strip()
+    if not sep or not (start or end):
+        return None
+    if (start and not start.isdigit()) or (end and not end.isdigit()):
+        return None
+    if start and end and int(start) > int(end):
+        return None
+    return f"bytes={start}-{end}"
+
+
+def resolve_range(byte_range: str, size: int) -> tuple[int, int] | None:
+    """把 parse_range 的结果换算成 [start, end] 闭区间
+
+    Returns:
+        tuple[int, int] | None: 起止位置，范围无法满足时返回 None（应响应 416）
+    """
+    start, _, end = byte_range.removeprefix("bytes=").partition("-")
+    if not start:
+        # bytes=-N 表示最后 N 个字节
+        length = int(end)
+        if length == 0 or size == 0:
+            return None
+        return max(size - length, 0), size - 1
+    first = int(start)
+    if first >= size:
+        return None
+    last = min(int(end), size - 1) if end else size - 1
+    return first, last
+
+
+def _iter_file_range(path: str, start: int, end: int, chunk_size: int):
+    with open(path, "rb") as fp:
+        fp.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = fp.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def local_file_response(
+    path: str,
+    byte_range: str | None = None,
+    media_type: str | None = None,
+    chunk_size: int = 64 * 1024,
+) -> Response:
+    """本地文件响应：完整内容用 FileResponse（sendfile），范围请求返回 206
+
+    Args:
+        path (str): 文件路径
+        byte_range (str | None, optional): parse_range 的结果
+        media_type (str | None, optional): Content-Type
+        chunk_size (int, optional): 范围请求时每次读取的字节数
+    """
+    if byte_range is None:
+        return FileResponse(
+            path, media_type=media_type, headers={"Accept-Ranges": "bytes"}
+        )
+    size = os.path.getsize(path)
+    resolved = resolve_range(byte_range, size)
+    if resolved is None:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    start, end = resolved
+    return StreamingResponse(
+        _iter_file_range(path, start, end, chunk_size),
+        status_code=206,
+        media_type=media_type,
+        headers={
+            "Accept-Ranges": "bytes",
+            "Content-Length": str(end - start + 1),
+            "Content-Range": f"bytes {start}-{end}/{size}",
+        },
+    )
+
+
 def encrypt_md5(data_string, salt="0123456789ABCDEF...uygt6987"):
     """
     对字符串进行 MD5 加密
@@ -0,0 +1,67 @@
+"""
+接口测试的公共配置
+
+在导入应用之前设置环境变量：数据库使用临时目录中的 sqlite，文件存储使用本地目录。
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp(prefix="gs-api-test-")
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{TMP}/test.sqlite")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("TEMP_DIR", os.path.join(TMP, "tmp"))
+os.environ.setdefault("STORAGE_BACKEND", "local")
+os.environ.setdefault("STORAGE_DIR", os.path.join(TMP, "storage"))
+os.environ.setdefault("DB_POOL_WARMUP", "0")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from sqlmodel import Session, text
+
+    os.chdir(ROOT)
+    import main
+    from database import engine
+
+    with Session(engine) as db:
+        db.exec(
+            text(
+                "insert into roles (id, name, label) values (0, 'guest', '游客'),"
+                "(1, 'disable', '禁用'), (2, 'subscribe', '订阅者'),"
+                "(3, 'user', '普通用户'), (4, 'admin', '管理员'), (5, 'super', '超管')"
+            )
+        )
+        db.commit()
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture
+def login(client):
+    """创建用户并登录，返回请求头"""
+    from sqlmodel import Session, text
+    from database import engine
+
+    def login(name: str, passwd: str = "pw", role_id: int = 3) -> dict:
+        r = client.post("/api/user/create", json={"name": name, "passwd": passwd})
+        assert r.status_code == 200, r.text
+        if role_id != 3:
+            with Session(engine) as db:
+                db.exec(
+                    text("update users set role_id = :r where id = :id"),
+                    params={"r": role_id, "id": r.json()["data"]["id"]},
+                )
+                db.commit()
+        r = client.post("/api/user/login", json={"name": name, "passwd": passwd})
+        assert r.status_code == 200, r.text
+        return {"Authorization": "Bearer " + r.json()["data"]["token"]}
+
+    return login
@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from jose import jwt
+
+
+@pytest.fixture
+def stateless(monkeypatch):
+    import auth
+
+    monkeypatch.setattr(auth.settings, "auth_mode", "stateless")
+
+
+def _claims(headers: dict) -> dict:
+    token = headers["Authorization"].removeprefix("Bearer ")
+    return jwt.get_unverified_claims(token)
+
+
+def _token(headers: dict) -> str:
+    return headers["Authorization"].removeprefix("Bearer ")
+
+
+def test_logout_revocation_syncs_to_other_worker(client, login, stateless):
+    import auth
+
+    alice = login("rev-alice")
+    uid = _claims(alice)["uid"]
+    other = auth.RevocationSet()
+    client.portal.call(other.refresh)
+    token = auth.hash_token(_token(alice))
+    assert not other.is_revoked(token, uid, _claims(alice)["iat"])
+
+    assert client.get("/api/user/logout", headers=alice).status_code == 200
+    assert client.get("/api/user/info", headers=alice).status_code == 401
+    client.portal.call(other.refresh)
+    assert other.is_revoked(token, uid, _claims(alice)["iat"])
+
+
+def test_revocation_committed_out_of_order(client, stateless):
+    """id 较小、时间较早的记录晚于已同步的记录提交，下次同步仍然能读到"""
+    import auth
+    from sqlmodel import Session
+    from database import engine
+    from database.models import Revocations
+
+    def insert(rid: int, token_hash: str, created: datetime):
+        with Session(engine) as db:
+            db.add(
+                Revocations(
+                    id=rid,
+                    token_hash=token_hash,
+                    uid=1,
+                    expires=created + timedelta(days=1),
+                    created=created,
+                )
+            )
+            db.commit()
+
+    other = auth.RevocationSet()
+    now = datetime.now(timezone.utc)
+    insert(10_000, "aa" * 32, now)
+    client.portal.call(other.refresh)
+    assert other.is_revoked("aa" * 32, 1, 0)
+    insert(9_000, "bb" * 32, now - timedelta(seconds=1))
+    client.portal.call(other.refresh)
+    assert other.is_revoked("bb" * 32, 1, 0)
+
+
+def test_role_change_revokes_tokens(client, login, stateless):
+    import auth
+    from sqlmodel import Session, select
+    from database import engine
+    from database.models import Revocations
+
+    admin = login("rev-admin", role_id=4)
+    alice = login("rev-role-alice")
+    uid = _claims(alice)["uid"]
+    assert client.get("/api/user/info", headers=alice).status_code == 200
+
+    r = client.post(f"/api/user/admin/update/{uid}", json={"role_id": 2}, headers=admin)
+    assert r.status_code == 200, r.text
+    assert client.get("/api/user/info", headers=alice).status_code == 401
+
+    # 其他进程同步后同样拒绝之前签发的令牌，按微秒比较
+    other = auth.RevocationSet()
+    client.portal.call(other.refresh)
+    with Session(engine) as db:
+        created = db.exec(
+            select(Revocations.created).where(
+                Revocations.uid == uid, Revocations.token_hash == None  # noqa: E711
+            )
+        ).one()
+    revoked_at = created.replace(tzinfo=timezone.utc).timestamp()
+    token = auth.hash_token(_token(alice))
+    assert other.is_revoked(token, uid, _claims(alice)["iat"])
+    assert other.is_revoked(token, uid, revoked_at - 0.000_5)
+    assert not other.is_revoked(token, uid, revoked_at + 0.000_5)
+
+    # 重新登录拿到的令牌不受影响
+    r = client.post("/api/user/login", json={"name": "rev-role-alice", "passwd": "pw"})
+    fresh = {"Authorization": "Bearer " + r.json()["data"]["token"]}
+    assert client.get("/api/user/info", headers=fresh).status_code == 200
+    fresh_token = auth.hash_token(_token(fresh))
+    assert not other.is_revoked(fresh_token, uid, _claims(fresh)["iat"])
+
+
+def test_token_cap_evicts_oldest(client, login, monkeypatch):
+    import auth
+    from sqlmodel import Session, func, select
+    from database import engine
+    from database.models import Tokens
+
+    monkeypatch.setattr(auth.settings, "token_max_per_user", 2)
+    first = login("cap-alice")
+    uid = _claims(first)["uid"]
+    later = []
+    for _ in range(2):
+        r = client.post("/api/user/login", json={"name": "cap-alice", "passwd": "pw"})
+        assert r.status_code == 200, r.text
+        later.append({"Authorization": "Bearer " + r.json()["data"]["token"]})
+
+    assert client.get("/api/user/info", headers=first).status_code == 401
+    for headers in later:
+        assert client.get("/api/user/info", headers=headers).status_code == 200
+    with Session(engine) as db:
+        count = db.exec(select(func.count()).where(Tokens.uid == uid)).one()
+    assert count == 2
+
+
+def test_purge_expired_tokens(client, login):
+    import auth
+    from sqlmodel import Session, select
+    from database import engine
+    from database.models import Revocations, Tokens
+
+    uid = _claims(login("purge-alice"))["uid"]
+    now = datetime.now(timezone.utc)
+    with Session(engine) as db:
+        for i in range(3):
+            db.add(Tokens(token_hash=f"{i:064x}", uid=uid, expires=now - timedelta(days=1)))
+        db.add(
+            Revocations(
+                token_hash="cc" * 32,
+                uid=uid,
+                expires=now - timedelta(days=1),
+                created=now - timedelta(days=2),
+            )
+        )
+        db.commit()
+
+    # 批大小为 1，覆盖分批循环
+    assert client.portal.call(auth.purge_expired_tokens, 1) >= 4
+    with Session(engine) as db:
+        tokens = db.exec(select(Tokens).where(Tokens.uid == uid)).all()
+        revoked = db.exec(select(Revocations).where(Revocations.uid == uid)).all()
+    assert len(tokens) == 1, "未过期的令牌应保留"
+    assert revoked == []
@@ -0,0 +1,147 @@
+import time
+from src import cache
+
+
+def test_ttl_cache_lru():
+    c = cache.TTLCache(maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)
+    assert c.get("b") is None, "最久未使用的条目应被淘汰"
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert c.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expire():
+    c = cache.TTLCache(maxsize=10, ttl=60)
+    c.set("a", 1, ttl=0.01)
+    time.sleep(0.02)
+    assert c.get("a") is None
+    c.set("b", {"uid": 1})
+    c.set("c", {"uid": 2})
+    assert c.discard_if(lambda _, v: v["uid"] == 1) == 1
+    assert c.get("b") is None and c.get("c") == {"uid": 2}
+    assert c.hits == 1 and c.misses == 2
+
+
+def test_disk_cache_lru(tmp_path):
+    c = cache.DiskCache(str(tmp_path), max_bytes=10)
+    fills = []
+
+    def writer(data):
+        def fill(fp):
+            fills.append(data)
+            fp.write(data)
+
+        return fill
+
+    a = c.get_or_fill("a", writer(b"aaaa"))
+    assert open(a, "rb").read() == b"aaaa"
+    assert c.get_or_fill("a", writer(b"xxxx")) == a
+    assert fills == [b"aaaa"], "命中时不应再次下载"
+    c.get_or_fill("b", writer(b"bbbb"))
+    c.get("a")
+    c.get_or_fill("c", writer(b"cccc"))
+    assert c.get("b") is None, "最久未使用的文件应被淘汰"
+    assert c.get("a") is not None and c.stats()["bytes"] == 8
+    # 重启后从磁盘恢复索引
+    assert cache.DiskCache(str(tmp_path), max_bytes=10).stats()["files"] == 2
+
+
+def test_disk_cache_single_flight(tmp_path):
+    import threading
+
+    c = cache.DiskCache(str(tmp_path), max_bytes=1024)
+    calls = []
+
+    def fill(fp):
+        calls.append(1)
+        time.sleep(0.05)
+        fp.write(b"data")
+
+    threads = [
+        threading.Thread(target=c.get_or_fill, args=("k", fill)) for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+
+
+def test_response_cache_generation():
+    import asyncio
+
+    async def run():
+        c = cache.MemoryResponseCache(max_bytes=1024)
+        gen = await c.generation("posts")
+        await c.set(f"posts:{gen}:q", b"old", ttl=60)
+        assert await c.get(f"posts:{gen}:q") == b"old"
+        await c.bump("posts")
+        gen = await c.generation("posts")
+        assert await c.get(f"posts:{gen}:q") is None, "bump 之后不应读到旧版本"
+        assert await c.generation("recipes") == 0, "其他命名空间不受影响"
+
+    asyncio.run(run())
+
+
+def test_response_cache_byte_budget():
+    import asyncio
+
+    async def run():
+        c = cache.MemoryResponseCache(max_bytes=10)
+        await c.set("a", b"aaaa", ttl=60)
+        await c.set("b", b"bbbb", ttl=60)
+        assert await c.get("a") == b"aaaa"
+        await c.set("c", b"cccc", ttl=60)
+        assert await c.get("b") is None, "最久未使用的条目应被淘汰"
+        assert await c.get("a") == b"aaaa" and await c.get("c") == b"cccc"
+        await c.set("a", b"aa", ttl=60)
+        assert c.stats()["bytes"] == 6, "覆盖写入应扣除旧值大小"
+        await c.set("big", b"x" * 11, ttl=60)
+        assert await c.get("big") is None and c.stats()["entries"] == 2
+
+    asyncio.run(run())
+
+
+def test_disk_cache_shared_dir(tmp_path):
+    import os
+
+    # 两个实例共用一个目录，模拟多个 worker 进程
+    c1 = cache.DiskCache(str(tmp_path), max_bytes=10, rescan_interval=0)
+    c2 = cache.DiskCache(str(tmp_path), max_bytes=10, rescan_interval=0)
+
+    def fill(data):
+        return lambda fp: fp.write(data)
+
+    a = c1.get_or_fill("a", fill(b"aaaa"))
+    assert c2.get_or_fill("a", fill(b"xxxx")) == a, "应复用其他进程写入的文件"
+    assert open(a, "rb").read() == b"aaaa"
+    os.utime(a, (1, 1))  # a 最久未使用
+    c2.get_or_fill("b", fill(b"bbbb"))
+    c1.get_or_fill("c", fill(b"cccc"))
+    assert not os.path.exists(a), "按目录的总大小淘汰"
+    assert c1.stats()["bytes"] == 8 and c1.stats()["evictions"] == 1
+    # c2 的索引里仍有 a，淘汰时文件已不存在，不重复计数
+    c2.rescan_interval = 3600
+    c2.get_or_fill("d", fill(b"dddddddd"))
+    assert c2.stats()["evictions"] == 1 and c2.stats()["bytes"] == 8
+    assert c2.get("a") is None
+
+
+def test_disk_cache_startup_size(tmp_path):
+    import os
+
+    c = cache.DiskCache(str(tmp_path), max_bytes=1024)
+    c.get_or_fill("a", lambda fp: fp.write(b"aaaa"))
+    stale = os.path.join(str(tmp_path), "x.1.tmp")
+    fresh = os.path.join(str(tmp_path), "y.2.tmp")
+    for path in (stale, fresh):
+        with open(path, "wb") as fp:
+            fp.write(b"partial")
+    os.utime(stale, (1, 1))
+    stats = cache.DiskCache(str(tmp_path), max_bytes=1024).stats()
+    assert stats["files"] == 1 and stats["bytes"] == 4, "临时文件不计入大小"
+    assert not os.path.exists(stale), "过期的临时文件应被清理"
+    assert os.path.exists(fresh), "其他进程可能正在写入"
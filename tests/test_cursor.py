@@ -0,0 +1,59 @@
+import pytest
+from src import utils
+
+
+def test_cursor_roundtrip():
+    cursor = utils.encode_cursor("-created", "2024-06-01T12:00:00", 42)
+    assert "=" not in cursor
+    assert utils.decode_cursor(cursor) == ["-created", "2024-06-01T12:00:00", 42]
+
+
+def test_cursor_invalid():
+    with pytest.raises(ValueError):
+        utils.decode_cursor("not a cursor")
+    with pytest.raises(ValueError):
+        utils.decode_cursor("e30")  # {}
+
+
+def test_posts_cursor_pages(client, login):
+    headers = login("cursor-user")
+    for i in range(3):
+        r = client.put(
+            "/api/posts/create", json={"title": f"p{i}", "status": 1}, headers=headers
+        )
+        assert r.status_code == 200, r.text
+    seen, cursor = [], ""
+    while cursor is not None:
+        r = client.get(
+            "/api/posts/all", params={"cursor": cursor, "limit": 2, "sort": "id"}
+        )
+        assert r.status_code == 200, r.text
+        seen += [p["id"] for p in r.json()["data"]]
+        cursor = r.json().get("cursor")
+    assert seen == sorted(seen) and len(seen) == len(set(seen)) >= 3
+
+
+@pytest.mark.parametrize("limit", [0, -1, 101, 10**9])
+def test_posts_limit_out_of_range(client, limit):
+    r = client.get("/api/posts/all", params={"cursor": "", "limit": limit})
+    assert r.status_code == 422
+
+
+@pytest.mark.parametrize(
+    "sort, values",
+    [
+        ("created", ["created", 123, 1]),
+        ("created", ["created", "2024-06-01T12:00:00", "1"]),
+        ("created", ["created", "2024-06-01T12:00:00", True]),
+        ("-updated", ["-updated", None, 1]),
+        ("id", ["id", "1", 1]),
+        ("id", ["id", 1.5, 1]),
+        ("title", ["title", 1, 1]),
+        ("id", ["id", 1]),
+        ("id", ["-id", 1, 1]),
+    ],
+)
+def test_posts_forged_cursor(client, sort, values):
+    cursor = utils.encode_cursor(*values)
+    r = client.get("/api/posts/all", params={"cursor": cursor, "sort": sort})
+    assert r.status_code == 400, r.text
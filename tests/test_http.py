@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+from src import utils
+
+
+def test_if_none_match():
+    etag = utils.make_etag(1, "2024-06-01T12:00:00")
+    assert utils.is_not_modified({"if-none-match": etag}, etag)
+    assert utils.is_not_modified({"if-none-match": f'"x", W/{etag}'}, etag)
+    assert utils.is_not_modified({"if-none-match": "*"}, etag)
+    assert not utils.is_not_modified({"if-none-match": '"x"'}, etag)
+    assert not utils.is_not_modified({}, etag)
+
+
+def test_if_modified_since():
+    modified = datetime(2024, 6, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)
+    since = utils.http_date(modified)
+    assert since == "Sat, 01 Jun 2024 12:00:00 GMT"
+    assert utils.is_not_modified({"if-modified-since": since}, '"x"', modified)
+    assert not utils.is_not_modified(
+        {"if-modified-since": "Fri, 31 May 2024 12:00:00 GMT"}, '"x"', modified
+    )
+    assert not utils.is_not_modified({"if-modified-since": "garbage"}, '"x"', modified)
+    naive = "Sat, 01 Jun 2024 12:00:00 -0000"
+    assert utils.is_not_modified({"if-modified-since": naive}, '"x"', modified)
+
+
+def test_parse_range():
+    assert utils.parse_range(None) is None
+    assert utils.parse_range("bytes=0-99") == "bytes=0-99"
+    assert utils.parse_range("bytes=100-") == "bytes=100-"
+    assert utils.parse_range("bytes=-100") == "bytes=-100"
+    assert utils.parse_range("bytes=0-1,5-9") is None
+    assert utils.parse_range("bytes=9-1") is None
+    assert utils.parse_range("items=0-1") is None
+    assert utils.parse_range("bytes=-") is None
+
+
+def test_resolve_range():
+    assert utils.resolve_range("bytes=0-99", 50) == (0, 49)
+    assert utils.resolve_range("bytes=10-", 50) == (10, 49)
+    assert utils.resolve_range("bytes=-10", 50) == (40, 49)
+    assert utils.resolve_range("bytes=-100", 50) == (0, 49)
+    assert utils.resolve_range("bytes=50-", 50) is None
+    assert utils.resolve_range("bytes=-0", 50) is None
@@ -0,0 +1,125 @@
+import io
+import os
+import time
+
+import pytest
+
+
+def _png() -> bytes:
+    Image = pytest.importorskip("PIL.Image")
+
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 48), (200, 80, 40)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def test_handlers_registered(client):
+    import jobs
+
+    assert "recipe_cover" in jobs.handlers
+
+
+def test_recipe_cover_job_runs(client, login):
+    from database.models import JOB_DONE, JOB_PENDING, JOB_RUNNING
+
+    alice = login("job-alice")
+    r = client.put("/api/recipe/create", json={"name": "r"}, headers=alice)
+    rid = r.json()["data"]["id"]
+    data = _png()
+    r = client.post(
+        "/api/recipe/cover",
+        params={"recipe_id": rid},
+        files={"file": ("cover.png", data, "image/png")},
+        headers=alice,
+    )
+    assert r.status_code == 202, r.text
+    jid = r.json()["data"]["id"]
+
+    # 任务由 lifespan 启动的 worker 执行，轮询直到完成
+    deadline = time.monotonic() + 10
+    while True:
+        job = client.get(f"/api/jobs/{jid}", headers=alice).json()["data"]
+        if job["status"] not in (JOB_PENDING, JOB_RUNNING) or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert job["status"] == JOB_DONE, job
+    assert job["result"]["uploaded"] is True
+
+    r = client.get("/api/recipe/cover", params={"recipe_id": rid}, headers=alice)
+    assert r.status_code == 200
+    assert r.content == data
+    assert client.get(
+        "/api/recipe/item", params={"recipe_id": rid}, headers=alice
+    ).json()["data"]["cover"] == job["result"]["cover"]
+
+
+def _wait_job(client, jid: int, timeout: float = 10):
+    from sqlmodel import Session
+    from database import engine
+    from database.models import JOB_PENDING, JOB_RUNNING, Jobs
+
+    deadline = time.monotonic() + timeout
+    while True:
+        with Session(engine) as db:
+            job = db.get(Jobs, jid)
+        if job.status not in (JOB_PENDING, JOB_RUNNING) or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+
+def test_failed_job_cleans_up(client, monkeypatch, tmp_path):
+    import jobs
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    from database import async_engine
+    from database.models import JOB_FAILED
+
+    def fail(payload: dict):
+        raise OSError("storage unavailable")
+
+    staged = tmp_path / "staged.upload"
+    staged.write_bytes(b"x")
+    monkeypatch.setattr(jobs.settings, "job_max_attempts", 1)
+    monkeypatch.setitem(jobs.handlers, "test_fail", fail)
+    monkeypatch.setitem(
+        jobs.failure_handlers, "test_fail", jobs.failure_handlers["recipe_cover"]
+    )
+
+    async def enqueue():
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            job = await jobs.job_queue.enqueue(
+                db, "test_fail", {"path": str(staged)}, local=True
+            )
+            return job.id, job.host
+
+    jid, host = client.portal.call(enqueue)
+    assert host == jobs.settings.job_host
+    job = _wait_job(client, jid)
+    assert job.status == JOB_FAILED and "storage unavailable" in job.error
+    assert not staged.exists()
+
+
+def test_recover_only_claims_local_jobs(client):
+    import jobs
+    from sqlmodel import Session, delete
+    from database import engine
+    from database.models import Jobs
+
+    with Session(engine) as db:
+        rows = [
+            Jobs(kind="noop", host="some-other-host"),
+            Jobs(kind="noop", host=jobs.settings.job_host),
+            Jobs(kind="noop"),
+        ]
+        db.add_all(rows)
+        db.commit()
+        ids = [row.id for row in rows]
+    queue = jobs.JobQueue()
+    client.portal.call(queue.recover)
+    queued = set()
+    while not queue.queue.empty():
+        queued.add(queue.queue.get_nowait())
+    assert ids[0] not in queued
+    assert {ids[1], ids[2]} <= queued
+    with Session(engine) as db:
+        db.exec(delete(Jobs).where(Jobs.id.in_(ids)))  # type: ignore
+        db.commit()
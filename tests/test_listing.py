@@ -0,0 +1,124 @@
+import io
+import time
+
+import pytest
+
+
+def _fake_bucket(keys: list[str], page_size: int = 2, fail: str | None = None):
+    """按 COS list_objects 的分页和 Delimiter 语义列出内存中的 key"""
+
+    def list_page(prefix: str, marker: str, delimiter: str = "") -> dict:
+        if fail is not None and prefix.startswith(fail):
+            raise RuntimeError(f"list {prefix} failed")
+        entries = set()
+        for key in keys:
+            if not key.startswith(prefix):
+                continue
+            rest = key[len(prefix):]
+            if delimiter and delimiter in rest:
+                entries.add(prefix + rest.split(delimiter)[0] + delimiter)
+            else:
+                entries.add(key)
+        entries = sorted(e for e in entries if e > marker)
+        page = entries[:page_size]
+        res = {
+            "Contents": [
+                {"Key": k, "Size": str(len(k)), "ETag": '"e"', "LastModified": "t"}
+                for k in page
+                if k in keys
+            ],
+            "CommonPrefixes": [{"Prefix": p} for p in page if p not in keys],
+            "IsTruncated": "true" if len(entries) > page_size else "false",
+        }
+        if page:
+            res["NextMarker"] = page[-1]
+        return res
+
+    return list_page
+
+
+@pytest.fixture
+def cos(monkeypatch):
+    from config import get_settings
+
+    # 模块导入时创建 COS 客户端需要这些配置，测试只替换列表请求，不会访问 COS
+    settings = get_settings()
+    monkeypatch.setattr(settings, "cos_region", "ap-guangzhou")
+    monkeypatch.setattr(settings, "cos_secret_id", "test")
+    monkeypatch.setattr(settings, "cos_secret_key", "test")
+    from api import cos
+
+    return cos
+
+
+KEYS = [f"root/{d}/{i:02d}.png" for d in "abcd" for i in range(5)] + [
+    "root/top.txt",
+    "root/z.txt",
+]
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_file_list_v2_lists_everything(cos, monkeypatch, concurrency):
+    monkeypatch.setattr(cos, "_list_page", _fake_bucket(KEYS))
+    objs = list(cos.get_file_list_v2("root/", concurrency=concurrency))
+    assert sorted(o.key for o in objs) == sorted(KEYS)
+    assert all(o.size == len(o.key) for o in objs)
+
+
+def test_file_list_v2_error_and_early_close(cos, monkeypatch):
+    monkeypatch.setattr(cos, "_list_page", _fake_bucket(KEYS, fail="root/c/"))
+    with pytest.raises(RuntimeError):
+        list(cos.get_file_list_v2("root/", concurrency=4))
+
+    monkeypatch.setattr(cos, "_list_page", _fake_bucket(KEYS * 50, page_size=1))
+    gen = cos.get_file_list_v2("root/", concurrency=2)
+    next(gen)
+    gen.close()  # 工作线程应随之退出，不会阻塞在已满的队列上
+
+
+def test_inventory_snapshot(monkeypatch, tmp_path):
+    from api import inventory
+    from api.storage import get_storage
+
+    storage = get_storage()
+    files = {
+        "inv/a/1.txt": b"1",
+        "inv/a/2.txt": b"22",
+        "inv/b/c/3.txt": b"333",
+        "inv/top.txt": b"4444",
+        "inv0/other.txt": b"x",
+    }
+    for key, data in files.items():
+        storage.put(key, io.BytesIO(data), len(data))
+    monkeypatch.setattr(inventory.settings, "cos_inventory_dir", str(tmp_path))
+
+    inv = inventory.get_inventory("inv/")
+    try:
+        assert [o.key for o in inv.list("inv/")] == sorted(
+            k for k in files if k.startswith("inv/")
+        )
+        assert [o.key for o in inv.list("inv/a/")] == ["inv/a/1.txt", "inv/a/2.txt"]
+        assert inv.total("inv/") == (4, 10)
+        assert inv.sizes("inv/") == {
+            "inv/a/": (2, 3),
+            "inv/b/": (1, 3),
+            "inv/top.txt": (1, 4),
+        }
+        created = inv.created
+    finally:
+        inv.close()
+
+    # 未过期时复用快照，不会计入之后新增的文件
+    storage.put("inv/new.txt", io.BytesIO(b"5"), 1)
+    inv = inventory.get_inventory("inv/")
+    try:
+        assert inv.created == created and inv.total("inv/") == (4, 10)
+    finally:
+        inv.close()
+    time.sleep(0.01)
+    inv = inventory.get_inventory("inv/", max_age=0)
+    try:
+        assert inv.created > created and inv.total("inv/") == (5, 11)
+    finally:
+        inv.close()
+    assert not (tmp_path / "inv.sqlite.tmp").exists()
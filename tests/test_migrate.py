@@ -0,0 +1,45 @@
+import pytest
+
+
+@pytest.fixture
+def legacy_engine():
+    from sqlalchemy import create_engine
+
+    engine = create_engine("sqlite://")
+    yield engine
+    engine.dispose()
+
+
+def test_token_hash_fresh_database(legacy_engine):
+    from sqlalchemy import inspect
+    from tools.migrate import migrate_token_hash
+
+    # 全新数据库还没有 tokens 表，迁移应直接跳过
+    with legacy_engine.begin() as conn:
+        migrate_token_hash(conn)
+    assert not inspect(legacy_engine).has_table("tokens")
+
+
+def test_token_hash_plaintext_tokens(legacy_engine):
+    from sqlalchemy import inspect, text
+    from auth import hash_token
+    from tools.migrate import migrate_token_hash
+
+    tokens = ["header.payload-a.sig", "header.payload-b.sig"]
+    with legacy_engine.begin() as conn:
+        conn.execute(
+            text("CREATE TABLE tokens (id INTEGER PRIMARY KEY, token VARCHAR, uid INTEGER)")
+        )
+        conn.execute(
+            text("INSERT INTO tokens (id, token, uid) VALUES (:id, :token, 1)"),
+            [{"id": i, "token": t} for i, t in enumerate(tokens, 1)],
+        )
+    for _ in range(2):  # 可以重复执行
+        with legacy_engine.begin() as conn:
+            migrate_token_hash(conn)
+
+    columns = {c["name"] for c in inspect(legacy_engine).get_columns("tokens")}
+    assert "token" not in columns and "token_hash" in columns
+    with legacy_engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, token_hash FROM tokens ORDER BY id")).all()
+    assert [r.token_hash for r in rows] == [hash_token(t) for t in tokens]
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+
+def _settings(tmp_path, **kwargs):
+    from config import Settings
+
+    return Settings(
+        database_url=f"sqlite:///{tmp_path}/pool.sqlite", secret_key="test", **kwargs
+    )
+
+
+def test_pool_options_memory_sqlite(tmp_path):
+    from database.pool import pool_options
+
+    settings = _settings(tmp_path)
+    assert pool_options("sqlite://", settings) == {}
+    assert pool_options("sqlite:///:memory:", settings, is_async=True) == {}
+    assert pool_options(settings.database_url, settings)["pool_size"] == 10
+
+
+def test_pool_stats_histogram():
+    from database.pool import PoolStats
+
+    stats = PoolStats()
+    stats.observe(0.0005)
+    stats.observe(0.003)
+    stats.observe(10, timeout=True)
+    data = stats.to_dict()
+    assert data["checkouts"] == 3 and data["timeouts"] == 1
+    assert data["wait_max_ms"] == 10_000
+    assert data["histogram"]["<=1ms"] == 1
+    assert data["histogram"]["<=5ms"] == 1
+    assert data["histogram"][">5000ms"] == 1
+
+
+def test_pool_status_and_timeout(tmp_path):
+    from sqlalchemy import create_engine, exc
+    from database.pool import pool_options, pool_status
+
+    settings = _settings(tmp_path, db_pool_size=1, db_max_overflow=0, db_pool_timeout=0.1)
+    engine = create_engine(settings.database_url, **pool_options(settings.database_url, settings))
+    try:
+        conn = engine.connect()
+        status = pool_status(engine.pool)
+        assert status["class"] == "InstrumentedQueuePool"
+        assert status["checked_out"] == 1 and status["checkouts"] == 1
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+        conn.close()
+        status = pool_status(engine.pool)
+        assert status["checked_out"] == 0 and status["checked_in"] == 1
+        assert status["timeouts"] == 1
+    finally:
+        engine.dispose()
+
+
+def test_pool_warm_up(tmp_path):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from database import get_async_url
+    from database.pool import pool_options, pool_status, warm_up
+
+    settings = _settings(tmp_path, db_pool_size=3)
+    url = get_async_url(settings.database_url)
+
+    async def run():
+        engine = create_async_engine(url, **pool_options(url, settings, is_async=True))
+        try:
+            await warm_up(engine, 0)
+            assert pool_status(engine.pool)["checked_in"] == 0
+            await warm_up(engine, 3)
+            status = pool_status(engine.pool)
+            assert status["checked_in"] == 3 and status["checked_out"] == 0
+            assert status["class"] == "InstrumentedAsyncQueuePool"
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
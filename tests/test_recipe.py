@@ -0,0 +1,394 @@
+import pytest
+
+from src.utils import encode_cursor
+
+
+def _create_recipe(client, headers, **kwargs) -> int:
+    r = client.put("/api/recipe/create", json={"name": "r", **kwargs}, headers=headers)
+    assert r.status_code == 200, r.text
+    return r.json()["data"]["id"]
+
+
+def _steps(client, headers, rid) -> list[dict]:
+    r = client.get("/api/recipe/steps", params={"recipe_id": rid}, headers=headers)
+    assert r.status_code == 200, r.text
+    return r.json()["data"]
+
+
+def test_bulk_ingredients(client, login):
+    alice, bob = login("ing-alice"), login("ing-bob")
+    rid = _create_recipe(client, alice)
+    other = _create_recipe(client, bob)
+    r = client.put(
+        "/api/recipe/ingredients",
+        params={"recipe_id": rid},
+        json=[{"name": "盐", "quantity": 1}, {"name": "糖", "quantity": "适量"}],
+        headers=alice,
+    )
+    assert r.json()["total"] == 2
+    client.put(
+        "/api/recipe/ingredients",
+        params={"recipe_id": other},
+        json=[{"name": "醋"}],
+        headers=bob,
+    )
+    ings = client.get(
+        "/api/recipe/ingredients", params={"recipe_id": rid}, headers=alice
+    ).json()["data"]
+    assert [i["quantity"] for i in ings] == ["1", "适量"]
+    bob_ing = client.get(
+        "/api/recipe/ingredients", params={"recipe_id": other}, headers=bob
+    ).json()["data"][0]["id"]
+    # 别人的原材料不会被删除，total 为实际删除的条数
+    ids = [i["id"] for i in ings] + [bob_ing, 10**6]
+    r = client.delete(
+        "/api/recipe/ingredients", params={"ingredient_id": ids}, headers=alice
+    )
+    assert r.status_code == 200 and r.json()["total"] == 2
+    left = client.get(
+        "/api/recipe/ingredients", params={"recipe_id": other}, headers=bob
+    ).json()["data"]
+    assert [i["id"] for i in left] == [bob_ing]
+
+
+def test_bulk_steps_and_reorder(client, login):
+    alice, bob = login("step-alice"), login("step-bob")
+    rid = _create_recipe(client, alice)
+    other = _create_recipe(client, bob)
+    r = client.put(
+        "/api/recipe/steps",
+        params={"recipe_id": rid},
+        json=[{"desc": "a"}, {"desc": "b"}, {"desc": "c"}],
+        headers=alice,
+    )
+    assert r.json()["total"] == 3
+    client.put(
+        "/api/recipe/steps",
+        params={"recipe_id": other},
+        json=[{"desc": "x"}],
+        headers=bob,
+    )
+    steps = _steps(client, alice, rid)
+    assert [s["order"] for s in steps] == [1, 2, 3]
+    ids = [s["id"] for s in steps]
+
+    def reorder(step_ids):
+        return client.post(
+            "/api/recipe/steps/order",
+            params={"recipe_id": rid},
+            json={"step_ids": step_ids},
+            headers=alice,
+        )
+
+    assert reorder(ids[::-1]).status_code == 200
+    assert [s["desc"] for s in _steps(client, alice, rid)] == ["c", "b", "a"]
+    # 重复的 id
+    assert reorder([ids[0], ids[0], ids[1]]).status_code == 400
+    # 不存在或属于其他菜谱的 id，整体回滚
+    bob_step = _steps(client, bob, other)[0]["id"]
+    assert reorder([ids[0], ids[1], 10**6]).status_code == 404
+    assert reorder([ids[0], bob_step]).status_code == 404
+    assert [s["desc"] for s in _steps(client, alice, rid)] == ["c", "b", "a"]
+    assert _steps(client, bob, other)[0]["order"] == 1
+
+    r = client.delete(
+        "/api/recipe/steps", params={"step_id": ids[:2] + [bob_step]}, headers=alice
+    )
+    assert r.json()["total"] == 2
+    assert [s["id"] for s in _steps(client, alice, rid)] == [ids[2]]
+    assert [s["id"] for s in _steps(client, bob, other)] == [bob_step]
+
+
+def _create_group(client, headers, name, parent_id=None) -> int:
+    r = client.post(
+        "/api/recipe/group/create",
+        json={"name": name, "parent_id": parent_id},
+        headers=headers,
+    )
+    assert r.status_code == 200 and r.json()["code"] == 200, r.text
+    return r.json()["data"]["id"]
+
+
+def _tree(client, headers, group_id=None) -> list[dict]:
+    params = {"group_id": group_id} if group_id else {}
+    r = client.get("/api/recipe/group/tree", params=params, headers=headers)
+    assert r.status_code == 200, r.text
+    return r.json()["data"]
+
+
+def _shape(nodes: list[dict]) -> dict:
+    return {n["name"]: _shape(n["children"]) for n in nodes}
+
+
+def test_group_subtree_and_move(client, login):
+    alice, bob = login("group-alice"), login("group-bob")
+    a = _create_group(client, alice, "a")
+    b = _create_group(client, alice, "b", a)
+    _create_group(client, alice, "c", b)
+    d = _create_group(client, alice, "d")
+    _create_group(client, bob, "other")
+    assert _shape(_tree(client, alice)) == {"a": {"b": {"c": {}}}, "d": {}}
+    assert _shape(_tree(client, alice, b)) == {"b": {"c": {}}}
+
+    # 移动 b 时整个子树跟着移动
+    r = client.post(
+        "/api/recipe/group/update",
+        params={"group_id": b},
+        json={"parent_id": d},
+        headers=alice,
+    )
+    assert r.json()["data"]["parent_id"] == d
+    assert _shape(_tree(client, alice)) == {"a": {}, "d": {"b": {"c": {}}}}
+    assert _shape(_tree(client, alice, d)) == {"d": {"b": {"c": {}}}}
+    r = client.get(
+        "/api/recipe/group/ancestors",
+        params={"group_id": _tree(client, alice, b)[0]["children"][0]["id"]},
+        headers=alice,
+    )
+    assert [g["name"] for g in r.json()["data"]] == ["d", "b", "c"]
+
+
+def test_group_move_rejects_cycle(client, login):
+    alice = login("cycle-alice")
+    a = _create_group(client, alice, "a")
+    b = _create_group(client, alice, "b", a)
+    c = _create_group(client, alice, "c", b)
+    for target in (a, b, c):
+        r = client.post(
+            "/api/recipe/group/update",
+            params={"group_id": a},
+            json={"parent_id": target},
+            headers=alice,
+        )
+        assert r.json()["code"] != 200
+    assert _shape(_tree(client, alice)) == {"a": {"b": {"c": {}}}}
+
+
+def test_group_path_backfill(client, login):
+    from sqlmodel import Session, text
+    from database import engine
+    from tools.migrate import migrate_recipe_group_path
+
+    alice = login("backfill-alice")
+    uid = client.get("/api/user/info", headers=alice).json()["data"]["id"]
+    # 旧数据只有 parent_id，path 为默认值；99 是环，98 的父分组不存在
+    with Session(engine) as db:
+        db.exec(
+            text(
+                "insert into recipe_groups"
+                " (id, name, created, updated, uid, status, private, parent_id, path)"
+                " values (:id, :name, '2024-01-01', '2024-01-01', :uid, 0, 0, :pid, '/')"
+            ),
+            params=[
+                {"id": 91, "name": "c", "uid": uid, "pid": 92},
+                {"id": 92, "name": "b", "uid": uid, "pid": 93},
+                {"id": 93, "name": "a", "uid": uid, "pid": None},
+                {"id": 98, "name": "orphan", "uid": uid, "pid": 10**6},
+                {"id": 99, "name": "loop", "uid": uid, "pid": 99},
+            ],
+        )
+        db.commit()
+    for _ in range(2):
+        with engine.begin() as conn:
+            migrate_recipe_group_path(conn)
+    with Session(engine) as db:
+        rows = db.exec(
+            text("select id, parent_id, path from recipe_groups where id > 90")
+        ).all()
+    assert {r.id: (r.parent_id, r.path) for r in rows} == {
+        91: (92, "/93/92/91/"),
+        92: (93, "/93/92/"),
+        93: (None, "/93/"),
+        98: (10**6, "/98/"),
+        99: (None, "/99/"),
+    }
+    assert _shape(_tree(client, alice, 92)) == {"b": {"c": {}}}
+
+
+def _detail(client, headers, rid) -> dict:
+    r = client.get("/api/recipe/item", params={"recipe_id": rid}, headers=headers)
+    assert r.status_code == 200, r.text
+    return r.json()["data"]
+
+
+def test_detail_cache_stale_version(client, login):
+    alice = login("cache-alice")
+    gid = _create_group(client, alice, "g")
+    rid = _create_recipe(client, alice, gid=gid)
+    assert _detail(client, alice, rid)["name"] == "r"
+    # 每次修改后旧版本号的缓存都不能再命中
+    client.post(
+        "/api/recipe/update",
+        params={"recipe_id": rid},
+        json={"name": "r2"},
+        headers=alice,
+    )
+    assert _detail(client, alice, rid)["name"] == "r2"
+    client.put(
+        "/api/recipe/ingredients",
+        params={"recipe_id": rid},
+        json=[{"name": "盐"}],
+        headers=alice,
+    )
+    assert [i["name"] for i in _detail(client, alice, rid)["ingredients"]] == ["盐"]
+    client.put(
+        "/api/recipe/steps",
+        params={"recipe_id": rid},
+        json=[{"desc": "a"}, {"desc": "b"}],
+        headers=alice,
+    )
+    steps = _detail(client, alice, rid)["steps"]
+    assert [s["desc"] for s in steps] == ["a", "b"]
+    client.post(
+        "/api/recipe/steps/order",
+        json={"step_ids": [steps[1]["id"], steps[0]["id"]]},
+        params={"recipe_id": rid},
+        headers=alice,
+    )
+    assert [s["desc"] for s in _detail(client, alice, rid)["steps"]] == ["b", "a"]
+    client.delete("/api/recipe/step", params={"step_id": steps[0]["id"]}, headers=alice)
+    assert [s["desc"] for s in _detail(client, alice, rid)["steps"]] == ["b"]
+    client.post(
+        "/api/recipe/group/update",
+        params={"group_id": gid},
+        json={"name": "g2"},
+        headers=alice,
+    )
+    assert _detail(client, alice, rid)["group"] == "g2"
+    client.post("/api/user/update", json={"uname": "cache-alice2"}, headers=alice)
+    assert _detail(client, alice, rid)["username"] == "cache-alice2"
+
+
+def test_migrate_recipe_version():
+    from sqlalchemy import create_engine, inspect, text
+    from tools.migrate import migrate_recipe_version
+
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("create table recipes (id integer primary key, name text)"))
+        conn.execute(text("insert into recipes (id, name) values (1, 'r')"))
+    for _ in range(2):
+        with engine.begin() as conn:
+            migrate_recipe_version(conn)
+    with engine.begin() as conn:
+        assert "version" in {c["name"] for c in inspect(conn).get_columns("recipes")}
+        assert conn.execute(text("select version from recipes")).scalar() == 0
+
+
+def _list(client, headers=None, **params) -> dict:
+    r = client.get("/api/recipe/list", params=params, headers=headers or {})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_list_recipes_filters_and_cursor(client, login):
+    alice, bob = login("list-alice"), login("list-bob")
+    alice_id = client.get("/api/user/info", headers=alice).json()["data"]["id"]
+    gid = _create_group(client, alice, "list")
+    ids = [_create_recipe(client, alice, gid=gid, status=1) for _ in range(5)]
+    hidden = _create_recipe(client, alice, gid=gid, private=True)
+    _create_recipe(client, bob, status=1)
+
+    # 按分组筛选，id 倒序游标分页，有筛选条件时不返回 total
+    seen, cursor = [], None
+    while True:
+        params = {"gid": gid, "limit": 2} | ({"cursor": cursor} if cursor else {})
+        page = _list(client, alice, **params)
+        assert "total" not in page
+        seen += [item["id"] for item in page["data"]]
+        cursor = page.get("cursor")
+        if not cursor:
+            break
+    assert seen == sorted(ids + [hidden], reverse=True)
+    # 别人看不到私有菜谱
+    assert [i["id"] for i in _list(client, bob, gid=gid)["data"]] == ids[::-1]
+    assert [i["id"] for i in _list(client, gid=gid)["data"]] == ids[::-1]
+    mine = _list(client, alice, uid=alice_id, status=1)["data"]
+    assert [i["id"] for i in mine] == ids[::-1]
+    assert all(i["group_id"] == gid for i in mine)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "bad",
+        "e30",  # {}
+        encode_cursor(True),
+        encode_cursor(False),
+        encode_cursor("1"),
+        encode_cursor(1.5),
+        encode_cursor(),
+        encode_cursor(1, 2),
+    ],
+)
+def test_list_recipes_invalid_cursor(client, cursor):
+    r = client.get("/api/recipe/list", params={"cursor": cursor})
+    assert r.status_code == 400, r.text
+
+
+def test_recipe_counts(client, login):
+    from sqlmodel import Session, text
+    from database import engine
+
+    alice, bob = login("count-alice"), login("count-bob")
+    public = _list(client)["total"]
+    mine = _list(client, alice)["total"]
+    a = _create_recipe(client, alice)
+    b = _create_recipe(client, alice, private=True)
+    _create_recipe(client, bob, private=True)
+    assert _list(client)["total"] == public + 1
+    assert _list(client, alice)["total"] == mine + 2
+    assert _list(client, bob)["total"] == public + 2
+
+    # 修改公开状态在两个计数之间移动，删除时减少
+    client.post(
+        "/api/recipe/update",
+        params={"recipe_id": a},
+        json={"private": True},
+        headers=alice,
+    )
+    assert _list(client)["total"] == public
+    assert _list(client, alice)["total"] == mine + 2
+    client.delete("/api/recipe/delete", params={"recipe_id": b}, headers=alice)
+    assert _list(client, alice)["total"] == mine + 1
+
+    # 计数出现偏差时由管理接口修正
+    with Session(engine) as db:
+        db.exec(text("update recipe_counts set count = count + 7 where key = 'public'"))
+        db.exec(text("delete from recipe_counts where key like 'private:%'"))
+        db.commit()
+    r = client.post("/api/user/admin/recipe-counts/reconcile", headers=alice)
+    assert r.status_code == 403
+    admin = login("count-admin", role_id=4)
+    r = client.post("/api/user/admin/recipe-counts/reconcile", headers=admin)
+    assert r.status_code == 200, r.text
+    assert r.json()["data"]["public"] == public
+    assert _list(client)["total"] == public
+    assert _list(client, alice)["total"] == mine + 1
+    assert _list(client, bob)["total"] == public + 1
+    r = client.post("/api/user/admin/recipe-counts/reconcile", headers=admin)
+    assert r.json()["data"] == {}
+
+
+def test_seed_recipe_counts(client, login):
+    from sqlmodel import Session, text
+    from database import engine
+    from tools.migrate import seed_recipe_counts
+
+    alice = login("seed-alice")
+    _create_recipe(client, alice, private=True)
+    public = _list(client)["total"]
+    mine = _list(client, alice)["total"]
+    with Session(engine) as db:
+        db.exec(text("delete from recipe_counts"))
+        db.commit()
+    assert _list(client)["total"] == 0
+    for _ in range(2):
+        with engine.begin() as conn:
+            seed_recipe_counts(conn)
+    assert _list(client)["total"] == public
+    assert _list(client, alice)["total"] == mine
+    # 迁移之后新用户的第一条私有菜谱插入计数记录
+    bob = login("seed-bob")
+    _create_recipe(client, bob, private=True)
+    assert _list(client, bob)["total"] == public + 1
@@ -0,0 +1,94 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+
+@pytest.fixture
+def storage(tmp_path):
+    from api.storage import LocalStorage
+
+    return LocalStorage(str(tmp_path / "storage"))
+
+
+def _put(storage, key: str, data: bytes):
+    storage.put(key, io.BytesIO(data), len(data), "text/plain")
+
+
+def test_local_put_and_read(storage):
+    fp = io.BytesIO(b"skip:hello")
+    fp.seek(5)
+    storage.put("a/b.txt", fp, 5)
+    assert storage.read_bytes("a/b.txt") == b"hello", "从文件对象的当前位置开始写入"
+    info = storage.head("a/b.txt")
+    assert info is not None and info.size == 5
+    assert storage.head("a/missing.txt") is None
+    assert storage.presign_get("a/b.txt") is None
+    assert storage.presign_put("a/b.txt") is None
+    names = os.listdir(os.path.dirname(storage.local_path("a/b.txt")))
+    assert names == ["b.txt"], "临时文件应已替换为目标文件"
+
+
+@pytest.mark.parametrize(
+    "byte_range, body, content_range",
+    [
+        (None, b"0123456789", None),
+        ("bytes=2-4", b"234", "bytes 2-4/10"),
+        ("bytes=7-", b"789", "bytes 7-9/10"),
+        ("bytes=-3", b"789", "bytes 7-9/10"),
+        ("bytes=8-100", b"89", "bytes 8-9/10"),
+    ],
+)
+def test_local_range(storage, byte_range, body, content_range):
+    _put(storage, "r.bin", b"0123456789")
+    stream = storage.get_stream("r.bin", byte_range)
+    assert b"".join(stream.body) == body
+    assert stream.content_length == len(body)
+    assert stream.content_range == content_range
+    assert stream.etag == storage.head("r.bin").etag
+
+
+def test_local_missing_and_unsatisfiable(storage):
+    from api.storage import RangeNotSatisfiable
+
+    _put(storage, "r.bin", b"0123456789")
+    with pytest.raises(RangeNotSatisfiable) as e:
+        storage.get_stream("r.bin", "bytes=10-")
+    assert e.value.size == 10
+    with pytest.raises(FileNotFoundError):
+        storage.get_stream("nope.bin")
+    with pytest.raises(FileNotFoundError):
+        storage.local_path("nope.bin")
+
+
+@pytest.mark.parametrize("key", ["../escape.txt", "a/../../escape.txt"])
+def test_local_rejects_escape(storage, key):
+    with pytest.raises(ValueError):
+        _put(storage, key, b"x")
+
+
+def test_local_list_and_delete(storage):
+    for key in ("img/a.png", "img/sub/b.png", "img/ab.png", "imgx/c.png"):
+        _put(storage, key, key.encode())
+    # 未完成的写入不出现在列表里
+    open(storage.local_path("img/a.png") + ".1.tmp", "wb").close()
+    keys = [o.key for o in storage.list("img/")]
+    assert keys == ["img/a.png", "img/ab.png", "img/sub/b.png"]
+    assert [o.key for o in storage.list("img/a")] == ["img/a.png", "img/ab.png"]
+    assert all(o.size == len(o.key) for o in storage.list("img/"))
+    storage.delete("img/a.png")
+    storage.delete("img/a.png")  # 重复删除不报错
+    assert storage.head("img/a.png") is None
+
+
+def test_stage_upload(tmp_path):
+    from api.storage import stage_upload
+
+    data = os.urandom(3000)
+    fp = io.BytesIO(data)
+    fp.seek(100)  # 总是从头读取
+    path, md5, size = stage_upload(fp, str(tmp_path / "staging"), chunk_size=1024)
+    assert size == 3000 and md5 == hashlib.md5(data).hexdigest()
+    with open(path, "rb") as f:
+        assert f.read() == data
@@ -0,0 +1,53 @@
+import asyncio
+from src import throttle
+
+
+def test_backoff_delay():
+    b = throttle.Backoff(free=2, base=1, max=10)
+    assert [b.delay(n) for n in range(1, 8)] == [0, 0, 1, 2, 4, 8, 10]
+
+
+def test_memory_token_bucket():
+    t = throttle.MemoryThrottle(throttle.Backoff(3, 1, 60))
+    buckets = {"ip:1": throttle.Limit(rate=0.001, burst=2)}
+
+    async def run():
+        return [await t.check(buckets) for _ in range(3)]
+
+    waits = asyncio.run(run())
+    assert waits[:2] == [0, 0]
+    assert waits[2] > 0, "桶里的令牌用完后应该拒绝"
+    assert t.stats()["rejected"] == 1
+
+
+def test_memory_failure_backoff():
+    t = throttle.MemoryThrottle(throttle.Backoff(1, 30, 60))
+    buckets = {"user:bob": throttle.Limit(rate=100, burst=100)}
+
+    async def run():
+        await t.failure("user:bob")
+        first = await t.check(buckets)
+        await t.failure("user:bob")
+        blocked = await t.check(buckets)
+        await t.success("user:bob")
+        return first, blocked, await t.check(buckets)
+
+    first, blocked, after = asyncio.run(run())
+    assert first == 0
+    assert 29 < blocked <= 30
+    assert after == 0
+
+
+def test_memory_failure_decay():
+    t = throttle.MemoryThrottle(throttle.Backoff(1, 0.01, 0.05))
+    buckets = {"ip:1": throttle.Limit(rate=100, burst=100)}
+
+    async def run():
+        await t.failure("ip:1")
+        await t.failure("ip:1")
+        # 超过 2 * max 秒没有失败，失败次数重新计算
+        await asyncio.sleep(0.15)
+        await t.failure("ip:1")
+        return await t.check(buckets)
+
+    assert asyncio.run(run()) == 0
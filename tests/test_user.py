@@ -0,0 +1,16 @@
+def test_login_duplicate_names(client):
+    for passwd in ("first", "second"):
+        r = client.post("/api/user/create", json={"name": "twin", "passwd": passwd})
+        assert r.status_code == 200, r.text
+    ids = set()
+    for passwd in ("first", "second"):
+        r = client.post("/api/user/login", json={"name": "twin", "passwd": passwd})
+        assert r.status_code == 200, r.text
+        info = client.get(
+            "/api/user/info",
+            headers={"Authorization": "Bearer " + r.json()["data"]["token"]},
+        )
+        ids.add(info.json()["data"]["id"])
+    assert len(ids) == 2, "同名用户应登录到各自的账号"
+    r = client.post("/api/user/login", json={"name": "twin", "passwd": "wrong"})
+    assert r.status_code == 401
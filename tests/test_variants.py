@@ -0,0 +1,76 @@
+import io
+
+import pytest
+
+
+@pytest.fixture
+def widths(monkeypatch):
+    from api import variants
+
+    monkeypatch.setattr(variants.settings, "cover_variant_widths", [320, 160, 640])
+    monkeypatch.setattr(variants.settings, "cover_variant_formats", ["webp", "jpeg"])
+
+
+@pytest.mark.parametrize(
+    "width, expected", [(1, 160), (160, 160), (161, 320), (640, 640), (5000, 640)]
+)
+def test_normalize_width(widths, width, expected):
+    from api import variants
+
+    assert variants.normalize_width(width) == expected
+
+
+def test_variant_key():
+    from api import variants
+
+    assert variants.variant_key("cover/abc.png", 320, "webp") == "cover/abc_w320.webp"
+
+
+def _image(mode: str, size: tuple[int, int]) -> bytes:
+    Image = pytest.importorskip("PIL.Image")
+
+    buf = io.BytesIO()
+    Image.new(mode, size).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def _size(data: bytes) -> tuple[int, int]:
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        return img.size
+
+
+def test_render_keeps_aspect_ratio():
+    from api import variants
+
+    data = _image("RGBA", (800, 400))
+    assert _size(variants.render(data, 320, "jpeg")) == (320, 160)
+    # 只缩小不放大
+    assert _size(variants.render(data, 1000, "webp")) == (800, 400)
+
+
+def test_generate_and_ensure_variants(widths):
+    from api import variants
+    from api.storage import get_storage
+
+    storage = get_storage()
+    data = _image("RGB", (500, 250))
+    cos_path = "cover/test-variants.png"
+    storage.put(cos_path, io.BytesIO(data), len(data), "image/png")
+
+    variants.generate_variants(cos_path)
+    for w in (160, 320, 640):
+        for fmt in ("webp", "jpeg"):
+            key = variants.variant_key(cos_path, w, fmt)
+            assert _size(storage.read_bytes(key)) == (min(w, 500), min(w, 500) // 2)
+
+    # 请求时补生成缺失的缩略图
+    key = variants.variant_key(cos_path, 160, "png")
+    assert storage.head(key) is None
+    assert variants.ensure_variant(cos_path, 160, "png") == key
+    assert _size(storage.read_bytes(key)) == (160, 80)
+    # 存在性已缓存，之后的请求不再查询存储
+    storage.delete(key)
+    assert variants.ensure_variant(cos_path, 160, "png") == key
+    assert storage.head(key) is None